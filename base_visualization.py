@@ -1,18 +1,64 @@
 import os
+import traceback
+from contextlib import nullcontext
+from paraview import simple
+from trame.app import get_server
+import state_compiler
+from timestep_cache import CachedTimesteps
+from range_index import RangeSelection
 
 class BaseVisualization:
+    # trame state keys owned by this visualization. They are saved when the
+    # visualization is switched away from and restored when it comes back.
+    state_keys = ("time_value",)
+    # trame state key -> name of the method that applies its value to the pipeline.
+    appliers = {"time_value": "apply_time"}
+    # Rebuild the pipeline from the compiled state (see state_compiler.py)
+    # instead of LoadState-ing the whole .pvsm.
+    use_compiled_state = True
+    # Shared TimestepCache put in front of the reader (set by main.py, None disables it).
+    timestep_cache = None
+    # Shared RenderScheduler (set by main.py). Without one, changes render immediately.
+    render_scheduler = None
+    # Point budget of the decimated pipeline used while a control is dragged (0 disables it),
+    # and the quality / resolution ratio of the remote image meanwhile.
+    lod_points = 200_000
+    interactive_quality = 50
+    interactive_ratio = 0.5
+    # Serve threshold ranges from a sorted index of each timestep (see range_index.py)
+    # instead of re-running the range filter.
+    use_range_index = True
+    # Prefer data/<run>.vtkhdf over data/<run>/ when it exists.
+    use_vtkhdf = True
+    # Shared LatencyRecorder (set by main.py when latency is measured, see latency.py).
+    latency = None
+
     def __init__(self, statefile, datapath, trame_state):
-        
+
         if type(self) == BaseVisualization:
             raise NotImplementedError("BaseVisualization is an abstract class. Please implement your own concrete visualization using this class")
         self.statepath = os.path.abspath(os.path.join("state_files", statefile))
         self.datapath = os.path.abspath(os.path.join("data", datapath))
+        # A run packed into one file by utils/vtu_to_vtkhdf.py is read instead of
+        # the folder of .vtu files. LoadState still needs the folder.
+        self.datadir = self.datapath
+        if self.use_vtkhdf and os.path.isfile(self.datapath + ".vtkhdf"):
+            self.datapath += ".vtkhdf"
         self.view = None
         self.scene = None
         self.sources = {}
         self.filters = {}
         self.time_steps = []
         self.trame_state = trame_state
+        self.active = False
+        self.saved_state = {}
+        self.cached_timesteps = None
+        self.lod_links = []
+        self.range_selection = None
+
+    @property
+    def loaded(self):
+        return self.view is not None
 
     def load(self):
         raise NotImplementedError("You must define your own load() function in your subclass")
@@ -21,7 +67,194 @@ class BaseVisualization:
         raise NotImplementedError("You must define your own render_widgets() function in your subclass")
 
     def register_callbacks(self):
-        raise NotImplementedError("You must define your own register_callbacks() function in your subclass")
+        """Route every key in appliers through the render scheduler."""
+        def make_callback(key):
+            def callback(**kwargs):
+                if self.latency is not None:
+                    self.latency.request(key)
+                self.request_update(key, kwargs[key])
+            return callback
+
+        for key in self.appliers:
+            self.on_change(key)(make_callback(key))
+
+    def apply(self, key, value):
+        getattr(self, self.appliers[key])(value)
+
+    def request_update(self, key, value):
+        if self.render_scheduler is not None:
+            self.render_scheduler.request(self, key, value)
+        else:
+            self.update_view([(key, value)], get_server().controller.view_update)
+
+    def timed(self, stage):
+        return self.latency.stage(stage) if self.latency is not None else nullcontext()
+
+    def update_view(self, changes, push):
+        """Apply (key, value) changes, then update, render and push the view if it is on screen."""
+        keys = [key for key, _ in changes]
+        with self.latency.interaction(self, keys) if self.latency is not None else nullcontext():
+            for key, value in changes:
+                with self.timed("apply"):
+                    self.apply(key, value)
+            if self.active:
+                # Run the pipeline on its own so its time is not counted as rendering.
+                with self.timed("update"):
+                    self.view.Update()
+                with self.timed("render"):
+                    self.view.StillRender()
+                with self.timed("push"):
+                    push()
+
+    def apply_time(self, time_value):
+        self.set_time(time_value)
+
+    def add_lod(self, consumers):
+        """
+        Put a MaskPoints next to the common input of consumers. While a control
+        is dragged they read from it instead, so an update costs the same
+        however large the frame is.
+        """
+        if not self.lod_points or not consumers:
+            return
+        mask = simple.MaskPoints(registrationName=f"{type(self).__name__}-lod", Input=consumers[0].Input)
+        mask.OnRatio = 1
+        mask.MaximumNumberofPoints = self.lod_points
+        mask.RandomSampling = 1
+        mask.GenerateVertices = 1
+        mask.SingleVertexPerCell = 1
+        self.filters["lod"] = mask
+        self.lod_links = [(consumer, consumer.Input) for consumer in consumers]
+
+    def add_range_index(self, range_filter, scalar, lower, upper, clip=None, source=None, extra_filters=()):
+        """
+        Replace range_filter (and clip after it, if given) by a RangeSelection
+        over its input, showing lower..upper. Returns False when the range index
+        is turned off, the filters then stay in use.
+        """
+        if not self.use_range_index:
+            return False
+        self.range_selection = RangeSelection(range_filter, scalar, self.view, self.sources,
+                                              clip=clip, source=source, extra_filters=extra_filters)
+        self.range_selection.show(self.scene.AnimationTime, lower, upper)
+        return True
+
+    def update_range(self, lower=None, upper=None, origin=None):
+        if self.range_selection is not None:
+            self.range_selection.show(lower=lower, upper=upper, origin=origin)
+
+    def interaction_events(self):
+        """Slider events flagging a drag, so apply_interacting can lower the detail meanwhile."""
+        if not self.lod_links and not (self.lod_points and self.range_selection is not None):
+            return {}
+        return {"start": "interacting = true", "end": "interacting = false"}
+
+    def apply_interacting(self, interacting):
+        for consumer, full_input in self.lod_links:
+            consumer.Input = self.filters["lod"] if interacting else full_input
+        if self.lod_points and self.range_selection is not None:
+            self.range_selection.show(max_points=self.lod_points if interacting else 0)
+        self.trame_state.view_quality = self.interactive_quality if interacting else 100
+        self.trame_state.view_ratio = self.interactive_ratio if interacting else 1
+
+    def load_state(self):
+        """
+        Load this visualization's state file next to whatever is already loaded.
+        Only the sources and the view created by this state end up in
+        self.sources / self.view, so several visualizations can share a process.
+        """
+        self.view = None
+        sources_before = set(simple.GetSources().keys())
+        views_before = set(simple.GetViews())
+        if self.use_compiled_state:
+            try:
+                description = state_compiler.load_compiled(self.statepath)
+                self.sources, self.view = state_compiler.build_state(description, self.datapath)
+            except Exception:
+                traceback.print_exc()
+                print(f"Could not build {os.path.basename(self.statepath)} from its compiled state, using LoadState")
+                # Drop what the build registered before failing, or LoadState would add a second copy.
+                self.delete_new_proxies(sources_before, views_before)
+                self.view = None
+
+        if self.view is None:
+            simple.LoadState(
+                self.statepath,
+                data_directory=self.datadir,
+                restrict_to_data_directory=True,
+            )
+
+            self.sources = {k: v for k, v in simple.GetSources().items() if k not in sources_before}
+            new_views = [v for v in simple.GetViews() if v not in views_before]
+            self.view = new_views[0] if new_views else simple.GetActiveView()
+
+        self.view.MakeRenderWindowInteractor(True)
+        self.view.GetRenderWindow().SetOffScreenRendering(1)
+
+        self.scene = simple.GetAnimationScene()
+        self.scene.UpdateAnimationUsingDataTimeSteps()
+
+        # Packed .vtkhdf runs have no .vtu reader: their steps are seeks in one file already.
+        reader = self.find_filter("XMLUnstructuredGridReader")
+        if self.timestep_cache is not None and reader is not None:
+            self.cached_timesteps = CachedTimesteps(self.timestep_cache, reader, self.view, self.sources)
+            self.cached_timesteps.show(self.scene.AnimationTime)
+
+    @staticmethod
+    def delete_new_proxies(sources_before, views_before):
+        """Delete the views and pipeline proxies registered since sources_before / views_before were taken."""
+        for view in [v for v in simple.GetViews() if v not in views_before]:
+            simple.Delete(view)
+        new = [proxy for key, proxy in simple.GetSources().items() if key not in sources_before]
+        while new:
+            # Consumers before their inputs
+            inputs = set()
+            for proxy in new:
+                if "Input" in proxy.ListProperties():
+                    values = proxy.Input if isinstance(proxy.Input, list) else [proxy.Input]
+                    inputs.update(v.SMProxy for v in values if v is not None)
+            leaves = [proxy for proxy in new if proxy.SMProxy not in inputs] or new
+            for proxy in leaves:
+                simple.Delete(proxy)
+                new.remove(proxy)
+
+    def set_time(self, time_value):
+        """Move the pipeline to time_value, through the timestep cache if there is one."""
+        self.scene.AnimationTime = time_value
+        if self.cached_timesteps is not None:
+            with self.timed("read"):
+                self.cached_timesteps.show(time_value)
+            self.trame_state.timestep_cache_stats = self.timestep_cache.describe()
+        if self.range_selection is not None:
+            with self.timed("read"):
+                self.range_selection.show(time_value)
+
+    def on_change(self, *keys):
+        """
+        Same as trame_state.change, but the callback only runs while this
+        visualization is the one on screen. The state keys are shared between
+        visualizations, so the others must not react to them.
+        """
+        def decorator(func):
+            @self.trame_state.change(*keys)
+            def guarded(**kwargs):
+                if self.active:
+                    func(**kwargs)
+            return func
+        return decorator
+
+    def activate(self):
+        """Restore the trame state this visualization had when it was switched away from."""
+        if self.saved_state:
+            self.trame_state.update(self.saved_state)
+            # The animation time is global to the session, put ours back.
+            if "time_value" in self.saved_state and self.scene is not None:
+                self.set_time(self.saved_state["time_value"])
+        self.active = True
+
+    def deactivate(self):
+        self.saved_state = {key: self.trame_state[key] for key in self.state_keys if self.trame_state.has(key)}
+        self.active = False
 
     def find_filter(self, type_name):
         for proxy in self.sources.values():
@@ -42,5 +275,3 @@ class BaseVisualization:
             return list(self.scene.TimeKeeper.TimestepValues)
 
         return []
-
-    
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Headless batch rendering of a visualization over a range of timesteps.
+
+Every worker process loads the state once, applies the parameters through
+the visualization's appliers (the same code the sliders use), then renders
+its share of the timesteps to run.NNNN.png. Run it with pvpython from the
+repository root, then turn the frames into a video with utils/png_to_video.py.
+
+    pvpython batch_render.py IsoVolumeState renders/iso --set min_threshold=40 color_map='"Viridis (matplotlib)"'
+    pvpython batch_render.py ClusteredState renders/clusters --steps 0 60 --resolution 3840 2160 --workers 8
+    pvpython batch_render.py GlyphState renders/glyphs --params glyph_params.json
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+# Class name -> (module, state file, data folder), as wired up in main.py
+VISUALIZATIONS = {
+    "IsoVolumeState": ("isovolumestate", "isostate.pvsm", "run01"),
+    "GlyphState": ("glyphstate", "glyphstate.pvsm", "run01"),
+    "ClusteredState": ("cluster_iso_state", "clustering_DBSCAN.pvsm", "run01_DBSCAN"),
+}
+CAMERA_KEYS = {
+    "camera_position": "CameraPosition",
+    "camera_focal_point": "CameraFocalPoint",
+    "camera_view_up": "CameraViewUp",
+    "camera_parallel_scale": "CameraParallelScale",
+    "camera_view_angle": "CameraViewAngle",
+}
+
+_viz = None
+_job = None
+
+
+def load_visualization(name):
+    module, statefile, datapath = VISUALIZATIONS[name]
+    cls = getattr(importlib.import_module(module), name)
+    # Decimation is for interactive use only.
+    cls.lod_points = 0
+    viz = cls(statefile, datapath, SimpleNamespace())
+    viz.load()
+    return viz
+
+
+def init_worker(job):
+    global _viz, _job
+    _job = job
+    _viz = load_visualization(job["viz"])
+    for key, value in job["params"].items():
+        if key in CAMERA_KEYS:
+            setattr(_viz.view, CAMERA_KEYS[key], value)
+        else:
+            _viz.apply(key, value)
+
+
+def count_steps():
+    return len(_viz.time_steps)
+
+
+def render_step(index):
+    from paraview import simple
+
+    start = time.perf_counter()
+    _viz.set_time(_viz.time_steps[index])
+    path = os.path.join(_job["output"], f"run.{index:04d}.png")
+    simple.SaveScreenshot(path, _viz.view, ImageResolution=_job["resolution"])
+    return index, time.perf_counter() - start
+
+
+def parse_params(args):
+    params = {}
+    if args.params:
+        with open(args.params) as f:
+            params.update(json.load(f))
+    for item in args.set or []:
+        key, _, value = item.partition("=")
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a visualization headless over a range of timesteps.")
+    parser.add_argument("viz", choices=sorted(VISUALIZATIONS), help="Visualization class to render")
+    parser.add_argument("output", help="Folder for the run.NNNN.png frames")
+    parser.add_argument("--params", help="JSON file of parameters (state keys such as min_threshold, "
+                                         "clip_x_origin, color_map, and camera_position/_focal_point/_view_up)")
+    parser.add_argument("--set", nargs="*", metavar="KEY=VALUE",
+                        help="Parameters on the command line, values parsed as JSON; override --params")
+    parser.add_argument("--steps", type=int, nargs="+", metavar="N",
+                        help="START END [STRIDE] timestep indices, END inclusive (default: all)")
+    parser.add_argument("--resolution", type=int, nargs=2, default=[1920, 1080], metavar=("W", "H"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    params = parse_params(args)
+    module, _, _ = VISUALIZATIONS[args.viz]
+    appliers = getattr(importlib.import_module(module), args.viz).appliers
+    unknown = set(params) - set(appliers) - set(CAMERA_KEYS) - {"time_value", "interacting"}
+    if unknown:
+        parser.error(f"unknown parameter(s) {sorted(unknown)} for {args.viz}; "
+                     f"known: {sorted(set(appliers) - {'time_value', 'interacting'}) + sorted(CAMERA_KEYS)}")
+
+    os.makedirs(args.output, exist_ok=True)
+    job = {"viz": args.viz, "params": params, "resolution": args.resolution,
+           "output": os.path.abspath(args.output)}
+    # State files and data are resolved relative to the repository root.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    start = time.perf_counter()
+    # Spawn, so no worker inherits a half-initialized ParaView session.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=init_worker, initargs=(job,)) as pool:
+        num_steps = pool.submit(count_steps).result()
+        first, last, stride = 0, num_steps - 1, 1
+        if args.steps:
+            first = args.steps[0]
+            if len(args.steps) > 1:
+                last = min(args.steps[1], num_steps - 1)
+            if len(args.steps) > 2:
+                stride = args.steps[2]
+        indices = list(range(first, last + 1, stride))
+        print(f"Rendering {len(indices)} of {num_steps} timesteps of {args.viz} "
+              f"at {args.resolution[0]}x{args.resolution[1]} with {args.workers} worker(s)")
+
+        # Contiguous chunks keep each worker's reads sequential.
+        chunksize = max(1, len(indices) // (4 * args.workers))
+        frame_seconds = 0.0
+        for done, (index, seconds) in enumerate(pool.map(render_step, indices, chunksize=chunksize), 1):
+            frame_seconds += seconds
+            print(f"  run.{index:04d}.png ({seconds:.2f} s) [{done}/{len(indices)}]")
+
+    wall = time.perf_counter() - start
+    print(f"Rendered {len(indices)} frames to {job['output']} in {wall:.1f} s "
+          f"({frame_seconds / max(len(indices), 1):.2f} s per frame per worker, "
+          f"{len(indices) / wall:.2f} frames/s overall)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,23 @@
 from trame.widgets import vuetify3
-from paraview import simple
 import os
-from trame.app import get_server
 from base_visualization import BaseVisualization
+from range_index import filter_range
 
 class ClusteredState(BaseVisualization):
+    state_keys = ("time_value", "min_threshold", "clip_y_origin")
+    appliers = {
+        "time_value": "apply_time",
+        "min_threshold": "apply_min_threshold",
+        "clip_y_origin": "apply_clip_y_origin",
+        "interacting": "apply_interacting",
+    }
 
     def __init__(self, statefile, datapath, trame_state):
         super().__init__(statefile, datapath, trame_state)
 
     def load(self):
-        simple.LoadState(
-            self.statepath,
-            data_directory=self.datapath,
-            restrict_to_data_directory=True,
-        )
-
-        self.view = simple.GetActiveView()
-        self.view.MakeRenderWindowInteractor(True)
-        self.view.GetRenderWindow().SetOffScreenRendering(1)
+        self.load_state()
 
-        self.scene = simple.GetAnimationScene()
-        self.scene.UpdateAnimationUsingDataTimeSteps()
-
-        self.sources = simple.GetSources()
         # Look for the new "Threshold" filter
         self.filters["threshold"] = self.find_filter("Threshold")
 
@@ -44,6 +38,29 @@ class ClusteredState(BaseVisualization):
         clip_origin = list(self.filters["clip"].ClipType.Origin)
         self.trame_state.clip_y_origin = clip_origin[1] if clip_origin else 0.0
 
+        # Both Thresholds, their GroupDatasets and the Clip are replaced by slices of
+        # a sorted index of Tracked_Labels (see range_index.py). Without the index,
+        # decimate the Threshold inputs while a slider is dragged.
+        thresholds = [p for p in self.sources.values() if p.GetXMLName() == "Threshold"]
+        others = [p for p in thresholds if p is not self.filters["threshold"]
+                  and p.Input.SMProxy is self.filters["threshold"].Input.SMProxy]
+        # Only fold the Clip in if all it sees are these Thresholds.
+        clip_input = self.filters["clip"].Input
+        merged = clip_input.Input if clip_input.GetXMLName() == "GroupDataSets" else clip_input
+        merged = merged if isinstance(merged, list) else [merged]
+        selected = [self.filters["threshold"]] + others
+        if all(any(p.SMProxy is t.SMProxy for t in selected) for p in merged):
+            clip, lod = self.filters["clip"], []
+        else:
+            clip, others = None, []
+            lod = [t for t in thresholds if t is not self.filters["threshold"]]
+        # The range the Threshold keeps under its ThresholdMethod, not just its two values.
+        if self.add_range_index(self.filters["threshold"], "Tracked_Labels", *filter_range(self.filters["threshold"]),
+                                clip=clip, extra_filters=others):
+            self.add_lod(lod)
+        else:
+            self.add_lod(thresholds)
+
         self.time_steps = self.extract_time_steps()
         self.trame_state.time_value = self.time_steps[0] if self.time_steps else 0.0
 
@@ -75,6 +92,7 @@ class ClusteredState(BaseVisualization):
                 max=max_val,
                 step=0.1,
                 label="Min Threshold",
+                **self.interaction_events(),
                 ticks=True,
                 thumb_label=True,
                 hide_details=False,
@@ -89,6 +107,7 @@ class ClusteredState(BaseVisualization):
                 max=5,
                 step=0.01,
                 label="Clip Y Origin",
+                **self.interaction_events(),
                 ticks=True,
                 thumb_label=True,
                 hide_details=True,
@@ -99,35 +118,18 @@ class ClusteredState(BaseVisualization):
 
         return widgets
 
-    def register_callbacks(self):
-        server = get_server()
-        ctrl = server.controller
-
-        @self.trame_state.change("time_value")
-        def update_time(time_value, **kwargs):
-            self.scene.AnimationTime = time_value
-            self.view.StillRender()
-            ctrl.view_update()
-
-        @self.trame_state.change("min_threshold")
-        def update_threshold(min_threshold, **kwargs):
-            # Instead of using ThresholdRange, update LowerThreshold directly.
-            current_lower = self.filters["threshold"].LowerThreshold
-            if current_lower != min_threshold:
-                self.filters["threshold"].LowerThreshold = min_threshold
-                # For a threshold between lower and upper values, set the method to "Between"
-                self.filters["threshold"].ThresholdMethod = "Between"
-                self.view.StillRender()
-                ctrl.view_update()
-
-        @self.trame_state.change("clip_y_origin")
-        def update_clip_y_origin(clip_y_origin, **kwargs):
-            clip = self.filters["clip"]
-            origin = list(clip.ClipType.Origin)
-            origin[1] = clip_y_origin
-            clip.ClipType.Origin = origin
-            self.view.StillRender()
-            ctrl.view_update()
-
-
-
+    def apply_min_threshold(self, min_threshold):
+        # Instead of using ThresholdRange, update LowerThreshold directly.
+        current_lower = self.filters["threshold"].LowerThreshold
+        if current_lower != min_threshold:
+            self.filters["threshold"].LowerThreshold = min_threshold
+            # For a threshold between lower and upper values, set the method to "Between"
+            self.filters["threshold"].ThresholdMethod = "Between"
+            self.update_range(lower=min_threshold, upper=self.filters["threshold"].UpperThreshold)
+
+    def apply_clip_y_origin(self, clip_y_origin):
+        clip = self.filters["clip"]
+        origin = list(clip.ClipType.Origin)
+        origin[1] = clip_y_origin
+        clip.ClipType.Origin = origin
+        self.update_range(origin=origin)
@@ -0,0 +1,144 @@
+"""
+Decimated, cached glyphs for GlyphState.
+
+The Glyph filter of glyphstate.pvsm puts an arrow on the points of the whole
+cloud, which is millions of triangles on the dense timesteps. SampledGlyphs
+picks at most `count` points first, either spread evenly in space (one point
+per occupied grid cell) or drawn with probability proportional to the speed,
+and only those are glyphed. The resulting geometry is kept per
+(timestep, count, sampling) in a memory-bounded LRU, so going back to a
+visited timestep does not re-run the Glyph filter.
+"""
+import numpy as np
+import vtk
+
+from range_index import point_cloud, point_columns
+from timestep_cache import TimestepCache, reroute_consumers
+
+
+def sample_uniform(columns, count, rng):
+    """Indices of at most count points, about one per cell of a regular grid over the points."""
+    points = columns["points"]
+    n = len(points)
+    if count >= n:
+        return np.arange(n)
+    order = rng.permutation(n)
+    low = points.min(axis=0)
+    extent = points.max(axis=0) - low
+    # Flat clouds (a slab, a plane) are gridded in the dimensions they span.
+    dims = extent > 1e-9 * max(extent.max(), 1e-30)
+    d = max(int(dims.sum()), 1)
+    cell = (np.prod(extent[dims]) / count) ** (1 / d) if dims.any() else 1.0
+    shuffled = points[order]
+
+    for _ in range(8):
+        cells = np.floor((shuffled - low) / cell).astype(np.int64)
+        cells[:, ~dims] = 0
+        shape = cells.max(axis=0) + 1
+        keys = cells[:, 0] + shape[0] * (cells[:, 1] + shape[1] * cells[:, 2])
+        # First point (in shuffled order) of every occupied cell
+        _, first = np.unique(keys, return_index=True)
+        if len(first) >= 0.9 * count:
+            break
+        # Most of the grid is empty space: shrink the cells until enough are occupied.
+        cell /= (count / len(first)) ** (1 / d)
+
+    chosen = order[first]
+    if len(chosen) > count:
+        chosen = rng.choice(chosen, count, replace=False)
+    return np.sort(chosen)
+
+
+def sample_velocity(columns, count, rng):
+    """Indices of count points drawn without replacement with probability proportional to the speed."""
+    speed = columns["values"]
+    n = len(speed)
+    if count >= n:
+        return np.arange(n)
+    # Weighted sampling by keys log(u) / w (Efraimidis-Spirakis): the count largest win.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keys = np.log(rng.random(n)) / np.nan_to_num(np.abs(speed))
+    keys[~np.isfinite(keys)] = -np.inf
+    return np.sort(np.argpartition(keys, n - count)[n - count:])
+
+
+SAMPLERS = {"Uniform": sample_uniform, "Velocity weighted": sample_velocity}
+
+
+class SampledGlyphs:
+    """
+    Puts a sampler in front of the Glyph filter and a cache behind it. The
+    Glyph reads the sampled points from one trivial producer and the
+    representation reads cached glyph geometry from another, so the Glyph
+    only runs for (timestep, count, sampling) combinations not seen yet.
+    """
+
+    def __init__(self, glyph, source, replaced, view, sources, budget_mb=512):
+        """
+        glyph: the Glyph proxy; source: proxy the points are read from;
+        replaced: the proxy feeding the Glyph so far (e.g. ConvertToPointCloud).
+        """
+        from paraview import simple
+
+        self.glyph = glyph
+        self.source = source
+        self.array = glyph.OrientationArray[1] or "velocity"
+        self.seed = int(getattr(glyph, "Seed", 0) or 0)
+        self.time_value = None
+        self.count = 20_000
+        self.sampling = "Uniform"
+        self.counts = {}       # cache key -> (points glyphed, points in the frame)
+
+        self.samples = simple.TrivialProducer(registrationName="Glyph-samples")
+        reroute_consumers(replaced, self.samples, view, sources)
+        # The sampler already picked the points, glyph every one of them.
+        glyph.GlyphMode = "All Points"
+        self.geometry = simple.TrivialProducer(registrationName="Glyph-cached")
+        reroute_consumers(glyph, self.geometry, view, sources)
+
+        # Same LRU as the timesteps, keyed by (time, count, sampling) and filled by glyphing.
+        self.cache = TimestepCache(budget_mb, prefetch=0, workers=1, loader=self.build)
+
+    def build(self, key):
+        time_value, count, sampling = key
+        self.source.UpdatePipeline(time_value)
+        columns = point_columns(self.source.GetClientSideObject().GetOutputDataObject(0), self.array)
+        # Seeded by the timestep, so a rebuilt entry shows the same arrows.
+        rng = np.random.default_rng([self.seed, int(np.float64(time_value).view(np.int64)) & 0x7FFFFFFF])
+        keep = SAMPLERS[sampling](columns, count, rng)
+        self.counts[key] = (len(keep), len(columns["points"]))
+
+        samples = point_cloud(columns["points"][keep], {name: arr[keep] for name, arr in columns["arrays"].items()},
+                              columns["active"])
+        producer = self.samples.GetClientSideObject()
+        producer.SetOutput(samples)
+        producer.Modified()
+        self.samples.MarkModified(self.samples)
+
+        self.glyph.UpdatePipeline(time_value)
+        geometry = vtk.vtkPolyData()
+        geometry.ShallowCopy(self.glyph.GetClientSideObject().GetOutputDataObject(0))
+        return geometry
+
+    def show(self, time_value=None, count=None, sampling=None):
+        """Change any of the time, glyph count or sampling and show the matching geometry."""
+        if time_value is not None:
+            self.time_value = time_value
+        if count is not None:
+            self.count = int(count)
+        if sampling is not None:
+            self.sampling = sampling
+        if self.time_value is None:
+            return
+
+        geometry = self.cache.get((self.time_value, self.count, self.sampling))
+        producer = self.geometry.GetClientSideObject()
+        producer.SetOutput(geometry)
+        producer.Modified()
+        self.geometry.MarkModified(self.geometry)
+
+    def describe(self):
+        s = self.cache.stats()
+        sampled, total = self.counts.get((self.time_value, self.count, self.sampling), (0, 0))
+        return (f"{sampled:,} of {total:,} points glyphed; glyph cache: {s['entries']} entries, "
+                f"{s['mb']:.0f}/{s['budget_mb']:.0f} MB, {100 * s['hit_rate']:.0f}% hit rate")
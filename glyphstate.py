@@ -1,38 +1,46 @@
 # from vizstate import VizState
-from trame.widgets import vuetify3
-from paraview import simple
-from trame.app import get_server
+from trame.widgets import vuetify3, html
 import os
 
 from base_visualization import BaseVisualization
+from glyph_sampling import SAMPLERS, SampledGlyphs
 
 # ---------------------
 # Modular VizState class
 # ---------------------
 class GlyphState(BaseVisualization):
+    state_keys = ("time_value", "glyph_count", "glyph_sampling")
+    appliers = {
+        "time_value": "apply_time",
+        "glyph_count": "apply_glyph_count",
+        "glyph_sampling": "apply_glyph_sampling",
+    }
+    # Memory budget of the glyph geometry cache (0 turns sampling and caching off).
+    glyph_cache_mb = 512
 
     def __init__(self, statefile, datapath, trame_state):
         super().__init__(statefile, datapath, trame_state)
+        self.glyphs = None
 
     def load(self):
         # Load state (this will still create a new view)
-        simple.LoadState(
-            self.statepath,
-            data_directory=self.datapath,
-            restrict_to_data_directory=True,
-        )
-    
- 
-        self.view = simple.GetActiveView()
-        self.view.MakeRenderWindowInteractor(True)
-        self.view.GetRenderWindow().SetOffScreenRendering(1)
+        self.load_state()
+
+        # Glyph a sample of the points instead of all of them, and keep the
+        # geometry of visited (timestep, count, sampling) combinations.
+        glyph = self.find_filter("Glyph")
+        to_point_cloud = self.find_filter("ConvertToPointCloud")
+        self.trame_state.glyph_count = 20_000
+        self.trame_state.glyph_sampling = "Uniform"
+        self.trame_state.glyph_samplers = list(SAMPLERS)
+        self.trame_state.glyph_stats = ""
+        if glyph and to_point_cloud and self.glyph_cache_mb > 0:
+            self.glyphs = SampledGlyphs(glyph, to_point_cloud.Input, to_point_cloud, self.view, self.sources,
+                                        self.glyph_cache_mb)
+            self.glyphs.show(self.scene.AnimationTime, self.trame_state.glyph_count,
+                             self.trame_state.glyph_sampling)
+            self.trame_state.glyph_stats = self.glyphs.describe()
 
-  
-        self.scene = simple.GetAnimationScene()
-        self.scene.UpdateAnimationUsingDataTimeSteps()
-    
-        self.sources = simple.GetSources()
-   
         self.view.ResetCamera()
         self.view.StillRender()
     
@@ -57,15 +65,44 @@ class GlyphState(BaseVisualization):
                 )
             )
 
+        if self.glyphs is not None:
+            widgets.append(
+                vuetify3.VSlider(
+                    v_model=("glyph_count", self.trame_state.glyph_count),
+                    min=1000,
+                    max=200_000,
+                    step=1000,
+                    label="Glyph Density",
+                    thumb_label=True,
+                    hide_details=True,
+                    class_="ma-4",
+                )
+            )
+            widgets.append(
+                vuetify3.VSelect(
+                    v_model=("glyph_sampling", self.trame_state.glyph_sampling),
+                    items=("glyph_samplers", self.trame_state.glyph_samplers),
+                    label="Glyph Sampling",
+                    hide_details=False,
+                    class_="ma-4",
+                )
+            )
+            widgets.append(html.Div("{{ glyph_stats }}", classes="text-caption ma-4"))
+
         return widgets
 
-    def register_callbacks(self):
-        server = get_server()
-        ctrl = server.controller
-        @self.trame_state.change("time_value")
-        def update_time(time_value, **kwargs):
-            self.scene.AnimationTime = time_value
-            self.view.StillRender()
-            ctrl.view_update()
+    def set_time(self, time_value):
+        super().set_time(time_value)
+        self.update_glyphs(time_value=time_value)
+
+    def update_glyphs(self, **changes):
+        if self.glyphs is not None:
+            with self.timed("update"):
+                self.glyphs.show(**changes)
+            self.trame_state.glyph_stats = self.glyphs.describe()
 
+    def apply_glyph_count(self, glyph_count):
+        self.update_glyphs(count=glyph_count)
 
+    def apply_glyph_sampling(self, glyph_sampling):
+        self.update_glyphs(sampling=glyph_sampling)
@@ -3,31 +3,26 @@ from trame.widgets import vuetify3
 from paraview import simple
 import os
 from base_visualization import BaseVisualization
-from trame.app import get_server
 
 # ---------------------
 # Modular VizState class
 # ---------------------
 class IsoVolumeState(BaseVisualization):
+    state_keys = ("time_value", "min_threshold", "max_threshold", "clip_x_origin", "color_map")
+    appliers = {
+        "time_value": "apply_time",
+        "min_threshold": "apply_min_threshold",
+        "max_threshold": "apply_max_threshold",
+        "clip_x_origin": "apply_clip_x_origin",
+        "color_map": "apply_color_map",
+        "interacting": "apply_interacting",
+    }
 
     def __init__(self, statefile, datapath, trame_state):
         super().__init__(statefile, datapath, trame_state)
 
     def load(self):
-        simple.LoadState(
-            self.statepath,
-            data_directory=self.datapath,
-            restrict_to_data_directory=True,
-        )
-
-        self.view = simple.GetActiveView()
-        self.view.MakeRenderWindowInteractor(True)
-        self.view.GetRenderWindow().SetOffScreenRendering(1)
-
-        self.scene = simple.GetAnimationScene()
-        self.scene.UpdateAnimationUsingDataTimeSteps()
-
-        self.sources = simple.GetSources()
+        self.load_state()
 
         # Extract threshold range
         self.filters["iso"] = self.find_filter("IsoVolume")
@@ -47,6 +42,17 @@ class IsoVolumeState(BaseVisualization):
         clip_origin = list(self.filters["clip"].ClipType.Origin)
         self.trame_state.clip_x_origin = clip_origin[0] if clip_origin else 0.0
 
+        # The ConvertToPointCloud -> IsoVolume -> Clip chain is replaced by one pass over
+        # a sorted index of the frame (range slice + half-space mask, see range_index.py).
+        # Without the index, decimate the IsoVolume input while a slider is dragged.
+        to_point_cloud = self.find_filter("ConvertToPointCloud")
+        self.filters["output"] = self.filters["clip"]
+        if self.add_range_index(self.filters["iso"], "concentration", *threshold_range, clip=self.filters["clip"],
+                                source=to_point_cloud.Input if to_point_cloud else None):
+            self.filters["output"] = self.range_selection.producer
+        else:
+            self.add_lod([self.filters["iso"]])
+
         # Change color maps
         self.trame_state.color_presets = [
             "Rainbow Uniform",
@@ -88,6 +94,7 @@ class IsoVolumeState(BaseVisualization):
                 max=5,
                 step=0.01,
                 label="Clip X Origin",
+                **self.interaction_events(),
                 ticks=True,
                 thumb_label=True,
                 hide_details=True,
@@ -102,6 +109,7 @@ class IsoVolumeState(BaseVisualization):
                 max=self.original_threshold_range[1],
                 step=0.1,
                 label="Min Threshold",
+                **self.interaction_events(),
                 ticks=True,
                 thumb_label=True,
                 hide_details=False,
@@ -117,6 +125,7 @@ class IsoVolumeState(BaseVisualization):
                 max=self.original_threshold_range[1],
                 step=0.1,
                 label="Max Threshold",
+                **self.interaction_events(),
                 ticks=True,
                 thumb_label=True,
                 hide_details=False,
@@ -139,47 +148,29 @@ class IsoVolumeState(BaseVisualization):
 
         return widgets
 
-    def register_callbacks(self):
-
-        server = get_server()
-        ctrl = server.controller
-
-        @self.trame_state.change("time_value")
-        def update_time(time_value, **kwargs):
-            self.scene.AnimationTime = time_value
-            self.view.StillRender()
-            ctrl.view_update()
-
-        @self.trame_state.change("min_threshold")
-        def update_min_threshold(min_threshold, **kwargs):
-            old_range = list(self.filters["iso"].ThresholdRange)
-            if old_range[0] != min_threshold:
-                self.filters["iso"].ThresholdRange = [min_threshold, old_range[1]]
-                self.view.StillRender()
-                ctrl.view_update()
-
-        @self.trame_state.change("max_threshold")
-        def update_max_threshold(max_threshold, **kwargs):
-            old_range = list(self.filters["iso"].ThresholdRange)
-            if old_range[1] != max_threshold:
-                self.filters["iso"].ThresholdRange = [old_range[0], max_threshold]
-                self.view.StillRender()
-                ctrl.view_update()
-
-        @self.trame_state.change("clip_x_origin")
-        def update_clip_x_origin(clip_x_origin, **kwargs):
-            clip = self.filters["clip"]
-            origin = list(clip.ClipType.Origin)
-            origin[0] = clip_x_origin
-            clip.ClipType.Origin = origin
-            self.view.StillRender()
-            ctrl.view_update()
-
-        @self.trame_state.change("color_map")
-        def update_colormap(color_map, **kwargs):
-            concentrationLUT = simple.GetColorTransferFunction('concentration')
-            concentrationLUT.ApplyPreset(color_map, True)
-            self.view.StillRender()
-            ctrl.view_update()
-
-
+    def apply_min_threshold(self, min_threshold):
+        old_range = list(self.filters["iso"].ThresholdRange)
+        if old_range[0] != min_threshold:
+            self.filters["iso"].ThresholdRange = [min_threshold, old_range[1]]
+            self.update_range(lower=min_threshold)
+
+    def apply_max_threshold(self, max_threshold):
+        old_range = list(self.filters["iso"].ThresholdRange)
+        if old_range[1] != max_threshold:
+            self.filters["iso"].ThresholdRange = [old_range[0], max_threshold]
+            self.update_range(upper=max_threshold)
+
+    def apply_clip_x_origin(self, clip_x_origin):
+        clip = self.filters["clip"]
+        origin = list(clip.ClipType.Origin)
+        origin[0] = clip_x_origin
+        clip.ClipType.Origin = origin
+        self.update_range(origin=origin)
+
+    def apply_color_map(self, color_map):
+        # A compiled state gives each display its own LUT, so look it up through ours. After
+        # LoadState (or if the display has none) it is the one shared under the array name.
+        concentrationLUT = simple.GetDisplayProperties(self.filters["output"], view=self.view).LookupTable
+        if concentrationLUT is None:
+            concentrationLUT = simple.GetColorTransferFunction("concentration")
+        concentrationLUT.ApplyPreset(color_map, True)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Per-stage latency of interactions with the viewer.
+
+An interaction is one batch of the render scheduler: every slider change that
+was coalesced into it, from the first state change to the image being handed
+to the websocket. It is split into stages:
+
+    queue   state change received -> batch starts (coalescing, --max-fps)
+    apply   appliers setting filter properties
+    read    timestep lookup / decode (timestep cache or reader)
+    update  pipeline execution (IsoVolume, Threshold, Clip, ...)
+    render  StillRender
+    push    image encode and send (ctrl.view_update)
+
+Stages nest (read happens inside apply), and each one only counts its own
+time, so the stages add up to the total. Interactions are grouped per
+callback, i.e. the state keys of the batch ("min_threshold", "clip_x_origin+time_value").
+
+Records can be appended to a JSON lines file as they happen. Running this
+module on such a file prints the per-callback histograms:
+
+    python latency.py latency/session.jsonl
+"""
+import argparse
+import json
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+STAGES = ("queue", "apply", "read", "update", "render", "push")
+# Histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def histogram(values_ms):
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values_ms:
+        for i, bound in enumerate(BUCKETS_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+class LatencyRecorder:
+
+    def __init__(self, keep=5000, log_path=None, on_record=None):
+        """
+        keep: records held in memory; log_path: JSON lines file every record is
+        appended to; on_record(record) is called after each interaction.
+        """
+        self.records = deque(maxlen=keep)
+        self.log = open(log_path, "a") if log_path else None
+        self.on_record = on_record
+        self.arrivals = {}     # state key -> time of its first change not yet rendered
+        self.current = None
+        self.stack = []
+
+    def request(self, key):
+        """A state change came in; the queue stage starts at the first one per key."""
+        self.arrivals.setdefault(key, time.perf_counter())
+
+    @contextmanager
+    def interaction(self, viz, keys):
+        now = time.perf_counter()
+        first = min((self.arrivals.pop(key, now) for key in keys), default=now)
+        self.current = {
+            "time": time.time(),
+            "viz": type(viz).__name__,
+            "callback": "+".join(sorted(keys)),
+            "stages": dict.fromkeys(STAGES, 0.0),
+        }
+        self.current["stages"]["queue"] = now - first
+        try:
+            yield self.current
+        finally:
+            record, self.current = self.current, None
+            self.stack = []
+            record["total"] = time.perf_counter() - first
+            self.add(record)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the open interaction (nothing happens outside one, e.g. during playback)."""
+        if self.current is None:
+            yield
+            return
+        self.stack.append(0.0)      # time spent in nested stages
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.stack.pop()
+            if self.current is not None:
+                self.current["stages"][name] += elapsed - nested
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def add(self, record):
+        self.records.append(record)
+        if self.log is not None:
+            self.log.write(json.dumps(record) + "\n")
+            self.log.flush()
+        if self.on_record is not None:
+            self.on_record(record)
+
+    def by_callback(self):
+        groups = defaultdict(list)
+        for record in self.records:
+            groups[record["callback"]].append(record)
+        return groups
+
+    def summary(self):
+        """Per callback: count, p50/p95 of the total and p50 of each stage, in ms."""
+        rows = []
+        for callback, records in sorted(self.by_callback().items()):
+            totals = [1000 * r["total"] for r in records]
+            row = {"callback": callback, "count": len(records),
+                   "p50": round(percentile(totals, 0.5), 1), "p95": round(percentile(totals, 0.95), 1)}
+            for name in STAGES:
+                row[name] = round(percentile([1000 * r["stages"][name] for r in records], 0.5), 1)
+            rows.append(row)
+        return rows
+
+    def histograms(self):
+        """Per callback and stage (plus "total"): counts per bucket of BUCKETS_MS, the last one open ended."""
+        result = {"buckets_ms": list(BUCKETS_MS), "callbacks": {}}
+        for callback, records in self.by_callback().items():
+            hists = {"total": histogram([1000 * r["total"] for r in records])}
+            for name in STAGES:
+                hists[name] = histogram([1000 * r["stages"][name] for r in records])
+            result["callbacks"][callback] = hists
+        return result
+
+    def export(self, path):
+        """Write the records in memory to path (JSON lines) and their histograms next to it."""
+        with open(path, "w") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+        hist_path = path.rsplit(".", 1)[0] + ".histograms.json"
+        with open(hist_path, "w") as f:
+            json.dump(self.histograms(), f, indent=2)
+        return path, hist_path
+
+    def describe_last(self):
+        if not self.records:
+            return ""
+        r = self.records[-1]
+        stages = ", ".join(f"{name} {1000 * r['stages'][name]:.1f}" for name in STAGES if r["stages"][name])
+        return f"Last: {r['callback']} {1000 * r['total']:.1f} ms ({stages})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-callback latency histograms of a viewer latency log.")
+    parser.add_argument("log", help="JSON lines file written with main.py --latency-log")
+    args = parser.parse_args()
+
+    recorder = LatencyRecorder(keep=None)
+    with open(args.log) as f:
+        for line in f:
+            if line.strip():
+                recorder.records.append(json.loads(line))
+
+    labels = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+    hists = recorder.histograms()["callbacks"]
+    for row in recorder.summary():
+        print(f"{row['callback']}: {row['count']} interactions, total p50 {row['p50']} ms, p95 {row['p95']} ms")
+        print("  " + " ".join(f"{name} {row[name]}" for name in STAGES) + "  (stage p50, ms)")
+        counts = hists[row["callback"]]["total"]
+        print("  " + "  ".join(f"{label}: {n}" for label, n in zip(labels, counts) if n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Session launcher: one viewer process per client.
+
+main.py keeps a single pipeline and a single trame state, so everyone connected
+to it moves the same sliders. The launcher keeps a pool of pre-started
+`main.py --server` workers (pipeline loaded, waiting on their own port) and
+hands each new browser its own worker by redirecting it there. Workers run
+with --shared-cache, so decoded timesteps are held once in shared memory no
+matter how many sessions are open (within --shared-cache-mb for all of them), and with --idle-timeout, so a session exits
+on its own once its browser has been gone for a while. The launcher replaces
+exited workers to keep the pool warm.
+
+    python launcher.py --port 8080 --warm 2 --max-sessions 8
+
+Extra arguments after `--` are passed on to every worker (e.g. -- --max-fps 20).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+from aiohttp import web
+
+import shared_cache
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+class Worker:
+
+    def __init__(self, port, process):
+        self.port = port
+        self.process = process
+        self.started = time.monotonic()
+        self.ready = False
+        self.assigned = None    # time the worker was handed to a client
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+
+class Pool:
+
+    def __init__(self, warm=2, max_sessions=8, idle_timeout=120, shared_cache_mb=4096, worker_args=()):
+        self.warm = warm
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.shared_cache_mb = shared_cache_mb
+        self.worker_args = list(worker_args)
+        self.workers = []
+        self.served = 0
+
+    async def spawn(self):
+        port = free_port()
+        cmd = [sys.executable, "main.py", "--server", "--port", str(port),
+               "--shared-cache", "--shared-cache-mb", str(self.shared_cache_mb),
+               "--idle-timeout", str(self.idle_timeout)] + self.worker_args
+        process = await asyncio.create_subprocess_exec(*cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
+        worker = Worker(port, process)
+        self.workers.append(worker)
+        print(f"[Launcher] Started worker on port {port} (pid {process.pid})")
+        asyncio.ensure_future(self.wait_ready(worker))
+        return worker
+
+    async def wait_ready(self, worker):
+        # Ready once the worker's server accepts connections (state loaded).
+        while worker.alive:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+                writer.close()
+                worker.ready = True
+                print(f"[Launcher] Worker on port {worker.port} ready in "
+                      f"{time.monotonic() - worker.started:.1f} s")
+                return
+            except OSError:
+                await asyncio.sleep(0.25)
+
+    def idle(self):
+        return [w for w in self.workers if w.alive and w.assigned is None]
+
+    async def acquire(self, timeout=120):
+        """An idle, ready worker, started on demand if the pool ran dry."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            ready = [w for w in self.idle() if w.ready]
+            if ready:
+                worker = ready[0]
+                worker.assigned = time.monotonic()
+                self.served += 1
+                await self.replenish()
+                return worker
+            if not self.idle() and len(self.workers) < self.max_sessions:
+                await self.spawn()
+            await asyncio.sleep(0.1)
+        return None
+
+    async def replenish(self):
+        while len(self.idle()) < self.warm and len(self.workers) < self.max_sessions:
+            await self.spawn()
+
+    async def reap(self):
+        for worker in [w for w in self.workers if not w.alive]:
+            self.workers.remove(worker)
+            if worker.assigned is not None:
+                print(f"[Launcher] Session on port {worker.port} ended after "
+                      f"{time.monotonic() - worker.assigned:.0f} s")
+            else:
+                print(f"[Launcher] Idle worker on port {worker.port} exited ({worker.process.returncode})")
+        await self.replenish()
+
+    async def shutdown(self):
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+        await asyncio.gather(*(w.process.wait() for w in self.workers), return_exceptions=True)
+        self.workers = []
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "sessions": sum(1 for w in self.workers if w.assigned is not None),
+            "warm": sum(1 for w in self.idle() if w.ready),
+            "starting": sum(1 for w in self.idle() if not w.ready),
+            "max_sessions": self.max_sessions,
+            "served": self.served,
+            "workers": [{"port": w.port, "pid": w.process.pid, "ready": w.ready,
+                         "session_seconds": None if w.assigned is None else round(now - w.assigned)}
+                        for w in self.workers],
+        }
+
+
+def make_app(pool):
+    app = web.Application()
+
+    async def new_session(request):
+        worker = await pool.acquire()
+        if worker is None:
+            return web.Response(status=503, text="All sessions are busy, try again later.\n")
+        host = request.url.host or "localhost"
+        raise web.HTTPFound(f"http://{host}:{worker.port}/")
+
+    async def status(request):
+        return web.json_response(pool.status())
+
+    async def supervise(app):
+        async def loop():
+            while True:
+                await pool.reap()
+                await asyncio.sleep(1)
+        await pool.replenish()
+        task = asyncio.ensure_future(loop())
+        yield
+        task.cancel()
+        await pool.shutdown()
+        print(f"[Launcher] Removed {shared_cache.clear()} shared timestep segments")
+
+    app.router.add_get("/", new_session)
+    app.router.add_get("/status", status)
+    app.cleanup_ctx.append(supervise)
+    return app
+
+
+def main():
+    argv = sys.argv[1:]
+    worker_args = []
+    if "--" in argv:
+        worker_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+
+    parser = argparse.ArgumentParser(description="Give every client its own viewer process.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--warm", type=int, default=2, help="Workers kept loaded and waiting for a client")
+    parser.add_argument("--max-sessions", type=int, default=8, help="Upper bound on worker processes")
+    parser.add_argument("--idle-timeout", type=float, default=120,
+                        help="Seconds a session stays up after its browser disconnected")
+    parser.add_argument("--shared-cache-mb", type=float, default=4096,
+                        help="Memory budget of the timesteps shared by all sessions")
+    args = parser.parse_args(argv)
+
+    pool = Pool(args.warm, args.max_sessions, args.idle_timeout, args.shared_cache_mb, worker_args)
+    web.run_app(make_app(pool), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import os, sys, json
+import asyncio, json, os, time
 from paraview import simple
 from trame.app import get_server
 from trame.ui.vuetify3 import SinglePageLayout
@@ -6,6 +6,12 @@ from trame.widgets import paraview, vuetify3, html
 from isovolumestate import IsoVolumeState
 from cluster_iso_state import ClusteredState
 from glyphstate import GlyphState
+from base_visualization import BaseVisualization
+from timestep_cache import TimestepCache, read_vtu
+import shared_cache
+from render_scheduler import RenderScheduler
+from playback import Playback
+from latency import LatencyRecorder, STAGES
 
 # select visualization
 default_viz = "Point Cloud"
@@ -23,71 +29,222 @@ server = get_server()
 state, ctrl = server.state, server.controller
 paraview.initialize(server)
 
-
+server.cli.add_argument("--no-compiled-state", action="store_true",
+                        help="Load the .pvsm files with LoadState instead of the compiled cache")
+server.cli.add_argument("--no-range-index", action="store_true",
+                        help="Re-run the IsoVolume/Threshold filters on threshold changes instead of slicing a sorted index")
+server.cli.add_argument("--glyph-cache-mb", type=float, default=512,
+                        help="Memory budget of the Glyphs view's geometry cache (0: glyph every point, no cache)")
+server.cli.add_argument("--no-vtkhdf", action="store_true",
+                        help="Read the run_n.vtu files even where a packed data/<run>.vtkhdf exists")
+server.cli.add_argument("--timestep-cache-mb", type=float, default=1024,
+                        help="Memory budget of the decoded timestep cache (0 disables it)")
+server.cli.add_argument("--prefetch", type=int, default=4,
+                        help="Timesteps to read ahead in the direction the time slider moves")
+server.cli.add_argument("--max-fps", type=float, default=30,
+                        help="Upper bound on pipeline updates + renders per second while controls move")
+server.cli.add_argument("--lod-points", type=int, default=200_000,
+                        help="Points kept while a slider is dragged (0 always renders at full detail)")
+server.cli.add_argument("--playback-fps", type=float, default=10, help="Frame rate of the Play button")
+server.cli.add_argument("--playback-buffer", type=int, default=24,
+                        help="Frames rendered ahead of the playhead during playback")
+server.cli.add_argument("--shared-cache", action="store_true",
+                        help="Keep decoded timesteps in shared memory, shared with the other sessions (see launcher.py)")
+server.cli.add_argument("--shared-cache-mb", type=float, default=4096,
+                        help="Memory budget of the shared timesteps, for all sessions together")
+server.cli.add_argument("--idle-timeout", type=float, default=0,
+                        help="Exit this many seconds after the last client disconnected (0: never)")
+server.cli.add_argument("--latency-panel", action="store_true",
+                        help="Show per-stage latency of every control under the controls")
+server.cli.add_argument("--latency-log", help="Append the latency of every interaction to this JSON lines file")
+args, _ = server.cli.parse_known_args()
+BaseVisualization.use_compiled_state = not args.no_compiled_state
+BaseVisualization.use_range_index = not args.no_range_index
+BaseVisualization.use_vtkhdf = not args.no_vtkhdf
+GlyphState.glyph_cache_mb = args.glyph_cache_mb
+shared_cache.budget_mb = args.shared_cache_mb
+if args.timestep_cache_mb > 0:
+    loader = shared_cache.load_shared if args.shared_cache else read_vtu
+    release = shared_cache.release if args.shared_cache else None
+    BaseVisualization.timestep_cache = TimestepCache(args.timestep_cache_mb, args.prefetch, loader=loader,
+                                                     release=release)
+state.timestep_cache_stats = ""
+BaseVisualization.render_scheduler = RenderScheduler(lambda: ctrl.view_update(), args.max_fps, state)
+BaseVisualization.lod_points = args.lod_points
+state.interacting = False
+state.view_quality = 100
+state.view_ratio = 1
+playback = Playback(state, args.playback_buffer, args.playback_fps)
+state.playing = False
+state.playback_loop = True
+state.playback_frame = ""
+state.playback_time = 0
+
+
+def latency_recorded(record):
+    state.latency_last = latency.describe_last()
+    state.latency_rows = latency.summary()
+
+# Only measured when asked for, and only the panel pushes state after every interaction.
+latency = None
+if args.latency_panel or args.latency_log:
+    latency = LatencyRecorder(log_path=args.latency_log,
+                              on_record=latency_recorded if args.latency_panel else None)
+BaseVisualization.latency = latency
+state.latency_last = ""
+state.latency_rows = []
+state.latency_export = ""
+
+
+# All visualizations live in this process. Each one loads its state file the
+# first time it is selected and keeps its view and pipeline afterwards.
 visualizations = {
         "Point Cloud": IsoVolumeState("isostate.pvsm", "run01", state),
         "Glyphs": GlyphState("glyphstate.pvsm", "run01", state),
         "Clustered": ClusteredState("clustering_DBSCAN.pvsm", "run01_DBSCAN", state),
 }
-curr_viz = visualizations[default_viz]
+curr_viz = None
 
-state.viz_labels = ["Point Cloud", "Glyphs", "Clustered"]
+state.viz_labels = list(visualizations)
 state.curr_viz_label = default_viz
 
-# Instantiate and load the state
-curr_viz.load()
-curr_viz.register_callbacks()
-
 
 ctrl.filter_controls = lambda: curr_viz.render_widgets()
 
 
-def update_viz_render(**kwargs):
+@ctrl.set("export_latency")
+def export_latency():
+    os.makedirs("latency", exist_ok=True)
+    path = os.path.join("latency", time.strftime("latency-%Y%m%d-%H%M%S.jsonl"))
+    jsonl, histograms = latency.export(path)
+    state.latency_export = f"Saved {jsonl} and {histograms}"
+
+
+@ctrl.set("toggle_playback")
+def toggle_playback():
+    if playback.playing:
+        playback.stop()
+    else:
+        playback.start(curr_viz, loop=state.playback_loop)
+
+
+def latency_panel():
+    """Median per-stage latency of each control (ms), see latency.py."""
+    with vuetify3.VCardTitle():
+        html.H4("Latency (ms, p50)")
+    with vuetify3.VCardText():
+        html.Div("{{ latency_last }}", classes="text-caption mb-2")
+        with html.Table(classes="text-caption", style="width: 100%;"):
+            with html.Tr():
+                for name in ("callback", "count", "p50", "p95") + STAGES:
+                    html.Th(name, style="text-align: left;")
+            with html.Tr(v_for="row in latency_rows", key="row.callback"):
+                for name in ("callback", "count", "p50", "p95") + STAGES:
+                    html.Td(f"{{{{ row['{name}'] }}}}")
+        vuetify3.VBtn("Export", click=ctrl.export_latency, size="small", classes="mt-2")
+        html.Div("{{ latency_export }}", classes="text-caption")
+
+
+def build_ui():
+    # Re-entering the layout replaces it on every connected client.
+    with SinglePageLayout(server) as layout:
+        layout.title.set_text("Modular ParaView State Viewer")
+
+        with layout.content:
+            with vuetify3.VContainer(fluid=True, classes="fill-height"):
+                with vuetify3.VRow(classes="fill-height", no_gutters=True):
+                    with vuetify3.VCol(cols=3, classes=""):
+                        with vuetify3.VCardText():
+                            vuetify3.VSelect(
+                                    v_model=("curr_viz_label", state.curr_viz_label),
+                                    items=("viz_labels", state.viz_labels),
+                                    label="Select Visualization"
+                                    )
+                        with vuetify3.VCardTitle():
+                            html.H3("Controls")
+                        ctrl.filter_controls()
+                        if curr_viz.time_steps:
+                            with vuetify3.VRow(classes="ma-4", align="center"):
+                                with vuetify3.VBtn(click=ctrl.toggle_playback, classes="mr-4"):
+                                    html.Span("{{ playing ? 'Pause' : 'Play' }}")
+                                vuetify3.VCheckbox(v_model=("playback_loop", state.playback_loop),
+                                                   label="Loop", hide_details=True, density="compact")
+                                html.Span("t = {{ playback_time }}", v_show="playing", classes="text-caption")
+                        html.Div("{{ timestep_cache_stats }}", classes="text-caption ma-4")
+                        if args.latency_panel:
+                            latency_panel()
+                    with vuetify3.VCol(cols=9, classes=""):
+                        with vuetify3.VContainer(fluid=True, classes="fill-height"):
+                            view_widget = paraview.VtkRemoteView(
+                                curr_viz.view, ref="view", classes="",
+                                still_quality=("view_quality", 100),
+                                still_ratio=("view_ratio", 1),
+                                v_show="!playing",
+                            )
+                            ctrl.view_update = view_widget.update
+                            # Pre-rendered frames from the playback buffer
+                            html.Img(src=("playback_frame", ""), v_show="playing",
+                                     style="width: 100%; height: 100%; object-fit: contain;")
+
+
+def show_visualization(label, push=True):
+    """Swap the view and the control panel to another visualization, loading it if needed."""
+    global curr_viz
+    viz = visualizations[label]
+    if viz is curr_viz:
+        return
+
+    start = time.perf_counter()
+    playback.stop()
+    if curr_viz is not None:
+        curr_viz.deactivate()
+    if not viz.loaded:
+        viz.load()
+        viz.register_callbacks()
+        print(f"[Trame] Loaded {label} in {time.perf_counter() - start:.2f} s")
+    viz.activate()
+    curr_viz = viz
+
+    build_ui()
+    if push:
+        curr_viz.view.StillRender()
+        ctrl.view_update()
+    print(f"[Trame] Switched to {label} in {time.perf_counter() - start:.2f} s")
+
+
+def update_viz_render(curr_viz_label, **kwargs):
     """
-    Dump the selected state to a json file and reload
-    the server with the new state selected
+    Show the selected visualization and remember it, so the next start
+    opens on the same one.
     """
-    try:
-        with open("viz_config.json") as f:
-            selected = json.load(f).get("selected")
-    except FileNotFoundError:
-        selected = None
+    show_visualization(curr_viz_label)
+    with open("viz_config.json", "w") as f:
+        json.dump({"selected": curr_viz_label}, f)
 
-    if selected == state.curr_viz_label:
-        print("Selected visualization already loaded. Aborting reboot...")
-        return  # no change, skip restart
+server.change("curr_viz_label")(update_viz_render)
 
-    with open("viz_config.json", "w") as f:
-        json.dump({"selected": state.curr_viz_label}, f)
+# Idle reclaim: a session started by launcher.py exits once its client is gone.
+connected_clients = 0
 
-    print(f"[Trame] Restarting with new selection: {state.curr_viz_label}")
-    sys.stdout.flush()
+@ctrl.add("on_client_connected")
+def client_connected():
+    global connected_clients
+    connected_clients += 1
 
-    os.execv(sys.executable, [sys.executable] + sys.argv)
+@ctrl.add("on_client_exited")
+def client_exited():
+    global connected_clients
+    connected_clients -= 1
+    if args.idle_timeout > 0 and connected_clients <= 0:
+        asyncio.get_event_loop().call_later(args.idle_timeout, stop_if_idle)
 
-server.change("curr_viz_label")(update_viz_render)
+def stop_if_idle():
+    if connected_clients <= 0:
+        print(f"[Trame] No client for {args.idle_timeout:.0f} s, shutting down")
+        asyncio.ensure_future(server.stop())
 
-# Build UI
-with SinglePageLayout(server) as layout:
-    layout.title.set_text("Modular ParaView State Viewer")
-
-    with layout.content:
-        with vuetify3.VContainer(fluid=True, classes="fill-height"):
-            with vuetify3.VRow(classes="fill-height", no_gutters=True):
-                with vuetify3.VCol(cols=3, classes=""):
-                    with vuetify3.VCardText():
-                        vuetify3.VSelect(
-                                v_model=("curr_viz_label", state.curr_viz_label),
-                                items=("viz_labels", state.viz_labels),
-                                label="Select Visualization"
-                                )
-                    with vuetify3.VCardTitle():
-                        html.H3("Controls")
-                    ctrl.filter_controls()
-                with vuetify3.VCol(cols=9, classes=""):
-                    with vuetify3.VContainer(fluid=True, classes="fill-height"):
-                        view_widget = paraview.VtkRemoteView(curr_viz.view, ref="view", classes="")
-                        ctrl.view_update = view_widget.update
+# Build UI (nothing is connected yet, so there is no image to push)
+show_visualization(default_viz, push=False)
 
 # Start server
 if __name__ == "__main__":
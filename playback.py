@@ -0,0 +1,154 @@
+"""
+Server-side animation playback.
+
+A producer renders the timesteps ahead of the playhead and keeps them JPEG
+encoded in a bounded ring buffer. A consumer hands one frame to the client per
+tick of the target frame rate. When it falls behind (a slow frame, a busy
+server) it drops the frames it is late for instead of slowing the clock, and
+when the buffer runs dry it keeps the last frame up.
+
+ParaView rendering is not thread safe, so both sides are tasks on the trame
+event loop. Only the render and the grab of the image run on the loop; the
+JPEG encoding runs on a worker thread (VTK releases the GIL while writing).
+The buffer is filled halfway before the clock starts. From then on the
+producer renders one frame per tick, right after the consumer showed one, so
+each render gets a whole interval and slider callbacks get what is left of
+it. It only renders back to back while the buffer is under half full. A
+render cannot be interrupted, so one slower than the interval still delays
+the next tick and the frames it made late are dropped.
+"""
+import asyncio
+import base64
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import vtk
+from vtk.util import numpy_support
+
+
+def grab_view(view):
+    """Render view and return a copy of its image."""
+    view.StillRender()
+    grab = vtk.vtkWindowToImageFilter()
+    grab.SetInput(view.GetRenderWindow())
+    grab.SetInputBufferTypeToRGB()
+    grab.ReadFrontBufferOff()
+    grab.Update()
+    image = vtk.vtkImageData()
+    image.DeepCopy(grab.GetOutput())
+    return image
+
+
+def encode_image(image, quality=85):
+    """JPEG bytes of image. Touches no ParaView object, so it can run on any thread."""
+    writer = vtk.vtkJPEGWriter()
+    writer.SetInputData(image)
+    writer.SetQuality(quality)
+    writer.WriteToMemoryOn()
+    writer.Write()
+    return numpy_support.vtk_to_numpy(writer.GetResult()).tobytes()
+
+
+class Playback:
+
+    def __init__(self, state, buffer_size=24, fps=10, quality=85):
+        self.state = state
+        self.buffer = deque(maxlen=buffer_size)   # (time value, jpeg bytes)
+        self.fps = fps
+        self.quality = quality
+        self.viz = None
+        self.tasks = []
+        self.shown = self.dropped = self.underruns = 0
+        self.encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playback-encode")
+        self.ticked = None
+
+    @property
+    def playing(self):
+        return bool(self.tasks)
+
+    def start(self, viz, loop=True):
+        if self.playing or not viz.time_steps:
+            return
+        self.viz = viz
+        self.loop = loop
+        self.buffer.clear()
+        self.shown = self.dropped = self.underruns = 0
+        times = viz.time_steps
+        current = self.state.time_value
+        self.next_index = min(range(len(times)), key=lambda i: abs(times[i] - current))
+        self.finished = False
+        self.last_time = current
+        self.ticked = asyncio.Event()
+        self.tasks = [asyncio.ensure_future(self._produce()), asyncio.ensure_future(self._consume())]
+        self.state.playing = True
+
+    def stop(self):
+        if not self.playing:
+            return
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.buffer.clear()
+        self.state.playing = False
+        # Hand the paused frame back to the interactive view.
+        self.state.time_value = self.last_time
+        self.state.flush()
+        self.viz.request_update("time_value", self.last_time)
+        print(f"[Playback] {self.shown} frames shown, {self.dropped} dropped, {self.underruns} underruns")
+
+    async def _produce(self):
+        times = self.viz.time_steps
+        loop = asyncio.get_event_loop()
+        while not self.finished:
+            if len(self.buffer) >= self.buffer.maxlen // 2:
+                # Enough buffered: one render per tick, started right after it.
+                self.ticked.clear()
+                await self.ticked.wait()
+                if len(self.buffer) == self.buffer.maxlen:
+                    continue
+            t = times[self.next_index]
+            self.viz.set_time(t)
+            image = grab_view(self.viz.view)
+            jpeg = await loop.run_in_executor(self.encoder, encode_image, image, self.quality)
+            self.buffer.append((t, jpeg))
+            self.next_index += 1
+            if self.next_index == len(times):
+                if self.loop:
+                    self.next_index = 0
+                else:
+                    self.finished = True
+            await asyncio.sleep(0)
+
+    async def _consume(self):
+        interval = 1.0 / self.fps
+        # Prefill so a few slow frames do not stall the clock right away.
+        while len(self.buffer) < self.buffer.maxlen // 2 and not self.finished:
+            await asyncio.sleep(interval / 2)
+
+        next_tick = time.perf_counter()
+        while True:
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Late by whole intervals: skip those frames rather than fall further behind.
+            late = int((time.perf_counter() - next_tick) / interval)
+            for _ in range(late):
+                if len(self.buffer) > 1:
+                    self.buffer.popleft()
+                    self.dropped += 1
+            next_tick += (late + 1) * interval
+
+            if self.buffer:
+                t, jpeg = self.buffer.popleft()
+                self.last_time = t
+                with self.state:
+                    self.state.playback_frame = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+                    self.state.playback_time = t
+                self.shown += 1
+            elif self.finished:
+                self.stop()
+                return
+            else:
+                self.underruns += 1
+            self.ticked.set()
@@ -0,0 +1,342 @@
+"""
+Scalar range selection by index instead of by filter.
+
+Moving a threshold slider re-runs IsoVolume (or Threshold) over every point
+of the frame, although only the scalar range changed. RangeIndex sorts a
+frame's points by the scalar once and keeps the points and point arrays in
+that order, with a cumulative histogram of the values. Any [lower, upper]
+range is then a contiguous slice of those arrays, found with two binary
+searches, so a threshold change costs time proportional to the points it
+keeps.
+
+RangeSelection puts an index in place of a range filter in a loaded pipeline:
+the filter's consumers read from a trivial producer whose output is the slice.
+Given the plane of a Clip as well, it replaces the whole
+ConvertToPointCloud -> IsoVolume -> Clip chain: the half-space test runs on
+the slice in the same pass, and the only allocation is the output. The
+replaced filters stay registered (and keep their properties in sync) but no
+longer run.
+
+Once a clip plane with an axis-aligned normal starts moving, the selected
+points are also sorted along that axis (once per timestep and range). The
+clipped output is then a prefix or suffix of them: every slider tick is one
+binary search and no point is looked at twice.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from timestep_cache import reroute_consumers
+
+# NumPy dtype matching vtkIdType (32 or 64 bit depending on the VTK build)
+VTK_ID_DTYPE = numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE]
+
+
+def point_columns(data, scalar):
+    """The scalar, points and named point arrays of data (any vtkPointSet) as numpy arrays."""
+    point_data = data.GetPointData()
+    array = point_data.GetArray(scalar)
+    if array is None:
+        raise KeyError(f"No point array {scalar!r} to index")
+    values = numpy_support.vtk_to_numpy(array)
+    if values.ndim > 1:
+        values = np.linalg.norm(values, axis=1)
+    arrays = {}
+    for i in range(point_data.GetNumberOfArrays()):
+        arr = point_data.GetArray(i)
+        if arr is not None and arr.GetName():
+            arrays[arr.GetName()] = numpy_support.vtk_to_numpy(arr)
+    active = point_data.GetScalars().GetName() if point_data.GetScalars() else None
+    return {"values": values, "points": numpy_support.vtk_to_numpy(data.GetPoints().GetData()),
+            "arrays": arrays, "active": active}
+
+
+def point_cloud(points, arrays, active=None, ids=None):
+    """vtkPolyData with one vertex per point, wrapping the given (contiguous) arrays without copying."""
+    output = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=False))
+    output.SetPoints(vtk_points)
+
+    n = len(points)
+    if ids is None or len(ids) < n + 1:
+        ids = np.arange(n + 1, dtype=VTK_ID_DTYPE)
+    verts = vtk.vtkCellArray()
+    verts.SetData(numpy_support.numpy_to_vtkIdTypeArray(ids[:n + 1], deep=False),
+                  numpy_support.numpy_to_vtkIdTypeArray(ids[:n], deep=False))
+    output.SetVerts(verts)
+
+    point_data = output.GetPointData()
+    for name, arr in arrays.items():
+        vtk_arr = numpy_support.numpy_to_vtk(arr, deep=False)
+        vtk_arr.SetName(name)
+        point_data.AddArray(vtk_arr)
+    if active:
+        point_data.SetActiveScalars(active)
+    return output
+
+
+def half_space(points, plane):
+    """
+    Mask of the points a plane Clip keeps. plane is (origin, normal, invert);
+    with invert (ParaView's default) that is the side the normal points away from.
+    """
+    origin, normal, invert = plane
+    normal = np.asarray(normal, dtype=points.dtype)
+    # One temporary of a value per point, not a copy of the points.
+    distance = points @ normal
+    offset = np.dot(np.asarray(origin, dtype=points.dtype), normal)
+    return distance <= offset if invert else distance >= offset
+
+
+def plane_axis(plane):
+    """Index of the axis the plane's normal lies along, or None for an oblique plane."""
+    nonzero = np.flatnonzero(np.asarray(plane[1], dtype=float))
+    return int(nonzero[0]) if len(nonzero) == 1 else None
+
+
+def decimate(keep, max_points):
+    if max_points and len(keep) > max_points:
+        return keep[::-(-len(keep) // max_points)]
+    return keep
+
+
+def masked_extract(columns, lower, upper, max_points=0, plane=None, extra_ranges=()):
+    """Same output as RangeIndex.extract, with one pass over every point (no index needed)."""
+    values = columns["values"]
+    mask = values >= lower
+    mask &= values <= upper
+    for extra_lower, extra_upper in extra_ranges:
+        mask |= (values >= extra_lower) & (values <= extra_upper)
+    if plane is not None:
+        mask &= half_space(columns["points"], plane)
+    keep = decimate(np.flatnonzero(mask), max_points)
+    return point_cloud(columns["points"][keep], {name: arr[keep] for name, arr in columns["arrays"].items()},
+                       columns["active"])
+
+
+class RangeIndex:
+
+    def __init__(self, columns, bins=1024):
+        """Index the points of point_columns() output by their scalar value."""
+        values = columns["values"]
+        order = np.argsort(values, kind="stable")      # NaNs sort last
+        self.values = values[order]
+        self.finite = int(np.count_nonzero(np.isfinite(self.values)))
+        self.points = columns["points"][order]
+        self.arrays = {name: arr[order] for name, arr in columns["arrays"].items()}
+        self.active_scalars = columns["active"]
+        # Vertex cells of any slice are views of this.
+        self.ids = np.arange(len(order) + 1, dtype=VTK_ID_DTYPE)
+
+        # Cumulative histogram: cumulative[b] points lie below edges[b].
+        finite_values = self.values[:self.finite]
+        if self.finite:
+            low, high = float(finite_values[0]), float(finite_values[-1])
+        else:
+            low = high = 0.0
+        counts, self.edges = np.histogram(finite_values, bins=bins, range=(low, high if high > low else low + 1))
+        self.cumulative = np.concatenate(([0], np.cumsum(counts)))
+
+        # Selected points sorted along one axis (see axis_view), for the last selection only.
+        self.axis_key = None
+        self.axis_columns = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def position(self, value, side="left"):
+        """searchsorted(values, value, side), narrowed to one histogram bin first."""
+        if self.finite == 0 or value < self.edges[0]:
+            return 0
+        if value > self.edges[-1]:
+            return self.finite
+        bins = len(self.edges) - 1
+        b = min(int((value - self.edges[0]) / (self.edges[1] - self.edges[0])), bins - 1)
+        # One bin of slack either side for rounding at the bin edges.
+        start = int(self.cumulative[max(b - 1, 0)])
+        stop = int(self.cumulative[min(b + 2, bins)])
+        return start + int(np.searchsorted(self.values[start:stop], value, side=side))
+
+    def bounds(self, lower, upper):
+        """[start, stop) of the points with lower <= value <= upper."""
+        start = self.position(lower, "left")
+        stop = self.position(upper, "right")
+        return start, max(start, stop)
+
+    def count(self, lower, upper):
+        start, stop = self.bounds(lower, upper)
+        return stop - start
+
+    def intervals(self, ranges):
+        """Merged, sorted [start, stop) intervals of the points inside any of the (lower, upper) ranges."""
+        merged = []
+        for start, stop in sorted(self.bounds(lower, upper) for lower, upper in ranges):
+            if stop <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        return merged
+
+    def axis_view(self, intervals, axis, build=True):
+        """
+        The points of intervals (and their arrays) sorted by coordinate axis, or
+        None if that is not built yet and build is False. Only the last one is kept.
+        """
+        key = (tuple(intervals), axis)
+        if self.axis_key != key:
+            if not build:
+                return None
+            selected = np.concatenate([np.arange(start, stop) for start, stop in intervals] or [np.arange(0)])
+            order = selected[np.argsort(self.points[selected, axis], kind="stable")]
+            self.axis_columns = {
+                "coordinate": np.ascontiguousarray(self.points[order, axis]),
+                "points": self.points[order],
+                "arrays": {name: arr[order] for name, arr in self.arrays.items()},
+            }
+            self.axis_key = key
+        return self.axis_columns
+
+    def extract(self, lower, upper, max_points=0, plane=None, extra_ranges=(), build_axis=False):
+        """
+        vtkPolyData of the points in [lower, upper] (or any of extra_ranges),
+        and on the kept side of plane if given (see half_space). Every n-th
+        point if there are more than max_points. An axis-aligned plane uses the
+        axis-sorted selection when it exists, or builds it first if build_axis.
+        """
+        intervals = self.intervals([(lower, upper)] + list(extra_ranges))
+        columns = {"points": self.points, "arrays": self.arrays}
+        axis = plane_axis(plane) if plane is not None else None
+        view = self.axis_view(intervals, axis, build_axis) if axis is not None else None
+
+        if view is not None:
+            # Kept side of an axis-aligned plane = a prefix or suffix of the axis-sorted points.
+            origin, normal, invert = plane
+            keep_below = (normal[axis] > 0) == bool(invert)
+            if keep_below:
+                start, stop = 0, int(np.searchsorted(view["coordinate"], origin[axis], side="right"))
+            else:
+                start, stop = int(np.searchsorted(view["coordinate"], origin[axis], side="left")), len(view["coordinate"])
+            columns = view
+            selection = slice(start, stop)
+            if max_points and stop - start > max_points:
+                selection = slice(start, stop, -(-(stop - start) // max_points))
+        elif plane is not None:
+            # The half-space test only looks at the selected intervals.
+            selection = decimate(np.concatenate(
+                [start + np.flatnonzero(half_space(self.points[start:stop], plane)) for start, stop in intervals]
+                or [np.arange(0)]), max_points)
+        elif len(intervals) > 1:
+            selection = decimate(np.concatenate([np.arange(start, stop) for start, stop in intervals]), max_points)
+        else:
+            start, stop = intervals[0] if intervals else (0, 0)
+            selection = slice(start, stop)
+            if max_points and stop - start > max_points:
+                selection = slice(start, stop, -(-(stop - start) // max_points))
+        # Plain slices are views; the rest get copied, but only the kept points.
+        return point_cloud(np.ascontiguousarray(columns["points"][selection]),
+                           {name: np.ascontiguousarray(arr[selection]) for name, arr in columns["arrays"].items()},
+                           self.active_scalars, self.ids)
+
+
+def filter_range(range_filter):
+    """(lower, upper) a Threshold or IsoVolume proxy keeps, following the Threshold's ThresholdMethod."""
+    properties = range_filter.ListProperties()
+    if "ThresholdRange" in properties:
+        return tuple(range_filter.ThresholdRange)
+    lower, upper = range_filter.LowerThreshold, range_filter.UpperThreshold
+    method = range_filter.ThresholdMethod if "ThresholdMethod" in properties else "Between"
+    if method == "Below Lower Threshold":
+        return -np.inf, lower
+    if method == "Above Upper Threshold":
+        return upper, np.inf
+    return lower, upper
+
+
+class RangeSelection:
+    """
+    Feeds the consumers of range_filter (IsoVolume, Threshold) from a
+    RangeIndex of the filter's input instead. With clip (a plane Clip
+    downstream of range_filter), the clip's consumers are fed instead and the
+    plane is applied in the same pass. source overrides where the points are
+    read from, to skip a ConvertToPointCloud in front of range_filter.
+    extra_filters are other range filters on the same scalar and input whose
+    output is merged with range_filter's before the clip (a GroupDatasets);
+    their fixed ranges are added to the selection.
+
+    Sorting costs more than one pass of the filter, so a timestep is shown
+    with masked passes until its index, sorted on a background thread (numpy
+    releases the GIL), is ready; range changes then use the index. The indices of
+    the last `steps` timesteps are kept, so going back and forth in time does
+    not re-sort.
+    """
+
+    def __init__(self, range_filter, scalar, view, sources, steps=4, clip=None, source=None, extra_filters=()):
+        from paraview import simple
+
+        full_input = source or range_filter.Input
+        self.input = full_input[0] if isinstance(full_input, list) else full_input
+        self.scalar = scalar
+        self.steps = steps
+        self.indices = OrderedDict()   # time value -> Future of its RangeIndex, least recently used first
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="range-index")
+        self.time_value = None
+        self.lower, self.upper = -np.inf, np.inf
+        self.max_points = 0
+        self.extra_ranges = [filter_range(f) for f in extra_filters]
+        self.plane = None
+        if clip is not None:
+            self.plane = (list(clip.ClipType.Origin), list(clip.ClipType.Normal), bool(clip.Invert))
+
+        replaced = clip or range_filter
+        self.producer = simple.TrivialProducer(registrationName=f"{replaced.GetXMLLabel()}-range")
+        reroute_consumers(replaced, self.producer, view, sources)
+
+    def columns(self, time_value):
+        self.input.UpdatePipeline(time_value)
+        return point_columns(self.input.GetClientSideObject().GetOutputDataObject(0), self.scalar)
+
+    def show(self, time_value=None, lower=None, upper=None, max_points=None, origin=None):
+        """Change any of the time, range, point budget or plane origin and update the producer's output."""
+        if time_value is not None:
+            self.time_value = time_value
+        if lower is not None:
+            self.lower = lower
+        if upper is not None:
+            self.upper = upper
+        if max_points is not None:
+            self.max_points = max_points
+        # Only a moving plane pays for sorting the selection along its axis.
+        build_axis = origin is not None and self.plane is not None
+        if build_axis:
+            self.plane = (origin, self.plane[1], self.plane[2])
+        if self.time_value is None:
+            return
+
+        future = self.indices.get(self.time_value)
+        if future is not None and not future.done():
+            # Still sorting: keep masking rather than blocking the event loop on it.
+            self.indices.move_to_end(self.time_value)
+            output = masked_extract(self.columns(self.time_value), self.lower, self.upper, self.max_points,
+                                    self.plane, self.extra_ranges)
+        elif future is not None:
+            self.indices.move_to_end(self.time_value)
+            output = future.result().extract(self.lower, self.upper, self.max_points, self.plane,
+                                             self.extra_ranges, build_axis)
+        else:
+            columns = self.columns(self.time_value)
+            self.indices[self.time_value] = self.pool.submit(RangeIndex, columns)
+            while len(self.indices) > self.steps:
+                self.indices.popitem(last=False)
+            output = masked_extract(columns, self.lower, self.upper, self.max_points, self.plane,
+                                    self.extra_ranges)
+
+        producer = self.producer.GetClientSideObject()
+        producer.SetOutput(output)
+        producer.Modified()
+        self.producer.MarkModified(self.producer)
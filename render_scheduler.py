@@ -0,0 +1,73 @@
+"""
+Coalescing render scheduler shared by all visualizations.
+
+State callbacks no longer apply their change and render on the spot. They
+hand (visualization, state key, value) to the scheduler, which keeps only the
+latest value per key and runs one batch at a time on the trame event loop:
+apply every pending change, render each touched view once, push the image.
+While a batch renders, new slider ticks just overwrite the pending values, so
+dragging a slider never builds up a backlog of stale pipeline updates.
+"""
+import asyncio
+import time
+
+
+class RenderScheduler:
+
+    def __init__(self, push, max_fps=30, state=None):
+        """
+        push() sends the freshly rendered image to the clients (ctrl.view_update).
+        state is the trame state, flushed after each batch since appliers may set it.
+        """
+        self.push = push
+        self.state = state
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.pending = {}      # (id(viz), key) -> (viz, key, value), latest value wins
+        self.task = None
+        self.last_render = 0.0
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    def request(self, viz, key, value):
+        self.requests += 1
+        if (id(viz), key) in self.pending:
+            self.coalesced += 1
+        self.pending[(id(viz), key)] = (viz, key, value)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (startup, scripts): there is nothing to coalesce with.
+            self.flush()
+            return
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self.pending:
+            wait = self.last_render + self.min_interval - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.flush()
+            # Let the server take in the state changes that arrived meanwhile.
+            await asyncio.sleep(0)
+
+    def flush(self):
+        """Apply the pending changes of each touched visualization, then render it once."""
+        batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        touched = {}
+        for viz, key, value in batch.values():
+            touched.setdefault(id(viz), (viz, []))[1].append((key, value))
+        for viz, changes in touched.values():
+            viz.update_view(changes, self.push)
+        if self.state is not None:
+            self.state.flush()
+        self.last_render = time.perf_counter()
+        self.batches += 1
+
+    def stats(self):
+        return {"requests": self.requests, "coalesced": self.coalesced, "batches": self.batches,
+                "pending": len(self.pending)}
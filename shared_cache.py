@@ -0,0 +1,334 @@
+"""
+Decoded timesteps in shared memory, shared by every session on the machine.
+
+Each session of launcher.py is its own process with its own pipeline. Without
+this, every one of them would decode and hold its own copy of each run_n.vtu.
+load_shared() decodes a file once into a named shared memory segment (points,
+cells and point arrays back to back, described by a JSON header) and every
+other process maps the same segment and wraps it in VTK arrays without copying.
+
+Segments outlive the process that created them. A registry next to them
+records every segment's size, when it was last used and which processes map
+it. Before a new segment is created, the least recently used ones that no
+live process maps are unlinked until the new one fits in budget_mb. A process
+stops mapping a segment once its timestep cache let go of the frame (see
+release()). A segment whose creator died before finishing it is removed and
+decoded again. launcher.py removes everything with clear() when it shuts down.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from timestep_cache import read_vtu
+
+PREFIX = "pvst-"
+HEADER = struct.Struct("<BQ")   # ready flag, length of the JSON layout
+ALIGN = 64
+# NumPy dtype matching vtkIdType (32 or 64 bit depending on the VTK build)
+VTK_ID_DTYPE = numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE]
+REGISTRY = os.path.join(tempfile.gettempdir(), PREFIX + "registry.json")
+
+# Machine-wide budget of the segments; main.py sets it from --shared-cache-mb.
+budget_mb = 4096
+
+_mapped = {}     # segment name -> [SharedMemory, grids handed out and not released yet]
+_closing = {}    # segment name -> SharedMemory released, closed once VTK stops using it
+_grids = {}      # id(grid) -> (weak reference to the grid, segment name), for release()
+_lock = threading.Lock()   # the timestep cache loads and releases from its prefetch threads
+
+
+def segment_name(path):
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    return PREFIX + hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _untrack(shm):
+    # The resource tracker would unlink the segment when this process exits,
+    # pulling it out from under the other sessions.
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _unlink(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+@contextmanager
+def _registry():
+    """The table of segments (size, last use, pids mapping it), locked machine-wide while in use."""
+    with open(REGISTRY + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(REGISTRY) as f:
+                table = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            table = {}
+        yield table
+        tmp = REGISTRY + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(table, f)
+        os.replace(tmp, REGISTRY)
+
+
+def _use(table, name, size, mapped):
+    entry = table.setdefault(name, {"size": size, "used": 0, "users": []})
+    entry["used"] = time.time()
+    pid = os.getpid()
+    if mapped and pid not in entry["users"]:
+        entry["users"].append(pid)
+    elif not mapped and pid in entry["users"]:
+        entry["users"].remove(pid)
+
+
+def _evict(table, needed):
+    """Unlink the least recently used segments nobody maps until needed more bytes fit in the budget."""
+    for entry in table.values():
+        entry["users"] = [pid for pid in entry["users"] if _alive(pid)]
+    total = sum(entry["size"] for entry in table.values())
+    for name in sorted(table, key=lambda n: table[n]["used"]):
+        if total + needed <= budget_mb * 2**20:
+            break
+        if not table[name]["users"]:
+            _unlink(name)
+            total -= table.pop(name)["size"]
+
+
+def _cell_types(grid):
+    # GetCellTypes() replaced GetCellTypesArray() in VTK 9.6, older builds only have the latter.
+    try:
+        return grid.GetCellTypes()
+    except TypeError:
+        return grid.GetCellTypesArray()
+
+
+def _decode_columns(path):
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(path)
+    reader.Update()
+    data = reader.GetOutput()
+    cells = data.GetCells()
+    columns = {
+        "points": numpy_support.vtk_to_numpy(data.GetPoints().GetData()),
+        "@offsets": numpy_support.vtk_to_numpy(cells.GetOffsetsArray()).astype(VTK_ID_DTYPE),
+        "@connectivity": numpy_support.vtk_to_numpy(cells.GetConnectivityArray()).astype(VTK_ID_DTYPE),
+        "@types": numpy_support.vtk_to_numpy(_cell_types(data)),
+    }
+    point_data = data.GetPointData()
+    for i in range(point_data.GetNumberOfArrays()):
+        arr = point_data.GetArray(i)
+        if arr is not None and arr.GetName():
+            columns[arr.GetName()] = numpy_support.vtk_to_numpy(arr)
+    return columns
+
+
+def _create(name, path):
+    columns = _decode_columns(path)
+    layout, offset = {}, 0
+    for column, arr in columns.items():
+        layout[column] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    header = json.dumps(layout).encode()
+    start = -(-(HEADER.size + len(header)) // ALIGN) * ALIGN
+
+    size = start + max(offset, 1)
+    with _registry() as table:
+        _evict(table, size)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _untrack(shm)
+        _use(table, name, size, True)
+    shm.buf[HEADER.size:HEADER.size + len(header)] = header
+    for column, arr in columns.items():
+        entry = layout[column]
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=start + entry["offset"])
+        view[...] = arr
+    # Ready flag last, an unready segment is one whose creator died writing it.
+    HEADER.pack_into(shm.buf, 0, 1, len(header))
+    return shm
+
+
+def _attach(name):
+    """
+    Map an existing segment, or return None if there is none. Called with the
+    segment's lock held, which its creator holds until the segment is ready,
+    so an unready segment is left over from a crash: it is unlinked and
+    decoded again. A segment its creator died before sizing cannot even be
+    mapped (ValueError), load_shared() reads that frame privately.
+    """
+    with _registry() as table:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        if HEADER.unpack_from(shm.buf, 0)[0]:
+            _untrack(shm)
+            _use(table, name, shm.size, True)
+            return shm
+        print(f"[SharedCache] Removing unfinished segment {name}")
+        shm.close()
+        shm.unlink()
+        table.pop(name, None)
+        return None
+
+
+def _columns(shm):
+    _, length = HEADER.unpack_from(shm.buf, 0)
+    layout = json.loads(bytes(shm.buf[HEADER.size:HEADER.size + length]))
+    start = -(-(HEADER.size + length) // ALIGN) * ALIGN
+    return {column: np.ndarray(entry["shape"], dtype=np.dtype(entry["dtype"]), buffer=shm.buf,
+                               offset=start + entry["offset"])
+            for column, entry in layout.items()}
+
+
+def load_shared(path):
+    """
+    vtkUnstructuredGrid for path, backed by the machine-wide shared segment of
+    that file (decoded and published first if no session has done it yet).
+    """
+    name = segment_name(path)
+    with _lock:
+        _close_released()
+        if name in _closing:
+            # Released but still mapped here, take it back.
+            _mapped[name] = [_closing.pop(name), 0]
+        mapped = name in _mapped
+    shm = None
+    if not mapped:
+        # One creator per segment; everyone else attaches.
+        lock_path = os.path.join(tempfile.gettempdir(), name + ".lock")
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                shm = _attach(name) or _create(name, path)
+            except ValueError:
+                print(f"[SharedCache] Segment {name} is empty and cannot be replaced, "
+                      f"reading {os.path.basename(path)} privately")
+                return read_vtu(path)
+    with _lock:
+        if name in _closing:
+            _mapped[name] = [_closing.pop(name), 0]
+        if name not in _mapped:
+            _mapped[name], shm = [shm, 0], None
+        _mapped[name][1] += 1
+        segment = _mapped[name][0]
+    if shm is not None:
+        shm.close()   # another thread of this process mapped it in the meantime
+
+    columns = _columns(segment)
+    grid = vtk.vtkUnstructuredGrid()
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(columns.pop("points"), deep=False))
+    grid.SetPoints(points)
+
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(columns.pop("@offsets"), deep=False),
+                  numpy_support.numpy_to_vtkIdTypeArray(columns.pop("@connectivity"), deep=False))
+    types = numpy_support.numpy_to_vtk(columns.pop("@types"), deep=False,
+                                       array_type=vtk.VTK_UNSIGNED_CHAR)
+    grid.SetCells(types, cells)
+
+    for column, arr in columns.items():
+        vtk_arr = numpy_support.numpy_to_vtk(arr, deep=False)
+        vtk_arr.SetName(column)
+        grid.GetPointData().AddArray(vtk_arr)
+    with _lock:
+        # By id, with a weak reference to tell a reused id apart; the entry goes with the grid.
+        key = id(grid)
+        _grids[key] = (weakref.ref(grid, lambda _, key=key: _grids.pop(key, None)), name)
+    return grid
+
+
+def release(grid):
+    """
+    A grid from load_shared() is no longer cached. The segment is unmapped
+    once no grid of this process uses it, so other sessions may evict it.
+    """
+    with _lock:
+        ref, name = _grids.get(id(grid), (None, None))
+        if ref is None or ref() is not grid:
+            return
+        del _grids[id(grid)]
+        if name not in _mapped:
+            return
+        _mapped[name][1] -= 1
+        if _mapped[name][1] <= 0:
+            _closing[name] = _mapped.pop(name)[0]
+        _close_released()
+
+
+def _close_released():
+    # Called with _lock held. A segment can only be closed once the VTK arrays
+    # wrapping it are gone (the producer may still show the frame), so this is retried.
+    closed = []
+    for name, shm in list(_closing.items()):
+        try:
+            shm.close()
+        except BufferError:
+            continue
+        closed.append(name)
+        del _closing[name]
+    if closed:
+        with _registry() as table:
+            for name in closed:
+                if name in table:
+                    _use(table, name, 0, False)
+
+
+def clear():
+    """Unlink every segment in the registry (call once no session uses them any more)."""
+    removed = 0
+    names = set(_mapped) | set(_closing)
+    for shm in [m[0] for m in _mapped.values()] + list(_closing.values()):
+        try:
+            shm.close()
+        except BufferError:
+            pass  # still wrapped by VTK arrays in this process; unlinking below is enough
+    _mapped.clear()
+    _closing.clear()
+    with _registry() as table:
+        names |= set(table)
+        table.clear()
+    for name in sorted(names):
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except (FileNotFoundError, ValueError):
+            continue
+        shm.close()
+        shm.unlink()
+        removed += 1
+        lock_path = os.path.join(tempfile.gettempdir(), name + ".lock")
+        if os.path.exists(lock_path):
+            os.remove(lock_path)
+    for path in (REGISTRY, REGISTRY + ".tmp", REGISTRY + ".lock"):
+        if os.path.exists(path):
+            os.remove(path)
+    return removed
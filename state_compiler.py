@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+"""
+Compiled ParaView state files.
+
+A .pvsm saved by ParaView is mostly default proxies (glyph type sources, axes
+grids, implicit functions nobody uses, one lookup table per array ever colored
+by). compile_state() keeps only what the viewer needs: the pipeline proxies and
+their properties, the visible representations, their color maps and scalar
+bars, the camera and the animation time. The result is cached as JSON under
+state_files/.cache, keyed by the hash of the state file, and build_state()
+rebuilds the pipeline from it without going through LoadState.
+
+File names are stored without their folder and resolved against the data
+path at build time. When the data path is a run packed into one file by
+utils/vtu_to_vtkhdf.py, the .vtu series reader is swapped for a VTKHDF reader.
+
+    python state_compiler.py state_files/*.pvsm
+    pvpython state_compiler.py --benchmark state_files/isostate.pvsm
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+COMPILER_VERSION = 1
+
+# Properties ParaView computes from the data; they are in the file but never set.
+INFO_PROPERTIES = ("TimestepValues", "TimeRange", "FileNameInfo", "TimeArrayInfo",
+                   "PointArrayInfo", "CellArrayInfo", "InputBounds")
+
+# .vtu series readers that a packed .vtkhdf run (utils/vtu_to_vtkhdf.py) stands in for.
+SERIES_READERS = ("XMLUnstructuredGridReader",)
+PACKED_READER = "VTKHDFReader"
+
+REPRESENTATION_PROPERTIES = (
+    "Visibility", "Representation", "ColorArrayName", "Opacity", "PointSize", "LineWidth",
+    "DiffuseColor", "AmbientColor", "Specular", "RenderPointsAsSpheres", "MapScalars",
+    "InterpolateScalarsBeforeMapping", "ScaleFactor", "GaussianRadius", "ShaderPreset",
+    "SelectScaleArray", "OpacityArray", "OpacityArrayName",
+)
+LUT_PROPERTIES = (
+    "RGBPoints", "ColorSpace", "NanColor", "NanOpacity", "UseLogScale", "Discretize",
+    "NumberOfTableValues", "AutomaticRescaleRangeMode", "ScalarRangeInitialized",
+    "AboveRangeColor", "BelowRangeColor", "UseAboveRangeColor", "UseBelowRangeColor",
+    "EnableOpacityMapping", "InterpretValuesAsCategories", "Annotations", "IndexedColors",
+)
+PWF_PROPERTIES = ("Points", "ScalarRangeInitialized", "AllowDuplicateScalars")
+SCALAR_BAR_PROPERTIES = (
+    "Visibility", "Title", "ComponentTitle", "WindowLocation", "Position", "ScalarBarLength",
+    "Orientation", "TitleFontSize", "LabelFontSize", "TitleColor", "LabelColor",
+)
+VIEW_PROPERTIES = (
+    "CameraPosition", "CameraFocalPoint", "CameraViewUp", "CameraViewAngle",
+    "CameraParallelScale", "CameraParallelProjection", "CenterOfRotation",
+    "Background", "Background2", "BackgroundColorMode", "UseColorPaletteForBackground",
+    "OrientationAxesVisibility", "CenterAxesVisibility",
+)
+
+
+# ---------------------------------------------------------------------------
+# Compiling (plain XML, no ParaView needed)
+# ---------------------------------------------------------------------------
+
+def _elements(prop):
+    return [e.get("value") for e in prop.findall("Element")]
+
+
+def _values(proxy, names=None):
+    """Element values of a proxy's properties, optionally restricted to names."""
+    values = {}
+    for prop in proxy.findall("Property"):
+        name = prop.get("name")
+        if (names is not None and name not in names) or name in INFO_PROPERTIES:
+            continue
+        elements = _elements(prop)
+        if elements or prop.get("number_of_elements") == "0":
+            values[name] = elements
+    return values
+
+
+def _proxy_refs(prop):
+    return [(p.get("value"), int(p.get("output_port", 0))) for p in prop.findall("Proxy")]
+
+
+def compile_state(statepath):
+    """Extract the viewer-relevant part of a .pvsm into a JSON-able dict."""
+    root = ET.parse(statepath).getroot()
+    sm = root.find("ServerManagerState")
+    by_id = {p.get("id"): p for p in sm.findall("Proxy")}
+    collections = {c.get("name"): [(i.get("id"), i.get("name")) for i in c.findall("Item")]
+                   for c in sm.findall("ProxyCollection")}
+
+    pipeline_ids = [pid for pid, _ in collections.get("sources", [])]
+    names = dict(collections.get("sources", []))
+
+    sources = []
+    for pid in pipeline_ids:
+        proxy = by_id[pid]
+        entry = {"id": pid, "name": names[pid], "group": proxy.get("group"), "type": proxy.get("type"),
+                 "inputs": {}, "properties": {}, "subproxies": {}}
+        for prop in proxy.findall("Property"):
+            pname = prop.get("name")
+            refs = _proxy_refs(prop)
+            if refs and all(ref in pipeline_ids for ref, _ in refs):
+                entry["inputs"][pname] = refs
+            elif refs:
+                # A sub-proxy picked from a proxy list (clip plane, glyph type, ...).
+                target = by_id.get(refs[0][0])
+                if target is not None and prop.find("Domain[@name='proxy_list']") is not None:
+                    entry["subproxies"][pname] = {"type": target.get("type"), "properties": _values(target)}
+            elif pname not in INFO_PROPERTIES:
+                elements = _elements(prop)
+                if elements:
+                    if pname == "FileName":
+                        # Resolved against the data directory at build time, like LoadState does.
+                        elements = [os.path.basename(e) for e in elements]
+                    entry["properties"][pname] = elements
+        sources.append(entry)
+
+    # Topological order, so inputs always exist before their consumers.
+    ordered, done = [], set()
+    def visit(entry):
+        if entry["id"] in done:
+            return
+        done.add(entry["id"])
+        for refs in entry["inputs"].values():
+            for ref, _ in refs:
+                visit(next(s for s in sources if s["id"] == ref))
+        ordered.append(entry)
+    for entry in sources:
+        visit(entry)
+
+    view_id = next(iter(collections.get("views", [])), (None, None))[0]
+    view = by_id[view_id] if view_id else None
+
+    luts, representations, scalar_bars = {}, [], []
+    def lut_ref(rep, prop_name, kind):
+        prop = rep.find(f"Property[@name='{prop_name}']")
+        refs = _proxy_refs(prop) if prop is not None else []
+        if not refs or refs[0][0] not in by_id:
+            return None
+        ref = refs[0][0]
+        if ref not in luts:
+            names = LUT_PROPERTIES if kind == "lut" else PWF_PROPERTIES
+            luts[ref] = {"kind": kind, "type": by_id[ref].get("type"), "properties": _values(by_id[ref], names)}
+        return ref
+
+    visible = set()
+    if view is not None:
+        reps_prop = view.find("Property[@name='Representations']")
+        visible = {ref for ref, _ in _proxy_refs(reps_prop)} if reps_prop is not None else set()
+
+    for rid, _ in collections.get("representations", []):
+        rep = by_id[rid]
+        input_prop = rep.find("Property[@name='Input']")
+        refs = _proxy_refs(input_prop) if input_prop is not None else []
+        if not refs or refs[0][0] not in pipeline_ids or rid not in visible:
+            continue
+        values = _values(rep, REPRESENTATION_PROPERTIES)
+        if values.get("Visibility") != ["1"]:
+            continue
+        representations.append({
+            "input": refs[0],
+            "type": rep.get("type"),
+            "properties": values,
+            "lut": lut_ref(rep, "LookupTable", "lut"),
+            "pwf": lut_ref(rep, "ScalarOpacityFunction", "pwf"),
+        })
+
+    for bid, _ in collections.get("scalar_bars", []):
+        bar = by_id[bid]
+        values = _values(bar, SCALAR_BAR_PROPERTIES)
+        if values.get("Visibility") != ["1"]:
+            continue
+        prop = bar.find("Property[@name='LookupTable']")
+        refs = _proxy_refs(prop) if prop is not None else []
+        if refs and refs[0][0] in luts:
+            scalar_bars.append({"lut": refs[0][0], "properties": values})
+
+    scene = next((p for p in sm.findall("Proxy") if p.get("type") == "AnimationScene"), None)
+    time_prop = scene.find("Property[@name='AnimationTime']") if scene is not None else None
+
+    return {
+        "version": COMPILER_VERSION,
+        "statefile": os.path.basename(statepath),
+        "sources": ordered,
+        "representations": representations,
+        "luts": luts,
+        "scalar_bars": scalar_bars,
+        "view": _values(view, VIEW_PROPERTIES) if view is not None else {},
+        "animation_time": float(_elements(time_prop)[0]) if time_prop is not None else None,
+    }
+
+
+def state_hash(statepath):
+    digest = hashlib.sha256()
+    with open(statepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(statepath, digest, cache_dir=None):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(statepath)), ".cache")
+    stem = os.path.splitext(os.path.basename(statepath))[0]
+    return os.path.join(cache_dir, f"{stem}.v{COMPILER_VERSION}.{digest[:16]}.json")
+
+
+def load_compiled(statepath, cache_dir=None):
+    """The compiled description of a state file, compiling and caching it if needed."""
+    path = cache_path(statepath, state_hash(statepath), cache_dir)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    description = compile_state(statepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(description, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return description
+
+
+# ---------------------------------------------------------------------------
+# Building (needs ParaView)
+# ---------------------------------------------------------------------------
+
+def _set_values(smproxy, values):
+    """Set raw string element values on a vtkSMProxy, converting by property type."""
+    for name, elements in values.items():
+        prop = smproxy.GetProperty(name)
+        if prop is None or prop.GetInformationOnly():
+            continue
+        kind = prop.GetClassName()
+        if kind in ("vtkSMDoubleVectorProperty",):
+            convert = float
+        elif kind in ("vtkSMIntVectorProperty", "vtkSMIdTypeVectorProperty"):
+            convert = lambda v: int(float(v))
+        elif kind == "vtkSMStringVectorProperty":
+            convert = str
+        else:
+            continue
+        prop.SetNumberOfElements(len(elements))
+        for i, value in enumerate(elements):
+            prop.SetElement(i, convert(value))
+    smproxy.UpdateVTKObjects()
+
+
+def _select_subproxy(smproxy, name, sub):
+    """Pick the proxy of the recorded type from a proxy list domain and set its properties."""
+    prop = smproxy.GetProperty(name)
+    domain = prop.FindDomain("vtkSMProxyListDomain") if prop is not None else None
+    if domain is None:
+        return
+    for i in range(domain.GetNumberOfProxies()):
+        candidate = domain.GetProxy(i)
+        if candidate.GetXMLName() == sub["type"]:
+            prop.SetProxy(0, candidate)
+            _set_values(candidate, sub["properties"])
+            smproxy.UpdateVTKObjects()
+            return
+
+
+def _packed_mismatch(packed, names):
+    """Why the packed run is not the series of .vtu files names (None if it is or cannot be checked)."""
+    try:
+        from utils.vtu_to_vtkhdf import source_files
+    except ImportError as e:
+        print(f"Cannot check which files {os.path.basename(packed)} was packed from ({e})")
+        return None
+    packed_names = source_files(packed)
+    if packed_names is None:
+        return "does not list the files it was packed from"
+    if packed_names != names:
+        return f"was packed from other files ({len(packed_names)}) than the {len(names)} the state reads"
+    # The .vtu files may have been regenerated since (same names, new data).
+    folder = os.path.splitext(packed)[0]
+    packed_mtime = os.path.getmtime(packed)
+    for name in names:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and os.path.getmtime(path) > packed_mtime:
+            return f"is older than {name}"
+    return None
+
+
+def _packed_reader(entry, packed):
+    """A VTKHDF reader of the packed run, if it was packed from the files the series entry reads."""
+    from paraview import servermanager
+
+    names = [os.path.basename(f) for f in entry["properties"].get("FileName", [])]
+    mismatch = _packed_mismatch(packed, names)
+    if mismatch:
+        print(f"{os.path.basename(packed)} {mismatch}; reading the .vtu files instead")
+        return None
+    smproxy = servermanager.CreateProxy("sources", PACKED_READER)
+    if smproxy is None:
+        print(f"This ParaView has no {PACKED_READER}, reading the .vtu files instead")
+        return None
+    _set_values(smproxy, {"FileName": [packed]})
+    smproxy.UpdatePipelineInformation()
+    steps = smproxy.GetProperty("TimestepValues").GetNumberOfElements()
+    if steps != len(entry["properties"].get("FileName", [])):
+        print(f"{os.path.basename(packed)} has {steps} steps, {entry['name']} reads "
+              f"{len(entry['properties'].get('FileName', []))} files; reading the .vtu files instead")
+        return None
+    return smproxy
+
+
+def build_state(description, data_directory):
+    """
+    Rebuild a compiled state in the current session. Returns (sources, view)
+    in the same shape as simple.GetSources() / a render view. data_directory
+    is a folder of data files or a .vtkhdf file packed from one.
+    """
+    from paraview import simple, servermanager
+
+    packed = data_directory if os.path.isfile(data_directory) else None
+    if packed:
+        data_directory = os.path.splitext(packed)[0]
+
+    controller = servermanager.ParaViewPipelineController()
+    proxies, sources = {}, {}
+    for entry in description["sources"]:
+        smproxy = None
+        if packed and entry["type"] in SERIES_READERS:
+            smproxy = _packed_reader(entry, packed)
+        values = dict(entry["properties"])
+        if smproxy is not None:
+            values = {"FileName": [packed]}
+        else:
+            smproxy = servermanager.CreateProxy(entry["group"], entry["type"])
+            if "FileName" in values:
+                values["FileName"] = [os.path.join(data_directory, f) for f in values["FileName"]]
+        proxy = servermanager._getPyProxy(smproxy)
+        controller.PreInitializeProxy(proxy)
+        for pname, refs in entry["inputs"].items():
+            prop = proxy.SMProxy.GetProperty(pname)
+            prop.RemoveAllProxies()
+            for ref, port in refs:
+                prop.AddInputConnection(proxies[ref].SMProxy, port)
+        _set_values(proxy.SMProxy, values)
+        if "FileName" in values:
+            proxy.SMProxy.UpdatePipelineInformation()
+        controller.PostInitializeProxy(proxy)
+        for pname, sub in entry["subproxies"].items():
+            _select_subproxy(proxy.SMProxy, pname, sub)
+        controller.RegisterPipelineProxy(proxy, entry["name"])
+        proxies[entry["id"]] = proxy
+        sources[(entry["name"], proxy.GetGlobalIDAsString())] = proxy
+
+    view = simple.CreateView("RenderView")
+
+    # Color maps stay private to this state instead of going through
+    # GetColorTransferFunction, which would share them by array name.
+    luts = {}
+    for lid, lut in description["luts"].items():
+        group = "lookup_tables" if lut["kind"] == "lut" else "piecewise_functions"
+        proxy = servermanager._getPyProxy(servermanager.CreateProxy(group, lut["type"]))
+        controller.InitializeProxy(proxy)
+        _set_values(proxy.SMProxy, lut["properties"])
+        luts[lid] = proxy
+
+    for rep in description["representations"]:
+        display = simple.Show(proxies[rep["input"][0]], view)
+        _set_values(display.SMProxy, rep["properties"])
+        if rep["lut"] in luts:
+            display.LookupTable = luts[rep["lut"]]
+        if rep["pwf"] in luts:
+            display.ScalarOpacityFunction = luts[rep["pwf"]]
+
+    for bar in description["scalar_bars"]:
+        scalar_bar = simple.GetScalarBar(luts[bar["lut"]], view)
+        _set_values(scalar_bar.SMProxy, bar["properties"])
+
+    _set_values(view.SMProxy, description["view"])
+
+    scene = simple.GetAnimationScene()
+    scene.UpdateAnimationUsingDataTimeSteps()
+    if description["animation_time"] is not None:
+        scene.AnimationTime = description["animation_time"]
+    return sources, view
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def recorded_run(statepath):
+    """Name of the folder the state's data files were in when it was saved (data/<run>)."""
+    for element in ET.parse(statepath).iter("Element"):
+        value = element.get("value", "")
+        if value.endswith(".vtu"):
+            return re.split(r"[\\/]", value)[-2]
+    return None
+
+
+def pipeline_snapshot(description, sources, view):
+    """
+    What a load produced, for comparing a compiled build with LoadState: the
+    recorded properties of every pipeline proxy and of the view, and the
+    properties of the visible representations by source name.
+    """
+    def values(smproxy, names):
+        found = {}
+        for name in names:
+            prop = smproxy.GetProperty(name)
+            if prop is None or not hasattr(prop, "GetElement"):
+                continue
+            elements = [prop.GetElement(i) for i in range(prop.GetNumberOfElements())]
+            if name == "FileName":
+                elements = [os.path.basename(e) for e in elements]
+            found[name] = elements
+        return found
+
+    recorded = {entry["name"]: entry for entry in description["sources"]}
+    snapshot = {"view": values(view.SMProxy, description["view"])}
+    names = {}
+    for (name, _), proxy in sources.items():
+        if name in recorded:
+            names[proxy.GetGlobalIDAsString()] = name
+            snapshot[f"source {name}"] = (proxy.GetXMLName(), values(proxy.SMProxy, recorded[name]["properties"]))
+    for rep in view.Representations:
+        source = names.get(rep.Input.GetGlobalIDAsString()) if rep.Input is not None else None
+        if source is not None and rep.Visibility:
+            snapshot[f"display of {source}"] = values(rep.SMProxy, REPRESENTATION_PROPERTIES)
+    return snapshot
+
+
+def benchmark(statepath, data_directory, repeat):
+    """
+    Time LoadState against building from the compiled description, and check
+    that both produce the same pipeline, displays and view (needs pvpython).
+    """
+    from paraview import simple
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            simple.ResetSession()
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    load = timed(lambda: simple.LoadState(statepath, data_directory=data_directory,
+                                          restrict_to_data_directory=True))
+    description = load_compiled(statepath)
+    build = timed(lambda: build_state(description, data_directory))
+    compile_time = timed(lambda: compile_state(statepath))
+    print(f"{os.path.basename(statepath)}: LoadState {load:.3f} s, compiled build {build:.3f} s "
+          f"({load / build:.1f}x), compile {compile_time:.3f} s (once per state file change)")
+
+    simple.ResetSession()
+    simple.LoadState(statepath, data_directory=data_directory, restrict_to_data_directory=True)
+    reference = pipeline_snapshot(description, simple.GetSources(), simple.GetActiveView())
+    simple.ResetSession()
+    built = pipeline_snapshot(description, *build_state(description, data_directory))
+    differences = [key for key in sorted(set(reference) | set(built)) if reference.get(key) != built.get(key)]
+    if differences:
+        print(f"  compiled build differs from LoadState in: {', '.join(differences)}")
+        for key in differences[:5]:
+            print(f"    {key}:\n      LoadState {reference.get(key)}\n      compiled  {built.get(key)}")
+    else:
+        print(f"  compiled build matches LoadState ({len(reference) - 1} sources and displays, view)")
+    return not differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile ParaView state files for the viewer.")
+    parser.add_argument("statefiles", nargs="+", help=".pvsm files to compile")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare LoadState with the compiled build (run with pvpython)")
+    parser.add_argument("--data", help="Data directory for --benchmark (default: data/<run the state was saved with>)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    matches = True
+    for statepath in args.statefiles:
+        start = time.perf_counter()
+        description = load_compiled(statepath)
+        size = len(json.dumps(description, separators=(",", ":")))
+        print(f"{statepath}: {os.path.getsize(statepath) / 1024:.0f} KB -> {size / 1024:.1f} KB, "
+              f"{len(description['sources'])} sources, {len(description['representations'])} representations "
+              f"({time.perf_counter() - start:.3f} s)")
+        if args.benchmark:
+            data = args.data or os.path.join("data", recorded_run(statepath) or "run01")
+            matches = benchmark(os.path.abspath(statepath), os.path.abspath(data), args.repeat) and matches
+    if not matches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+# Prototypes that need trame and ParaView, not tests.
+collect_ignore = ["test_pipeline.py", "state_pipeline.py"]
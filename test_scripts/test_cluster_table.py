@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from cluster_table import COLUMNS, ClusterTable, consolidate, write_frame_rows
+
+# Tracked labels per frame; run_2 has no clusters and run_3 never wrote rows.
+FRAMES = {
+    "run_0.vtu": [0, 1],
+    "run_1.vtu": [1, 2, 0],
+    "run_2.vtu": [],
+    "run_3.vtu": None,
+    "run_4.vtu": [2, 3],
+}
+
+
+def rows(labels, frame):
+    labels = np.array(labels, dtype=np.int64)
+    columns = {c: np.zeros(len(labels)) for c in COLUMNS}
+    columns["label"] = labels
+    # Encode frame and label in the count so rows can be told apart.
+    columns["count"] = 100 * frame + labels
+    return columns
+
+
+@pytest.fixture
+def table(tmp_path):
+    for frame, (name, labels) in enumerate(FRAMES.items()):
+        if labels is not None:
+            write_frame_rows(str(tmp_path), name, rows(labels, frame))
+    consolidate(str(tmp_path), list(FRAMES))
+    return ClusterTable.load(str(tmp_path))
+
+
+def test_load(table):
+    assert len(table) == 7
+    assert table.frame_names == list(FRAMES)
+
+
+def test_track(table):
+    track = table.track(0)
+    assert track["frame"].tolist() == [0, 1]
+    assert track["count"].tolist() == [0, 100]
+    assert table.track(2)["frame"].tolist() == [1, 4]
+    assert len(table.track(99)["label"]) == 0
+
+
+def test_frame(table):
+    frame = table.frame(1)
+    assert sorted(frame["label"].tolist()) == [0, 1, 2]
+    assert sorted(table.frame("run_4.vtu")["count"].tolist()) == [402, 403]
+    assert len(table.frame(2)["label"]) == 0
+
+
+def test_count_per_frame(table):
+    frames, counts = table.count_per_frame()
+    assert frames.tolist() == [0, 1, 2, 3, 4]
+    assert counts.tolist() == [2, 3, 0, 0, 2]
+
+
+def test_track_lengths_and_spans(table):
+    labels, lengths = table.track_lengths()
+    assert dict(zip(labels.tolist(), lengths.tolist())) == {0: 2, 1: 2, 2: 2, 3: 1}
+    labels, first, last = table.track_spans()
+    assert dict(zip(labels.tolist(), zip(first.tolist(), last.tolist()))) == {
+        0: (0, 1), 1: (0, 1), 2: (1, 4), 3: (4, 4)}
+
+
+def test_empty_run(tmp_path):
+    consolidate(str(tmp_path), ["run_0.vtu"])
+    table = ClusterTable.load(str(tmp_path))
+    assert len(table) == 0
+    assert table.count_per_frame()[1].tolist() == [0]
+    assert len(table.track(0)["label"]) == 0
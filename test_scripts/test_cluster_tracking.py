@@ -0,0 +1,47 @@
+import numpy as np
+
+from DBSCAN import ClusterTracker, match_centroids
+
+
+def test_match_centroids_is_one_to_one():
+    previous = np.array([[0.0, 0, 0], [1.0, 0, 0]])
+    # Both current clusters are within reach of both previous ones; the
+    # greedy nearest choice would give previous 0 to both.
+    current = np.array([[0.4, 0, 0], [0.45, 0, 0]])
+    rows, cols = match_centroids(current, previous, max_distance=1.0)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 0), (1, 1)]
+
+
+def test_match_centroids_respects_max_distance():
+    previous = np.array([[0.0, 0, 0], [10.0, 0, 0]])
+    current = np.array([[0.5, 0, 0], [20.0, 0, 0]])
+    rows, cols = match_centroids(current, previous, max_distance=1.0)
+    assert rows.tolist() == [0] and cols.tolist() == [0]
+
+
+def test_match_centroids_empty():
+    rows, cols = match_centroids(np.empty((0, 3)), np.zeros((2, 3)), 1.0)
+    assert len(rows) == 0 and len(cols) == 0
+
+
+def test_tracker_follows_clusters_across_frames():
+    tracker = ClusterTracker(match_distance=1.0)
+    first = tracker.update([[0, 0, 0], [5, 0, 0]])
+    assert first.tolist() == [0, 1]
+
+    # Listed in the other order, both moved a little, plus a new one.
+    second = tracker.update([[5.3, 0, 0], [9, 9, 9], [0.2, 0, 0]])
+    assert second.tolist() == [1, 2, 0]
+
+    # Cluster 1 disappears; labels are never reused.
+    third = tracker.update([[0.3, 0, 0], [9, 9, 9.5], [20, 0, 0]])
+    assert third.tolist() == [0, 2, 3]
+
+
+def test_tracker_state_round_trip():
+    tracker = ClusterTracker(match_distance=1.0)
+    tracker.update([[0, 0, 0], [5, 0, 0]])
+    restored = ClusterTracker(match_distance=1.0)
+    restored.set_state(tracker.get_state())
+    frame = [[5.1, 0, 0], [7, 7, 7]]
+    assert restored.update(frame).tolist() == tracker.update(frame).tolist()
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from vtk.util import numpy_support
+
+from range_index import RangeIndex, masked_extract
+
+
+def columns(seed=0, n=5000):
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.gamma(2.0, 0.5, n), 2)    # plenty of ties
+    values[rng.choice(n, 50, replace=False)] = np.nan
+    points = rng.uniform(-1, 1, size=(n, 3))
+    return {"values": values, "points": points, "arrays": {"concentration": values}, "active": "concentration"}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return RangeIndex(columns())
+
+
+RANGES = [
+    (0.5, 1.5),
+    (1.0, 1.0),             # a single tied value
+    (-5.0, 0.0),            # below everything
+    (100.0, 200.0),         # above everything
+    (-np.inf, np.inf),      # every finite value
+    (2.0, 1.0),             # empty
+    (0.0, 10.0),
+]
+
+
+@pytest.mark.parametrize("lower, upper", RANGES)
+def test_bounds_match_mask(index, lower, upper):
+    start, stop = index.bounds(lower, upper)
+    mask = (index.values >= lower) & (index.values <= upper)
+    assert np.array_equal(np.flatnonzero(mask), np.arange(start, stop))
+    assert index.count(lower, upper) == np.count_nonzero(mask)
+
+
+def test_bounds_on_bin_edges_and_ties(index):
+    for value in np.concatenate([index.edges[::37], np.unique(index.values[:index.finite])[::7]]):
+        start, stop = index.bounds(value, value)
+        assert stop - start == np.count_nonzero(index.values == value)
+        assert index.position(value) == np.searchsorted(index.values[:index.finite], value)
+
+
+@pytest.mark.parametrize("ranges", [
+    [(0.5, 1.0), (2.0, 3.0)],
+    [(0.5, 1.5), (1.0, 2.0)],           # overlapping
+    [(2.0, 3.0), (0.5, 1.0), (1.01, 1.5)],  # unsorted and adjacent
+    [(2.0, 1.0), (100.0, 200.0)],       # nothing
+])
+def test_intervals_match_mask(index, ranges):
+    intervals = index.intervals(ranges)
+    mask = np.zeros(len(index), dtype=bool)
+    for lower, upper in ranges:
+        mask |= (index.values >= lower) & (index.values <= upper)
+    selected = np.concatenate([np.arange(start, stop) for start, stop in intervals] or [np.arange(0)])
+    assert np.array_equal(selected, np.flatnonzero(mask))
+    # Sorted and disjoint, not even touching.
+    assert all(a[1] < b[0] for a, b in zip(intervals, intervals[1:]))
+
+
+def sorted_points(output):
+    points = numpy_support.vtk_to_numpy(output.GetPoints().GetData())
+    return points[np.lexsort(points.T)]
+
+
+@pytest.mark.parametrize("plane", [
+    None,
+    ((0.2, 0, 0), (1, 0, 0), True),
+    ((0, -0.3, 0), (0, 1, 0), False),
+    ((0.1, 0.1, 0), (1, 1, 0), True),   # oblique
+])
+@pytest.mark.parametrize("build_axis", [False, True])
+def test_extract_matches_masked_extract(plane, build_axis):
+    data = columns(seed=1)
+    index = RangeIndex(data)
+    expected = masked_extract(data, 0.5, 1.5, plane=plane, extra_ranges=[(3.0, 4.0)])
+    output = index.extract(0.5, 1.5, plane=plane, extra_ranges=[(3.0, 4.0)], build_axis=build_axis)
+    assert output.GetNumberOfVerts() == output.GetNumberOfPoints() == expected.GetNumberOfPoints()
+    assert np.array_equal(sorted_points(output), sorted_points(expected))
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from run_manifest import RunManifest, file_fingerprint, frame_name, output_stat, state_digest
+
+PARAMS = {"concentration_cutoff": 0.1, "concentration_weight": 1.0, "eps": 0.5, "min_samples": 10,
+          "voxel_size": None, "max_points": None, "match_distance": 2.0}
+INITIAL_STATE = {"next_label": 0, "labels": [], "centroids": []}
+
+
+@pytest.fixture
+def run(tmp_path):
+    """Three input frames and an output folder."""
+    inputs = []
+    for i in range(3):
+        path = tmp_path / f"run_{i}.vtu"
+        path.write_bytes(f"frame {i}".encode())
+        inputs.append(str(path))
+    output = tmp_path / "out"
+    output.mkdir()
+    return inputs, str(output)
+
+
+def process(inputs, output, params=PARAMS, manifest=None):
+    """
+    Plan a run and carry it out the way DBSCAN.py does: write every frame that
+    is not skipped and record it with the tracking state around it. The
+    tracking state after a frame just names the frame and the input before it.
+    Returns the job kinds.
+    """
+    manifest = manifest or RunManifest.load(output)
+    jobs = manifest.plan(inputs, output, params, INITIAL_STATE)
+    state = INITIAL_STATE
+    for kind, infile, outfile, fingerprint in jobs:
+        entry = manifest.frames.get(frame_name(infile))
+        if kind == "skip":
+            state = entry["tracker_out"]
+            continue
+        with open(outfile, "w") as f:
+            f.write(f"{kind} {infile}")
+        tracker_out = {"after": frame_name(infile), "input": state_digest(state, params)}
+        manifest.record(frame_name(infile), {
+            # New frames get their fingerprint from the worker that clusters them.
+            "input": fingerprint or file_fingerprint(infile),
+            "output": output_stat(outfile),
+            "tracker_in": state_digest(state, params),
+            "tracker_out": tracker_out,
+        })
+        state = tracker_out
+    manifest.save()
+    return [job[0] for job in jobs]
+
+
+def test_first_run_clusters_everything(run):
+    inputs, output = run
+    assert process(inputs, output) == ["cluster"] * 3
+    assert os.path.exists(os.path.join(output, "manifest.json"))
+
+
+def test_unchanged_rerun_skips_everything(run):
+    inputs, output = run
+    process(inputs, output)
+    assert process(inputs, output) == ["skip"] * 3
+
+
+def test_changed_input_reclusters_it_and_retracks_the_rest(run):
+    inputs, output = run
+    process(inputs, output)
+    with open(inputs[1], "wb") as f:
+        f.write(b"frame 1, changed")
+    assert process(inputs, output) == ["skip", "cluster", "reload"]
+    assert process(inputs, output) == ["skip"] * 3
+
+
+def test_touched_but_identical_input_is_skipped(run):
+    inputs, output = run
+    process(inputs, output)
+    st = os.stat(inputs[0])
+    os.utime(inputs[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert process(inputs, output) == ["skip"] * 3
+
+
+def test_missing_output_is_reclustered(run):
+    inputs, output = run
+    process(inputs, output)
+    os.remove(os.path.join(output, "run_2.vtu"))
+    assert process(inputs, output) == ["skip", "skip", "cluster"]
+
+
+def test_tracking_parameter_change_retracks_everything(run):
+    inputs, output = run
+    process(inputs, output)
+    assert process(inputs, output, dict(PARAMS, match_distance=3.0)) == ["reload"] * 3
+
+
+def test_cluster_parameter_change_reclusters_everything(run):
+    inputs, output = run
+    process(inputs, output)
+    assert process(inputs, output, dict(PARAMS, eps=0.7)) == ["cluster"] * 3
+
+
+def test_new_frame_is_clustered_and_removed_frames_are_dropped(run, tmp_path):
+    inputs, output = run
+    process(inputs, output)
+    extra = tmp_path / "run_3.vtu"
+    extra.write_bytes(b"frame 3")
+    assert process(inputs[1:] + [str(extra)], output) == ["reload", "reload", "cluster"]
+    assert sorted(RunManifest.load(output).frames) == ["run_1.vtu", "run_2.vtu", "run_3.vtu"]
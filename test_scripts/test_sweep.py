@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+from DBSCAN import fit_dbscan, sweep_labels, voxel_reduce
+
+
+def blobs(seed=0, per_blob=60):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0, 0, 0, 0], [3, 3, 0, 1], [0, 4, 4, 0]])
+    points = np.concatenate([c + rng.normal(scale=0.3, size=(per_blob, 4)) for c in centers])
+    noise = rng.uniform(-2, 6, size=(20, 4))
+    return np.concatenate([points, noise])
+
+
+def same_clusters(a, b):
+    """Equal labelings up to a renumbering of the clusters (noise stays -1)."""
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return (len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+            and all((x == -1) == (y == -1) for x, y in pairs))
+
+
+def test_voxel_reduce_representatives():
+    features = blobs()
+    reps, weights, inverse, size = voxel_reduce(features, voxel_size=0.5)
+    assert size == 0.5
+    assert weights.sum() == len(features)
+    assert np.array_equal(np.bincount(inverse), weights)
+    for v in (0, len(reps) // 2, len(reps) - 1):
+        assert np.allclose(reps[v], features[inverse == v].mean(axis=0))
+
+
+def test_voxel_reduce_max_points_caps_voxels():
+    features = blobs()
+    reps, weights, inverse, size = voxel_reduce(features, voxel_size=0.01, max_points=25)
+    assert len(reps) <= 25
+    assert size > 0.01
+    assert weights.sum() == len(features)
+
+
+def test_voxel_fit_matches_direct_fit_on_duplicates():
+    # Every point three times over: a voxel per distinct point, weighted by 3.
+    distinct = blobs()
+    features = np.repeat(distinct, 3, axis=0)
+    params = {"eps": 0.5, "min_samples": 8, "voxel_size": 1e-6}
+    labels, num_fitted, _ = fit_dbscan(features, params)
+    assert num_fitted == len(distinct)
+
+    # Voxels are numbered by grid position, not by first point, so only the
+    # numbering of the clusters may differ.
+    expected = DBSCAN(eps=0.5, min_samples=8).fit(features).labels_
+    assert same_clusters(labels, expected)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_sweep_labels_match_direct_fit(weighted):
+    features = blobs(seed=1)
+    weight = np.random.default_rng(2).integers(1, 4, len(features)) if weighted else None
+    pairs, labels = sweep_labels(features, [0.6, 0.3, 0.45], [4, 10], sample_weight=weight)
+    assert pairs == [(0.3, 4), (0.3, 10), (0.45, 4), (0.45, 10), (0.6, 4), (0.6, 10)]
+    for (eps, min_samples), row in zip(pairs, labels):
+        expected = DBSCAN(eps=eps, min_samples=min_samples).fit(features, sample_weight=weight).labels_
+        assert np.array_equal(row, expected), (eps, min_samples)
@@ -0,0 +1,188 @@
+"""
+Memory-bounded LRU cache of decoded timesteps.
+
+The XML reader re-parses run_n.vtu every time the animation time changes, so
+scrubbing the time slider stutters. TimestepCache keeps decoded frames in
+memory up to a byte budget and reads the next few frames in the direction of
+the scrub on a thread pool (VTK's XML reader releases the GIL while parsing).
+
+Frames are keyed by file path, so visualizations reading the same run share
+their entries.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import vtk
+
+
+def read_vtu(path):
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(path)
+    reader.Update()
+    data = vtk.vtkUnstructuredGrid()
+    data.ShallowCopy(reader.GetOutput())
+    return data
+
+
+def data_bytes(data):
+    return data.GetActualMemorySize() * 1024
+
+
+class TimestepCache:
+
+    def __init__(self, budget_mb=1024, prefetch=4, workers=2, loader=read_vtu, release=None):
+        """
+        loader(path) decodes one frame (read_vtu, or shared_cache.load_shared across sessions);
+        release(data) is called for every frame the cache drops (shared_cache.release).
+        """
+        self.loader = loader
+        self.release = release
+        self.budget = int(budget_mb * 2**20)
+        self.prefetch = prefetch
+        self.entries = OrderedDict()   # path -> (data, nbytes), least recently used first
+        self.pending = {}              # path -> Future
+        self.bytes = 0
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="timestep-prefetch")
+
+    def _store(self, path, data):
+        """Cache data for path and return the cached frame (the one already there if it was loaded twice)."""
+        nbytes = data_bytes(data)
+        dropped = []
+        with self.lock:
+            if path in self.entries:
+                # A prefetch and a miss read the same frame: keep the first, drop this one.
+                dropped.append(data)
+                data = self.entries[path][0]
+            else:
+                self.entries[path] = (data, nbytes)
+                self.bytes += nbytes
+            # Keep at least the newest entry, even if it alone is over budget.
+            while self.bytes > self.budget and len(self.entries) > 1:
+                _, (evicted, evicted_bytes) = self.entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+                dropped.append(evicted)
+        if self.release is not None:
+            for evicted in dropped:
+                self.release(evicted)
+        return data
+
+    def _load(self, path):
+        return self._store(path, self.loader(path))
+
+    def get(self, path):
+        """Decoded frame for path, from memory if possible."""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[0]
+            future = self.pending.get(path)
+
+        if future is not None:
+            # Already being prefetched, wait for it instead of reading it twice.
+            self.waits += 1
+            data = future.result()
+        else:
+            self.misses += 1
+            data = self._load(path)
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+        return data
+
+    def prefetch_around(self, files, index, direction):
+        """Queue the next `prefetch` frames after index in the scrub direction."""
+        direction = 1 if direction >= 0 else -1
+        for step in range(1, self.prefetch + 1):
+            i = index + direction * step
+            if not 0 <= i < len(files):
+                break
+            path = files[i]
+            with self.lock:
+                if path in self.entries or path in self.pending:
+                    continue
+                future = self.pool.submit(self._load, path)
+                self.pending[path] = future
+            future.add_done_callback(lambda f, path=path: self._done(path))
+
+    def _done(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def stats(self):
+        lookups = self.hits + self.waits + self.misses
+        return {
+            "entries": len(self.entries),
+            "mb": self.bytes / 2**20,
+            "budget_mb": self.budget / 2**20,
+            "hits": self.hits,
+            "waits": self.waits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.waits) / lookups if lookups else 0.0,
+            "pending": len(self.pending),
+        }
+
+    def describe(self):
+        s = self.stats()
+        return (f"Timestep cache: {s['entries']} frames, {s['mb']:.0f}/{s['budget_mb']:.0f} MB, "
+                f"{s['hits']} hits, {s['waits']} prefetch waits, {s['misses']} misses "
+                f"({100 * s['hit_rate']:.0f}% hit rate)")
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def reroute_consumers(old, new, view, sources):
+    """Point every filter and representation reading from proxy old at proxy new instead."""
+    for proxy in list(sources.values()) + list(view.Representations):
+        if proxy is new or "Input" not in proxy.ListProperties():
+            continue
+        inputs = proxy.Input if isinstance(proxy.Input, list) else [proxy.Input]
+        if any(getattr(i, "SMProxy", None) is old.SMProxy for i in inputs):
+            replaced = [new if getattr(i, "SMProxy", None) is old.SMProxy else i for i in inputs]
+            proxy.Input = replaced if isinstance(proxy.Input, list) else replaced[0]
+
+
+class CachedTimesteps:
+    """
+    Puts a TimestepCache in front of one reader of a loaded pipeline. The
+    reader's consumers are re-pointed at a trivial producer whose output is
+    swapped for the cached frame on every time change. The reader stays
+    registered, so the animation scene still knows the run's timesteps.
+    """
+
+    def __init__(self, cache, reader, view, sources):
+        from paraview import simple
+
+        self.cache = cache
+        self.reader = reader
+        # A reader of a single file has a plain string for FileName.
+        files = [reader.FileName] if isinstance(reader.FileName, str) else reader.FileName
+        self.files = [os.path.abspath(f) for f in files]
+        self.time_steps = list(reader.TimestepValues) or list(range(len(self.files)))
+        self.index = 0
+
+        self.producer = simple.TrivialProducer(registrationName=f"{reader.GetXMLLabel()}-cached")
+        reroute_consumers(reader, self.producer, view, sources)
+
+    def index_of(self, time_value):
+        # Nearest timestep, the slider can land between them.
+        return min(range(len(self.time_steps)), key=lambda i: abs(self.time_steps[i] - time_value))
+
+    def show(self, time_value):
+        index = self.index_of(time_value)
+        direction = index - self.index
+        self.index = index
+        data = self.cache.get(self.files[index])
+        producer = self.producer.GetClientSideObject()
+        producer.SetOutput(data)
+        producer.Modified()
+        self.producer.MarkModified(self.producer)
+        self.cache.prefetch_around(self.files, index, direction)
@@ -1,21 +1,52 @@
 #!/usr/bin/env python
 import sys, os, glob
+import argparse
+import csv
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice, product
 import vtk
 import numpy as np
 from vtk.util import numpy_support
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+
+import cluster_table
+import vtu_cache
+from run_manifest import RunManifest, file_fingerprint, frame_name, output_stat, state_digest
+from stage_timing import StageTimer, write_report
 
-# ---------------------------
-# Global variable for tracked labels
-global_next_label = 0
-# To store centroids of clusters from the previous time frame,
-# mapping global label -> centroid (as numpy array of shape (3,))
-last_frame_centroids = {}
 
 # Parameters for tracking matching
 # Maximum allowed centroid distance to match clusters between frames
 MATCH_DISTANCE_THRESHOLD = 3.0  # adjust as needed
 
+# Clustering parameters
+CONCENTRATION_CUTOFF = 25  # keep only points with concentration >= cutoff
+CONCENTRATION_WEIGHT = 0.8  # weight of concentration in the feature matrix
+EPS = 0.8  # DBSCAN neighborhood radius
+MIN_SAMPLES = 10  # DBSCAN min_samples
+
+
+# Output encodings for write_vtu: "raw" or the vtkXMLWriter compressor to use
+COMPRESSION_MODES = {
+    "raw": None,
+    "zlib": "SetCompressorTypeToZLib",
+    "lz4": "SetCompressorTypeToLZ4",
+    "lzma": "SetCompressorTypeToLZMA",
+}
+
+# NumPy dtype matching vtkIdType (32 or 64 bit depending on the VTK build)
+VTK_ID_DTYPE = numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE]
+
 
 def load_vtu(filename):
     reader = vtk.vtkXMLUnstructuredGridReader()
@@ -24,28 +55,101 @@ def load_vtu(filename):
     return reader.GetOutput()
 
 
-def write_vtu(data, filename):
+def write_vtu(data, filename, compression="zlib", level=None):
+    """
+    Write an unstructured grid with appended binary data.
+
+    compression is one of COMPRESSION_MODES: "raw" writes the appended data
+    uncompressed and unencoded, the others select the VTK compressor. level
+    is the compressor's level (1-9, VTK default if None).
+    """
     writer = vtk.vtkXMLUnstructuredGridWriter()
     writer.SetFileName(filename)
     writer.SetInputData(data)
+    writer.SetDataModeToAppended()
+    if compression == "raw":
+        writer.SetCompressorTypeToNone()
+        writer.EncodeAppendedDataOff()
+    else:
+        getattr(writer, COMPRESSION_MODES[compression])()
+        if level is not None:
+            writer.SetCompressionLevel(level)
     writer.Write()
 
 
+class FrameWriter:
+    """
+    Writes output frames either inline or on a background thread, so writing
+    frame N overlaps tracking and building frame N+1 (VTK releases the GIL
+    while it compresses and writes). At most max_pending frames wait for the
+    writer; max_pending=0 writes synchronously.
+
+    on_done callbacks always run on the calling thread, in submission order,
+    once the frame is on disk.
+    """
+
+    def __init__(self, compression="zlib", level=None, max_pending=0):
+        self.compression = compression
+        self.level = level
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=1) if max_pending > 0 else None
+        self.pending = deque()
+
+    def _write(self, data, outfile, timer):
+        with timer.stage("write"):
+            # Write next to the target and rename, so a crash never leaves a half-written frame.
+            write_vtu(data, outfile + ".part", self.compression, self.level)
+            os.replace(outfile + ".part", outfile)
+
+    def submit(self, data, outfile, timer, on_done=None):
+        if self.pool is None:
+            self._write(data, outfile, timer)
+            if on_done is not None:
+                on_done()
+            return
+        self.pending.append((self.pool.submit(self._write, data, outfile, timer), on_done))
+        self._drain(max_pending=self.max_pending)
+
+    def _drain(self, max_pending):
+        # Run the callbacks of finished writes, blocking while too many are queued.
+        while self.pending and (len(self.pending) > max_pending or self.pending[0][0].done()):
+            future, on_done = self.pending.popleft()
+            future.result()
+            if on_done is not None:
+                on_done()
+
+    def close(self):
+        self._drain(max_pending=0)
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
 def create_polydata_from_points(points_array, arrays_dict=None):
+    """
+    Build a vtkUnstructuredGrid of vertex cells from an (N, 3) point array.
+    Points and point data wrap the NumPy buffers directly (no per-point loop);
+    numpy_to_vtk keeps a reference to each buffer so they outlive this call.
+    """
     numPts = points_array.shape[0]
+    pts = np.ascontiguousarray(points_array, dtype=np.float32)
     vtk_pts = vtk.vtkPoints()
-    vtk_pts.SetNumberOfPoints(numPts)
-    for i in range(numPts):
-        vtk_pts.SetPoint(i, points_array[i])
+    vtk_pts.SetData(numpy_support.numpy_to_vtk(pts, deep=False))
+
+    # One vertex per point: connectivity is 0..n-1 and offsets are 0..n.
+    offsets = numpy_support.numpy_to_vtkIdTypeArray(
+        np.arange(numPts + 1, dtype=VTK_ID_DTYPE), deep=False)
+    connectivity = numpy_support.numpy_to_vtkIdTypeArray(
+        np.arange(numPts, dtype=VTK_ID_DTYPE), deep=False)
+    cells = vtk.vtkCellArray()
+    cells.SetData(offsets, connectivity)
+
     ug = vtk.vtkUnstructuredGrid()
     ug.SetPoints(vtk_pts)
-    for i in range(numPts):
-        cell = vtk.vtkVertex()
-        cell.GetPointIds().SetId(0, i)
-        ug.InsertNextCell(cell.GetCellType(), cell.GetPointIds())
+    ug.SetCells(vtk.VTK_VERTEX, cells)
     if arrays_dict is not None:
         for name, arr in arrays_dict.items():
-            vtk_arr = numpy_support.numpy_to_vtk(num_array=arr, deep=True, array_type=vtk.VTK_FLOAT)
+            arr = np.ascontiguousarray(arr, dtype=np.float32)
+            vtk_arr = numpy_support.numpy_to_vtk(num_array=arr, deep=False)
             vtk_arr.SetName(name)
             ug.GetPointData().AddArray(vtk_arr)
         if "Tracked_Labels" in arrays_dict:
@@ -55,151 +159,712 @@ def create_polydata_from_points(points_array, arrays_dict=None):
     return ug
 
 
-def assign_tracked_labels(filtered_pts, filtered_conc, cluster_labels):
+def cluster_statistics(filtered_pts, filtered_conc, cluster_labels, velocity=None):
     """
-    Given filtered points, concentrations, and local DBSCAN cluster labels,
-    compute centroids for each cluster and match them to clusters in the previous frame.
-    Return a new array of tracked (global) labels.
+    Per-cluster statistics for one frame, computed in a single vectorized pass
+    instead of one boolean mask per cluster.
+
+    Returns a dict with:
+      ids            unique local labels (noise label -1 included if present)
+      inverse        per-point index into ids
+      counts         number of points in each cluster
+      centroids      (K, 3) mean position of each cluster
+      mean_conc      mean concentration of each cluster
+      max_conc       max concentration of each cluster
+      mean_velocity  (K, 3) mean velocity of each cluster (NaN without velocity)
     """
-    global global_next_label, last_frame_centroids
+    ids, inverse = np.unique(cluster_labels, return_inverse=True)
+    inverse = inverse.astype(np.int32)
+    counts = np.bincount(inverse, minlength=len(ids))
 
-    unique_local_labels = np.unique(cluster_labels)
-    tracked_labels = np.full_like(cluster_labels, -1, dtype=np.int32)
-    current_centroids = {}
+    def cluster_mean(values):
+        return np.bincount(inverse, weights=values, minlength=len(ids)) / counts
 
-    for lab in unique_local_labels:
-        if lab < 0:
-            # Noise stays as -1
-            tracked_labels[cluster_labels == lab] = -1
-            continue
-        # Compute centroid for cluster with local label lab
-        mask_lab = (cluster_labels == lab)
-        pts_lab = filtered_pts[mask_lab]  # shape (n_lab, 3)
-        centroid = np.mean(pts_lab, axis=0)
-        current_centroids[lab] = centroid
-
-        # If this is the very first frame (last_frame_centroids empty),
-        # assign a new global label.
-        if not last_frame_centroids:
-            tracked_labels[mask_lab] = global_next_label
-            # Store the centroid for this global label
-            last_frame_centroids[global_next_label] = centroid
-            global_next_label += 1
-        else:
-            # Try to match this cluster to one from the previous frame.
-            assigned = False
-            best_match_label = None
-            best_match_dist = np.inf
-            for glabel, prev_centroid in last_frame_centroids.items():
-                dist = np.linalg.norm(centroid - prev_centroid)
-                if dist < MATCH_DISTANCE_THRESHOLD and dist < best_match_dist:
-                    best_match_label = glabel
-                    best_match_dist = dist
-            if best_match_label is not None:
-                tracked_labels[mask_lab] = best_match_label
-            else:
-                tracked_labels[mask_lab] = global_next_label
-                last_frame_centroids[global_next_label] = centroid
-                global_next_label += 1
-    # Update last_frame_centroids for next frame.
-    # For simplicity, here we replace the entire mapping by current frame's global labels.
-    # One might instead merge over time to increase robustness.
-    new_last = {}
-    # Recompute new_last mapping: for each unique tracked label in the current frame, compute centroid over the cluster.
-    unique_tracked = np.unique(tracked_labels)
-    for gl in unique_tracked:
-        if gl < 0:
-            continue
-        mask_global = (tracked_labels == gl)
-        centroid_global = np.mean(filtered_pts[mask_global], axis=0)
-        new_last[gl] = centroid_global
-    last_frame_centroids = new_last
+    centroids = np.column_stack([cluster_mean(filtered_pts[:, k]) for k in range(3)])
+    mean_conc = cluster_mean(filtered_conc)
+    if velocity is not None:
+        mean_velocity = np.column_stack([cluster_mean(velocity[:, k]) for k in range(3)])
+    else:
+        mean_velocity = np.full((len(ids), 3), np.nan)
+
+    # Max per cluster: sort points by cluster once and reduce each run.
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]) if len(ids) else np.empty(0, dtype=np.int64)
+    max_conc = np.maximum.reduceat(filtered_conc[order], starts) if len(ids) else np.empty(0)
+    return {
+        "ids": ids,
+        "inverse": inverse,
+        "counts": counts,
+        "centroids": centroids,
+        "mean_conc": mean_conc,
+        "max_conc": max_conc,
+        "mean_velocity": mean_velocity,
+    }
+
+
+def cluster_rows(stats, cluster_global):
+    """Rows of the run's cluster table (see cluster_table.py) for one frame."""
+    keep = stats["ids"] >= 0
+    centroids = stats["centroids"][keep]
+    velocity = stats["mean_velocity"][keep]
+    return {
+        "label": cluster_global[keep].astype(np.int64),
+        "count": stats["counts"][keep].astype(np.int64),
+        "centroid_x": centroids[:, 0],
+        "centroid_y": centroids[:, 1],
+        "centroid_z": centroids[:, 2],
+        "mean_concentration": stats["mean_conc"][keep],
+        "max_concentration": stats["max_conc"][keep].astype(np.float64),
+        "mean_velocity_x": velocity[:, 0],
+        "mean_velocity_y": velocity[:, 1],
+        "mean_velocity_z": velocity[:, 2],
+    }
+
+
+def match_centroids(current, previous, max_distance):
+    """
+    One-to-one matching of current centroids to previous centroids.
+
+    Candidate pairs closer than max_distance come from a KD-tree radius query,
+    so the cost does not grow with the product of the cluster counts. The
+    candidate graph is split into connected components; components with a
+    single candidate pair are accepted directly and the rest are solved with
+    the Hungarian algorithm (linear_sum_assignment), which keeps two clusters
+    from claiming the same previous cluster.
+
+    Returns (rows, cols) index arrays into current and previous.
+    """
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+    if len(current) == 0 or len(previous) == 0:
+        return empty
+
+    pairs = cKDTree(current).sparse_distance_matrix(cKDTree(previous), max_distance, output_type="ndarray")
+    pairs = pairs[pairs["v"] < max_distance]
+    if len(pairs) == 0:
+        return empty
+    rows, cols, dist = pairs["i"], pairs["j"], pairs["v"]
+
+    # Components of the bipartite graph (current nodes first, then previous).
+    n_cur = len(current)
+    n_nodes = n_cur + len(previous)
+    graph = coo_matrix((np.ones(len(rows)), (rows, n_cur + cols)), shape=(n_nodes, n_nodes))
+    _, component = connected_components(graph, directed=False)
+    pair_component = component[rows]
+    pairs_per_component = np.bincount(pair_component)
+
+    single = pairs_per_component[pair_component] == 1
+    matched_rows = [rows[single]]
+    matched_cols = [cols[single]]
 
-    return tracked_labels
+    multi = np.flatnonzero(~single)
+    if len(multi):
+        order = multi[np.argsort(pair_component[multi], kind="stable")]
+        bounds = np.flatnonzero(np.diff(pair_component[order])) + 1
+        # Large finite cost for non-candidates so the solver maximises the
+        # number of real matches before minimising distance.
+        no_match = 1e6 * (max_distance + 1.0)
+        for group in np.split(order, bounds):
+            r_ids, r = np.unique(rows[group], return_inverse=True)
+            c_ids, c = np.unique(cols[group], return_inverse=True)
+            cost = np.full((len(r_ids), len(c_ids)), no_match)
+            cost[r, c] = dist[group]
+            ri, ci = linear_sum_assignment(cost)
+            ok = cost[ri, ci] < max_distance
+            matched_rows.append(r_ids[ri[ok]])
+            matched_cols.append(c_ids[ci[ok]])
 
+    return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+
+class ClusterTracker:
+    """
+    Relates clusters across frames by matching centroids to the clusters of the
+    previous frame. Frames must be passed to update() in order.
+    """
+
+    def __init__(self, match_distance=MATCH_DISTANCE_THRESHOLD):
+        self.match_distance = match_distance
+        self.next_label = 0
+        # Global labels and centroids of the clusters in the previous frame
+        self.prev_labels = np.empty(0, dtype=np.int64)
+        self.prev_centroids = np.empty((0, 3))
+
+    def update(self, centroids):
+        """
+        Assign a global label to each centroid of the current frame. Matched
+        clusters inherit the previous label, unmatched clusters get a new one.
+        Returns an int64 array with one global label per centroid.
+        """
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 3)
+        global_labels = np.full(len(centroids), -1, dtype=np.int64)
+
+        rows, cols = match_centroids(centroids, self.prev_centroids, self.match_distance)
+        global_labels[rows] = self.prev_labels[cols]
+
+        new = global_labels < 0
+        num_new = int(np.count_nonzero(new))
+        global_labels[new] = np.arange(self.next_label, self.next_label + num_new)
+        self.next_label += num_new
+
+        self.prev_labels = global_labels
+        self.prev_centroids = centroids
+        return global_labels
+
+    def get_state(self):
+        """JSON-serializable snapshot of the tracking state."""
+        return {
+            "next_label": int(self.next_label),
+            "labels": self.prev_labels.tolist(),
+            "centroids": self.prev_centroids.tolist(),
+        }
+
+    def set_state(self, state):
+        self.next_label = state["next_label"]
+        self.prev_labels = np.asarray(state["labels"], dtype=np.int64)
+        self.prev_centroids = np.asarray(state["centroids"], dtype=np.float64).reshape(-1, 3)
+
+
+def assign_tracked_labels(tracker, stats):
+    """
+    Given the cluster statistics of a frame, match its clusters to the previous
+    frame and return (tracked label per point, tracked label per cluster).
+    Noise stays -1.
+    """
+    cluster_global = np.full(len(stats["ids"]), -1, dtype=np.int64)
+    is_cluster = stats["ids"] >= 0
+    cluster_global[is_cluster] = tracker.update(stats["centroids"][is_cluster])
+    return cluster_global[stats["inverse"]], cluster_global
+
+
+def read_frame(infile, columns=("points", "concentration", "velocity")):
+    """
+    Arrays of one input frame, keyed by column name ("points" plus point data
+    arrays). infile is either a VTU file or a frame folder of a columnar cache,
+    which is memory-mapped instead of parsed. Missing arrays are left out.
+    """
+    if os.path.isdir(infile):
+        return vtu_cache.load_frame(infile, columns)
 
-def process_file(infile, outfile):
-    print(f"Processing '{infile}'")
     polydata = load_vtu(infile)
-    points = polydata.GetPoints()
-    numPts = points.GetNumberOfPoints()
-    print(f"  Total points: {numPts}")
+    arrays = {}
+    for name in columns:
+        if name == "points":
+            arrays[name] = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+            continue
+        vtk_arr = polydata.GetPointData().GetArray(name)
+        if vtk_arr is not None:
+            arrays[name] = numpy_support.vtk_to_numpy(vtk_arr)
+    return arrays
+
 
-    pts = numpy_support.vtk_to_numpy(points.GetData())
-    concArray = polydata.GetPointData().GetArray("concentration")
-    if concArray is None:
+def load_filtered_frame(infile, concentration_cutoff, timer=None):
+    """
+    Load a frame and keep only the points with concentration >= cutoff.
+    Returns (arrays, mask, filtered_pts, filtered_conc), or None if the
+    frame has no concentration array. With a StageTimer, the two steps are
+    timed as the "load" and "filter" stages.
+    """
+    stage = timer.stage if timer is not None else lambda name: nullcontext()
+    with stage("load"):
+        arrays = read_frame(infile)
+    if "concentration" not in arrays:
         print(f"Error: 'concentration' not found in {infile}!")
-        return
-    conc = numpy_support.vtk_to_numpy(concArray)
+        return None
+
+    # Filter: keep only points with concentration >= cutoff
+    with stage("filter"):
+        conc = arrays["concentration"]
+        mask = conc >= concentration_cutoff
+        return arrays, mask, arrays["points"][mask], conc[mask]
+
+
+def build_features(filtered_pts, filtered_conc, concentration_weight):
+    # Feature matrix: use spatial coordinates and weighted concentration.
+    return np.hstack([filtered_pts, (filtered_conc.reshape(-1, 1) * concentration_weight)])
+
+
+def voxel_reduce(features, voxel_size=None, max_points=None, eps=EPS):
+    """
+    Collapse a feature matrix into one weighted representative per occupied
+    voxel of a uniform grid in feature space.
+
+    voxel_size is the edge length of the grid cells. If max_points is set the
+    cell size grows until at most max_points voxels are occupied (starting from
+    voxel_size, or eps / 4 if no size is given), which caps the cost of the fit
+    no matter how many points the frame has.
+
+    Returns (representatives, weights, inverse, voxel_size): the mean feature
+    vector and point count of every voxel, and the voxel index of every point.
+    """
+    size = voxel_size or eps / 4.0
+    origin = features.min(axis=0)
+    while True:
+        keys = np.floor((features - origin) / size).astype(np.int64)
+        dims = keys.max(axis=0) + 1
+        if np.prod(dims.astype(np.float64)) < 2.0 ** 62:
+            flat = np.ravel_multi_index(keys.T, dims)
+            _, inverse = np.unique(flat, return_inverse=True)
+        else:
+            _, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        num_voxels = int(inverse.max()) + 1
+        if not max_points or num_voxels <= max_points:
+            break
+        # Occupied voxels shrink roughly with size^d; grow by at least 25%.
+        size *= max(1.25, (num_voxels / max_points) ** (1.0 / features.shape[1]))
+
+    weights = np.bincount(inverse, minlength=num_voxels)
+    representatives = np.column_stack([
+        np.bincount(inverse, weights=features[:, k], minlength=num_voxels)
+        for k in range(features.shape[1])
+    ]) / weights[:, None]
+    return representatives, weights, inverse, size
+
+
+def fit_dbscan(features, params):
+    """
+    DBSCAN labels for a feature matrix. With voxel reduction enabled the fit
+    runs on the weighted voxel representatives (sample_weight = points per
+    voxel) and the labels are propagated back to every point through the
+    voxel index. Returns (labels, number of points the fit actually saw,
+    voxel size used or None).
+    """
+    db = DBSCAN(eps=params["eps"], min_samples=params["min_samples"])
+    if not (params.get("voxel_size") or params.get("max_points")):
+        return db.fit_predict(features), features.shape[0], None
+
+    reps, weights, inverse, size = voxel_reduce(features, params.get("voxel_size"),
+                                                params.get("max_points"), params["eps"])
+    rep_labels = db.fit_predict(reps, sample_weight=weights)
+    return rep_labels[inverse], reps.shape[0], size
+
 
-    # Filter: keep only points with concentration >= 25
-    mask = conc >= 25
-    filtered_pts = pts[mask]
-    filtered_conc = conc[mask]
+def cluster_frame(infile, params, fingerprint=None):
+    """
+    Load, filter and cluster a single frame. This has no global state, so it
+    is safe to run in a worker process. Returns a dict with the filtered arrays,
+    the local DBSCAN labels, the per-cluster statistics and the stage timings,
+    or None if the frame has no concentration array.
+    """
+    timer = StageTimer()
+    loaded = load_filtered_frame(infile, params["concentration_cutoff"], timer)
+    if loaded is None:
+        return None
+    arrays, mask, filtered_pts, filtered_conc = loaded
     num_filtered = filtered_pts.shape[0]
-    print(f"  Points after filtering: {num_filtered}")
+
+    frame = {
+        "job": "cluster",
+        "infile": infile,
+        "fingerprint": fingerprint or file_fingerprint(infile),
+        "num_points": mask.shape[0],
+        "num_filtered": num_filtered,
+        "timer": timer,
+    }
     if num_filtered == 0:
-        print("  No points remaining; skipping file.")
-        return
+        return frame
 
-    # Feature matrix: use spatial coordinates and weighted concentration.
-    concentration_weight = 0.8  # adjust as needed
-    features = np.hstack([filtered_pts, (filtered_conc.reshape(-1, 1) * concentration_weight)])
+    with timer.stage("features"):
+        features = build_features(filtered_pts, filtered_conc, params["concentration_weight"])
 
     # DBSCAN clustering on the features
-    eps = 0.8  # adjust neighborhood radius as needed
-    min_samples = 10  # adjust min_samples
-    db = DBSCAN(eps=eps, min_samples=min_samples)
-    cluster_labels = db.fit_predict(features)
-    unique_labels = np.unique(cluster_labels)
-    print(f"  DBSCAN labels: {unique_labels}")
+    with timer.stage("fit"):
+        cluster_labels, frame["num_fitted"], frame["voxel_size"] = fit_dbscan(features, params)
+
+    if "velocity" in arrays:
+        with timer.stage("filter"):
+            frame["velocity"] = arrays["velocity"][mask]
+
+    with timer.stage("stats"):
+        frame["stats"] = cluster_statistics(filtered_pts, filtered_conc, cluster_labels, frame.get("velocity"))
+    frame["filtered_pts"] = filtered_pts
+    frame["filtered_conc"] = filtered_conc
+    frame["cluster_labels"] = cluster_labels
+    return frame
+
+
+def sweep_labels(features, eps_values, min_samples_values, sample_weight=None):
+    """
+    DBSCAN labels for every (eps, min_samples) pair from a single neighbor search.
+
+    The radius graph is computed once at the largest eps; each pair then runs
+    DBSCAN on the precomputed sparse graph, which only has to drop the edges
+    longer than its eps. Returns (pairs, labels) with labels of shape
+    (len(pairs), num_points).
+    """
+    pairs = list(product(sorted(eps_values), sorted(min_samples_values)))
+    graph = NearestNeighbors(radius=max(eps_values)).fit(features).radius_neighbors_graph(
+        features, mode="distance", sort_results=True)
+
+    labels = np.empty((len(pairs), features.shape[0]), dtype=np.int32)
+    for i, (eps, min_samples) in enumerate(pairs):
+        labels[i] = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit_predict(
+            graph, sample_weight=sample_weight)
+    return pairs, labels
+
+
+def sweep_frame(infile, outfile, params, eps_values, min_samples_values):
+    """
+    Parameter sweep for one frame. Writes the label matrix to outfile (.npz)
+    and returns one summary row per (eps, min_samples) pair.
+    """
+    loaded = load_filtered_frame(infile, params["concentration_cutoff"])
+    if loaded is None:
+        return []
+    _, mask, filtered_pts, filtered_conc = loaded
+    if filtered_pts.shape[0] == 0:
+        return []
+
+    features = build_features(filtered_pts, filtered_conc, params["concentration_weight"])
+    if params.get("voxel_size") or params.get("max_points"):
+        reps, weights, inverse, _ = voxel_reduce(features, params.get("voxel_size"),
+                                                 params.get("max_points"), min(eps_values))
+        pairs, labels = sweep_labels(reps, eps_values, min_samples_values, sample_weight=weights)
+        labels = labels[:, inverse]
+    else:
+        pairs, labels = sweep_labels(features, eps_values, min_samples_values)
+    np.savez_compressed(
+        outfile,
+        eps=np.array([p[0] for p in pairs]),
+        min_samples=np.array([p[1] for p in pairs]),
+        point_ids=np.flatnonzero(mask).astype(np.int64),
+        labels=labels,
+    )
+
+    frame = os.path.splitext(frame_name(infile))[0]
+    rows = []
+    for (eps, min_samples), lab in zip(pairs, labels):
+        num_clusters = int(lab.max()) + 1
+        sizes = np.bincount(lab[lab >= 0], minlength=1)
+        rows.append({
+            "frame": frame,
+            "eps": eps,
+            "min_samples": min_samples,
+            "num_clusters": num_clusters,
+            "noise_fraction": float(np.mean(lab < 0)),
+            "largest_cluster": int(sizes.max()),
+        })
+    return rows
+
+
+def run_sweep(input_files, output_folder, params, eps_values, min_samples_values, workers):
+    """
+    Sweep mode: one neighbor search per frame, labels for every parameter pair.
+    Writes sweep/run_n.npz per frame and sweep/summary.csv for the whole run.
+    """
+    sweep_folder = os.path.join(output_folder, "sweep")
+    os.makedirs(sweep_folder, exist_ok=True)
+    outfiles = [os.path.join(sweep_folder, os.path.splitext(frame_name(f))[0] + ".npz")
+                for f in input_files]
+    n = len(input_files)
+
+    print(f"Sweeping eps={sorted(eps_values)} x min_samples={sorted(min_samples_values)} over {n} frames")
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        results = pool.map(sweep_frame, input_files, outfiles, [params] * n,
+                           [eps_values] * n, [min_samples_values] * n)
+        rows = []
+        for infile, frame_rows in zip(input_files, results):
+            print(f"  {frame_name(infile)}: {len(frame_rows)} parameter pairs")
+            rows.extend(frame_rows)
+
+    summary = os.path.join(sweep_folder, "summary.csv")
+    with open(summary, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["frame", "eps", "min_samples", "num_clusters",
+                                               "noise_fraction", "largest_cluster"])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Sweep summary written to: {summary}")
+
+
+def reload_frame(infile, outfile, fingerprint, num_points):
+    """
+    Rebuild a clustered frame from a previously written output file, reusing
+    its DBSCAN labels. Used when only the tracking upstream of a frame changed.
+    """
+    timer = StageTimer()
+    frame = {
+        "job": "reload",
+        "infile": infile,
+        "fingerprint": fingerprint,
+        "num_points": num_points,
+        "num_filtered": 0,
+        "timer": timer,
+    }
+    if not os.path.exists(outfile):
+        # The frame had no points above the cutoff last time either.
+        return frame
+
+    with timer.stage("load"):
+        polydata = load_vtu(outfile)
+        point_data = polydata.GetPointData()
+        filtered_pts = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+        filtered_conc = numpy_support.vtk_to_numpy(point_data.GetArray("concentration"))
+        cluster_labels = numpy_support.vtk_to_numpy(point_data.GetArray("DBSCAN_Labels")).astype(np.int64)
+        velocityArray = point_data.GetArray("velocity")
+        if velocityArray is not None:
+            frame["velocity"] = numpy_support.vtk_to_numpy(velocityArray)
+
+    frame["num_filtered"] = filtered_pts.shape[0]
+    frame["filtered_pts"] = filtered_pts
+    frame["filtered_conc"] = filtered_conc
+    frame["cluster_labels"] = cluster_labels
+    with timer.stage("stats"):
+        frame["stats"] = cluster_statistics(filtered_pts, filtered_conc, cluster_labels, frame.get("velocity"))
+    return frame
+
+
+def run_job(job, params, num_points=None):
+    """Worker entry point for one planned job (see RunManifest.plan)."""
+    kind, infile, outfile, fingerprint = job
+    if kind == "skip":
+        return {"job": "skip", "infile": infile, "timer": StageTimer()}
+    if kind == "reload":
+        return reload_frame(infile, outfile, fingerprint, num_points)
+    return cluster_frame(infile, params, fingerprint)
+
+
+def track_and_write(frame, outfile, tracker, writer, on_done=None):
+    """
+    Serial half of the pipeline: assign tracked labels for a clustered frame
+    and hand the output to the writer. on_done(tracker_state) runs once the
+    output is on disk, with the tracking state right after this frame.
+    Stage timings go to frame["timer"].
+    """
+    timer = frame["timer"]
+    print(f"Processing '{frame['infile']}'")
+    print(f"  Total points: {frame['num_points']}")
+    print(f"  Points after filtering: {frame['num_filtered']}")
+    if frame["num_filtered"] == 0:
+        print("  No points remaining; skipping file.")
+        # Drop a stale output from an earlier run so the manifest stays truthful.
+        if os.path.exists(outfile):
+            os.remove(outfile)
+        cluster_table.remove_frame_rows(os.path.dirname(outfile), os.path.basename(outfile))
+        if on_done is not None:
+            on_done(tracker.get_state())
+        return
+
+    filtered_pts = frame["filtered_pts"]
+    filtered_conc = frame["filtered_conc"]
+    cluster_labels = frame["cluster_labels"]
+    if frame.get("num_fitted", frame["num_filtered"]) != frame["num_filtered"]:
+        print(f"  Clustered {frame['num_fitted']} voxel representatives (voxel size {frame['voxel_size']:.3g})")
+    print(f"  DBSCAN labels: {frame['stats']['ids']}")
 
     # Compute tracked (global) labels that relate clusters across frames.
-    tracked_labels = assign_tracked_labels(filtered_pts, filtered_conc, cluster_labels)
+    with timer.stage("track"):
+        stats = frame["stats"]
+        tracked_labels, cluster_global = assign_tracked_labels(tracker, stats)
+        cluster_table.write_frame_rows(os.path.dirname(outfile), os.path.basename(outfile),
+                                       cluster_rows(stats, cluster_global))
+
+        # Cluster mean concentration per point (0 for noise)
+        cluster_mean = np.where(stats["ids"] >= 0, stats["mean_conc"], 0.0).astype(np.float32)[stats["inverse"]]
 
-    # Optionally compute cluster mean concentration per point
-    cluster_mean = np.zeros_like(tracked_labels, dtype=np.float32)
-    for gl in np.unique(tracked_labels):
-        if gl < 0:
-            cluster_mean[tracked_labels == gl] = 0.0
+    with timer.stage("build"):
+        # Build output arrays dictionary
+        arrays_dict = {
+            "concentration": filtered_conc.astype(np.float32),
+            "DBSCAN_Labels": cluster_labels.astype(np.float32),
+            "Tracked_Labels": tracked_labels.astype(np.float32),
+            "Cluster_Mean_Concentration": cluster_mean
+        }
+        if "velocity" in frame:
+            arrays_dict["velocity"] = frame["velocity"].astype(np.float32)
         else:
-            msk = tracked_labels == gl
-            cluster_mean[msk] = np.mean(filtered_conc[msk])
-
-    # Build output arrays dictionary
-    arrays_dict = {
-        "concentration": filtered_conc.astype(np.float32),
-        "DBSCAN_Labels": cluster_labels.astype(np.float32),
-        "Tracked_Labels": tracked_labels.astype(np.float32),
-        "Cluster_Mean_Concentration": cluster_mean
-    }
-    velocityArray = polydata.GetPointData().GetArray("velocity")
-    if velocityArray is not None:
-        velocity = numpy_support.vtk_to_numpy(velocityArray)
-        arrays_dict["velocity"] = velocity[mask].astype(np.float32)
-    else:
-        print("  Warning: 'velocity' not found.")
+            print("  Warning: 'velocity' not found.")
+
+        output_polydata = create_polydata_from_points(filtered_pts, arrays_dict)
+
+    if on_done is not None:
+        on_done = partial(on_done, tracker.get_state())
+    writer.submit(output_polydata, outfile, timer, on_done)
+    print(f"  Output queued for: {outfile}\n" if writer.pool else f"  Output written to: {outfile}\n")
+
+
+def iter_frames(jobs, params, workers, num_points):
+    """
+    Yield run_job() results in input order. With more than one worker the
+    jobs run in a process pool; at most 2 * workers frames are in flight so
+    memory stays bounded while the serial pass catches up. The time spent
+    blocked on a worker is added to the frame's "wait" stage.
+    """
+    def args_for(job):
+        return job, params, num_points.get(frame_name(job[1]))
+
+    if workers <= 1:
+        for job in jobs:
+            yield run_job(*args_for(job))
+        return
+
+    remaining = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(run_job, *args_for(job))
+                        for job in islice(remaining, 2 * workers))
+        while pending:
+            start = time.perf_counter()
+            frame = pending.popleft().result()
+            if frame is not None:
+                frame["timer"].add("wait", time.perf_counter() - start)
+            nxt = next(remaining, None)
+            if nxt is not None:
+                pending.append(pool.submit(run_job, *args_for(nxt)))
+            yield frame
+
+
+def record_frame(manifest, name, outfile, entry, tracker_out):
+    """Add a processed frame to the manifest and save it."""
+    manifest.record(name, dict(entry, output=output_stat(outfile), tracker_out=tracker_out))
+    manifest.save()
+
+
+def parse_args(argv=None):
+    """
+    Command line options, with defaults taken from the module constants and
+    optionally overridden by a JSON config file (--config). Options given on the
+    command line override the config file.
+    """
+    parser = argparse.ArgumentParser(description="Cluster and track a run with DBSCAN.")
+    parser.add_argument("input_folder", help="Folder of run_n.vtu files, or a cache made by utils/vtu_cache.py")
+    parser.add_argument("output_folder", help="Folder for the clustered run_n.vtu files")
+    parser.add_argument("--config", help="JSON file with option values, e.g. {\"eps\": 0.6, \"min_samples\": 20}")
+
+    clustering = parser.add_argument_group("clustering")
+    clustering.add_argument("--concentration-cutoff", type=float, default=CONCENTRATION_CUTOFF,
+                            help=f"Keep only points with concentration >= cutoff (default: {CONCENTRATION_CUTOFF})")
+    clustering.add_argument("--concentration-weight", type=float, default=CONCENTRATION_WEIGHT,
+                            help=f"Weight of concentration in the feature matrix (default: {CONCENTRATION_WEIGHT})")
+    clustering.add_argument("--eps", type=float, default=EPS,
+                            help=f"DBSCAN neighborhood radius (default: {EPS})")
+    clustering.add_argument("--min-samples", type=int, default=MIN_SAMPLES,
+                            help=f"DBSCAN min_samples (default: {MIN_SAMPLES})")
+    clustering.add_argument("--match-distance", type=float, default=MATCH_DISTANCE_THRESHOLD,
+                            help=f"Maximum centroid distance to track a cluster between frames "
+                                 f"(default: {MATCH_DISTANCE_THRESHOLD})")
+    clustering.add_argument("--voxel-size", type=float, default=None,
+                            help="Cluster one weighted representative per voxel of this size (feature units)")
+    clustering.add_argument("--max-points", type=int, default=None,
+                            help="Grow the voxel size until at most this many representatives are clustered "
+                                 "(voxels much larger than eps / 2 can split clusters)")
 
-    output_polydata = create_polydata_from_points(filtered_pts, arrays_dict)
-    write_vtu(output_polydata, outfile)
-    print(f"  Output written to: {outfile}\n")
+    run = parser.add_argument_group("run")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                     help="Worker processes for the clustering pass (default: all cores)")
+    run.add_argument("--force", action="store_true",
+                     help="Ignore the manifest and reprocess every frame")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--compression", choices=sorted(COMPRESSION_MODES), default="zlib",
+                        help="Encoding of the output frames; raw is uncompressed appended binary (default: zlib)")
+    output.add_argument("--compression-level", type=int, default=None,
+                        help="Compression level 1-9 (default: VTK's)")
+    output.add_argument("--write-queue", type=int, default=2,
+                        help="Frames that may wait for the background writer thread; 0 writes inline (default: 2)")
+
+    sweep = parser.add_argument_group("parameter sweep")
+    sweep.add_argument("--sweep", action="store_true",
+                       help="Write labels for every --sweep-eps x --sweep-min-samples pair instead of tracked output")
+    sweep.add_argument("--sweep-eps", type=float, nargs="+", default=[0.4, 0.6, 0.8, 1.0, 1.2])
+    sweep.add_argument("--sweep-min-samples", type=int, nargs="+", default=[5, 10, 20, 40])
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args, _ = parser.parse_known_args(argv)
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        # Parsed like options given ahead of the command line: argparse converts and
+        # checks every value and rejects unknown keys, and the command line still wins.
+        argv = config_argv(config) + argv
+    return parser.parse_args(argv)
+
+
+def config_argv(config):
+    """Command line options equivalent to a config dict ({"min_samples": 20} -> ["--min-samples=20"])."""
+    tokens = []
+    for key, value in config.items():
+        option = "--" + key.replace("_", "-")
+        if value is None or value is False:
+            continue  # the default
+        if value is True:
+            tokens.append(option)
+        elif isinstance(value, list):
+            tokens += [option] + [str(v) for v in value]
+        else:
+            tokens.append(f"{option}={value}")
+    return tokens
 
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python process_folder_dbscan_tracking.py <input_folder> <output_folder>")
-        sys.exit(1)
-    input_folder = sys.argv[1]
-    output_folder = sys.argv[2]
-    os.makedirs(output_folder, exist_ok=True)
-    input_files = sorted(glob.glob(os.path.join(input_folder, "*.vtu")))
+    args = parse_args()
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    if vtu_cache.is_cache(args.input_folder):
+        input_files = vtu_cache.frame_dirs(args.input_folder)
+    else:
+        input_files = sorted(glob.glob(os.path.join(args.input_folder, "*.vtu")))
     if not input_files:
         print("No VTU files found in input folder.")
         sys.exit(1)
-    for infile in input_files:
-        filename = os.path.basename(infile)
-        outfile = os.path.join(output_folder, filename)
-        process_file(infile, outfile)
+
+    params = {
+        "concentration_cutoff": args.concentration_cutoff,
+        "concentration_weight": args.concentration_weight,
+        "eps": args.eps,
+        "min_samples": args.min_samples,
+        "match_distance": args.match_distance,
+        "voxel_size": args.voxel_size,
+        "max_points": args.max_points,
+    }
+    if args.sweep:
+        run_sweep(input_files, args.output_folder, params, args.sweep_eps, args.sweep_min_samples, args.workers)
+        return
+
+    run_start = time.perf_counter()
+    tracker = ClusterTracker(params["match_distance"])
+
+    manifest = RunManifest(args.output_folder) if args.force else RunManifest.load(args.output_folder)
+    jobs = manifest.plan(input_files, args.output_folder, params, tracker.get_state())
+    counts = {kind: sum(1 for job in jobs if job[0] == kind) for kind in ("skip", "reload", "cluster")}
+    print(f"{counts['skip']} frames up to date, {counts['reload']} to re-track, {counts['cluster']} to cluster\n")
+    num_points = {name: entry.get("num_points") for name, entry in manifest.frames.items()}
+
+    writer = FrameWriter(args.compression, args.compression_level, args.write_queue)
+    timing_rows = []
+    for frame in iter_frames(jobs, params, args.workers, num_points):
+        if frame is None:
+            continue
+        name = frame_name(frame["infile"])
+        outfile = os.path.join(args.output_folder, name)
+        entry = manifest.frames.get(name)
+
+        tracker_in = state_digest(tracker.get_state(), params)
+        if frame["job"] == "skip" or (frame["job"] == "reload" and entry["tracker_in"] == tracker_in):
+            # Same input, tracking state and tracking parameters as last time: the output is already correct.
+            tracker.set_state(entry["tracker_out"])
+            frame["job"] = "skip"
+        else:
+            # Recorded once the frame is on disk, so the manifest never points at a missing output.
+            record = partial(record_frame, manifest, name, outfile, {
+                "input": frame["fingerprint"],
+                "num_points": frame["num_points"],
+                "num_filtered": frame["num_filtered"],
+                "tracker_in": tracker_in,
+            })
+            track_and_write(frame, outfile, tracker, writer, record)
+
+        timing_rows.append({
+            "frame": name,
+            "job": frame["job"],
+            "num_points": frame.get("num_points"),
+            "num_filtered": frame.get("num_filtered"),
+            "stages": frame["timer"].stages,
+        })
+
+    writer.close()
+    manifest.save()
+    table = cluster_table.consolidate(args.output_folder, [frame_name(f) for f in input_files])
+    print(f"Cluster table written to: {table}")
+    write_report(args.output_folder, timing_rows, time.perf_counter() - run_start, args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Micro benchmarks for the preprocessing and viewer pipelines.
+
+    python utils/benchmarks.py output --points 2000000
+    python utils/benchmarks.py tracking --clusters 100 1000 10000
+    python utils/benchmarks.py encoding --input data/run01_DBSCAN/run_060.vtu
+    python utils/benchmarks.py pointcloud --input data/run01 --stride 10
+"""
+import argparse
+import ctypes
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import vtk
+
+import DBSCAN
+
+# Viewer modules live in the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_create_polydata_from_points(points_array, arrays_dict=None):
+    # The original per-point implementation, kept here as the baseline.
+    numPts = points_array.shape[0]
+    vtk_pts = vtk.vtkPoints()
+    vtk_pts.SetNumberOfPoints(numPts)
+    for i in range(numPts):
+        vtk_pts.SetPoint(i, points_array[i])
+    ug = vtk.vtkUnstructuredGrid()
+    ug.SetPoints(vtk_pts)
+    for i in range(numPts):
+        cell = vtk.vtkVertex()
+        cell.GetPointIds().SetId(0, i)
+        ug.InsertNextCell(cell.GetCellType(), cell.GetPointIds())
+    if arrays_dict is not None:
+        for name, arr in arrays_dict.items():
+            vtk_arr = DBSCAN.numpy_support.numpy_to_vtk(num_array=arr, deep=True, array_type=vtk.VTK_FLOAT)
+            vtk_arr.SetName(name)
+            ug.GetPointData().AddArray(vtk_arr)
+    return ug
+
+
+def time_call(fn, *args, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_output(args):
+    rng = np.random.default_rng(0)
+    pts = rng.uniform(-5, 5, size=(args.points, 3)).astype(np.float32)
+    arrays = {
+        "concentration": rng.uniform(25, 350, size=args.points).astype(np.float32),
+        "Tracked_Labels": rng.integers(-1, 50, size=args.points).astype(np.float32),
+        "velocity": rng.normal(size=(args.points, 3)).astype(np.float32),
+    }
+    new = time_call(DBSCAN.create_polydata_from_points, pts, arrays, repeat=args.repeat)
+    print(f"vectorized: {new:.3f} s for {args.points} points")
+    if not args.skip_legacy:
+        old = time_call(legacy_create_polydata_from_points, pts, arrays, repeat=1)
+        print(f"legacy:     {old:.3f} s for {args.points} points ({old / new:.1f}x slower)")
+
+
+def bench_tracking(args):
+    rng = np.random.default_rng(0)
+    for num_clusters in args.clusters:
+        centroids = rng.uniform(0, 100, size=(num_clusters, 3))
+        tracker = DBSCAN.ClusterTracker()
+        tracker.update(centroids)
+        moved = centroids + rng.normal(scale=0.5, size=centroids.shape)
+        start = time.perf_counter()
+        tracker.update(moved)
+        print(f"{num_clusters:6d} clusters: {time.perf_counter() - start:.4f} s per frame")
+
+
+def bench_encoding(args):
+    if args.input:
+        data = DBSCAN.load_vtu(args.input)
+    else:
+        rng = np.random.default_rng(0)
+        n = args.points
+        # Smooth-ish fields compress more like the real data than pure noise.
+        pts = np.sort(rng.uniform(-5, 5, size=(n, 3)).astype(np.float32), axis=0)
+        data = DBSCAN.create_polydata_from_points(pts, {
+            "concentration": np.linspace(25, 350, n, dtype=np.float32),
+            "Tracked_Labels": np.repeat(np.arange(50, dtype=np.float32), -(-n // 50))[:n],
+            "velocity": rng.normal(size=(n, 3)).astype(np.float32),
+        })
+
+    print(f"{data.GetNumberOfPoints()} points")
+    print(f"{'mode':>6} {'level':>5} {'size MB':>9} {'write s':>8} {'read s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in sorted(DBSCAN.COMPRESSION_MODES):
+            levels = [None] if mode == "raw" else args.levels
+            for level in levels:
+                path = os.path.join(tmp, f"{mode}_{level}.vtu")
+                write = time_call(DBSCAN.write_vtu, data, path, mode, level, repeat=args.repeat)
+                # Read time is what the Clustered viewer pays per timestep.
+                read = time_call(DBSCAN.load_vtu, path, repeat=args.repeat)
+                size = os.path.getsize(path) / 2**20
+                print(f"{mode:>6} {str(level or '-'):>5} {size:9.1f} {write:8.3f} {read:8.3f}")
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_call(fn, *args):
+    """(result, seconds, peak MB above the RSS before the call). Linux only: resets VmHWM first."""
+    # Hand freed memory back first, or the call reuses it without showing up in the RSS.
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = rss_mb()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    with open("/proc/self/status") as f:
+        peak = next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM"))
+    return result, seconds, max(peak - before, 0.0)
+
+
+def stock_chain(data, lower, upper, plane):
+    """
+    ConvertToPointCloud -> IsoVolume -> Clip as in isostate.pvsm. Returns every
+    stage's output, since the pipeline keeps all of them alive.
+    """
+    try:
+        from paraview import simple
+    except ImportError:
+        simple = None
+    origin, normal, invert = plane
+    if simple is not None:
+        producer = simple.TrivialProducer()
+        producer.GetClientSideObject().SetOutput(data)
+        cloud = simple.ConvertToPointCloud(Input=producer, CellGenerationMode="Vertex cells")
+        iso = simple.IsoVolume(Input=cloud, InputScalars=["POINTS", "concentration"], ThresholdRange=[lower, upper])
+        clip = simple.Clip(Input=iso, ClipType="Plane", Invert=int(invert))
+        clip.ClipType.Origin, clip.ClipType.Normal = origin, normal
+        clip.UpdatePipeline()
+        outputs = [p.GetClientSideObject().GetOutputDataObject(0) for p in (cloud, iso, clip)]
+        for p in (clip, iso, cloud, producer):
+            simple.Delete(p)
+        return outputs
+
+    # Without ParaView: the VTK filters behind the same chain. IsoVolume is
+    # two scalar clips (above lower, then below upper).
+    cloud = vtk.vtkConvertToPointCloud()
+    cloud.SetInputData(data)
+    cloud.SetCellGenerationMode(vtk.vtkConvertToPointCloud.VERTEX_CELLS)
+    above = vtk.vtkClipDataSet()
+    above.SetInputConnection(cloud.GetOutputPort())
+    above.SetInputArrayToProcess(0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS, "concentration")
+    above.SetValue(lower)
+    below = vtk.vtkClipDataSet()
+    below.SetInputConnection(above.GetOutputPort())
+    below.SetInputArrayToProcess(0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS, "concentration")
+    below.SetValue(upper)
+    below.InsideOutOn()
+    vtk_plane = vtk.vtkPlane()
+    vtk_plane.SetOrigin(origin)
+    vtk_plane.SetNormal(normal)
+    clip = vtk.vtkClipDataSet()
+    clip.SetInputConnection(below.GetOutputPort())
+    clip.SetClipFunction(vtk_plane)
+    clip.SetInsideOut(invert)
+    clip.Update()
+    return [f.GetOutput() for f in (cloud, above, below, clip)]
+
+
+def bench_pointcloud(args):
+    import range_index
+    from timestep_cache import read_vtu
+
+    if args.input:
+        files = sorted(glob.glob(os.path.join(args.input, "*.vtu")))[::args.stride]
+        frames = ((os.path.basename(f), lambda f=f: read_vtu(f)) for f in files)
+    else:
+        def synthetic(step):
+            rng = np.random.default_rng(step)
+            pts = rng.uniform(-5, 5, size=(args.points, 3)).astype(np.float32)
+            conc = (25 + 325 * np.exp(-np.linalg.norm(pts[:, :2], axis=1) / (1 + step))).astype(np.float32)
+            return DBSCAN.create_polydata_from_points(pts, {
+                "concentration": conc, "velocity": rng.normal(size=(args.points, 3)).astype(np.float32)})
+        frames = ((f"synthetic {step}", lambda step=step: synthetic(step)) for step in range(args.steps))
+
+    lower, upper = args.range
+    plane = (args.origin, args.normal, not args.no_invert)
+    try:
+        from paraview import simple  # noqa: F401
+        print("stock chain: ParaView ConvertToPointCloud -> IsoVolume -> Clip")
+    except ImportError:
+        print("stock chain: VTK ConvertToPointCloud -> 2x ClipDataSet (IsoVolume) -> ClipDataSet (ParaView not found)")
+    print(f"{'frame':>16} {'points':>9} {'kept':>9} | {'stock ms':>9} {'peak MB':>8} {'held MB':>8} | "
+          f"{'fused ms':>9} {'peak MB':>8} {'held MB':>8} | {'index ms':>9} {'slice ms':>9} {'peak MB':>8} "
+          f"{'drag ms':>8}")
+    totals = np.zeros(5)
+    for name, load in frames:
+        data = load()
+        outputs, stock_s, stock_peak = peak_call(stock_chain, data, lower, upper, plane)
+        stock_held = sum(o.GetActualMemorySize() for o in outputs) / 1024
+        stock_kept = outputs[-1].GetNumberOfPoints()
+        del outputs
+
+        columns = range_index.point_columns(data, "concentration")
+        fused, fused_s, fused_peak = peak_call(range_index.masked_extract, columns, lower, upper, 0, plane)
+        fused_held = fused.GetActualMemorySize() / 1024
+        kept = fused.GetNumberOfPoints()
+        del fused
+
+        index, index_s, _ = peak_call(range_index.RangeIndex, columns)
+        sliced, slice_s, slice_peak = peak_call(index.extract, lower, upper, 0, plane)
+
+        # Dragging the clip plane: sort the selection along the normal's axis once, then time the ticks.
+        axis = range_index.plane_axis(plane)
+        drag_s = np.nan
+        if axis is not None:
+            index.extract(lower, upper, 0, plane, (), True)
+            ticks = []
+            for shift in np.linspace(-1, 1, 21):
+                origin = list(plane[0])
+                origin[axis] += shift
+                ticks.append(time_call(index.extract, lower, upper, 0, (origin,) + plane[1:], (), True, repeat=1))
+            drag_s = np.median(ticks)
+        if not sliced.GetNumberOfPoints() == kept == stock_kept:
+            print(f"warning: {name} kept {stock_kept} points in the stock chain, {kept} fused, "
+                  f"{sliced.GetNumberOfPoints()} from the index")
+        del sliced, index
+
+        totals += (stock_s, fused_s, slice_s, stock_peak, fused_peak)
+        print(f"{name:>16} {data.GetNumberOfPoints():9d} {kept:9d} | {1e3 * stock_s:9.1f} {stock_peak:8.1f} "
+              f"{stock_held:8.1f} | {1e3 * fused_s:9.1f} {fused_peak:8.1f} {fused_held:8.1f} | "
+              f"{1e3 * index_s:9.1f} {1e3 * slice_s:9.1f} {slice_peak:8.1f} {1e3 * drag_s:8.2f}")
+    if totals[1]:
+        print(f"fused pass {totals[0] / totals[1]:.1f}x faster than the stock chain, "
+              f"index slice {totals[0] / max(totals[2], 1e-9):.1f}x; "
+              f"summed peak memory {totals[3]:.1f} MB stock, {totals[4]:.1f} MB fused")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Saffman-Taylor pipelines.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("output", help="VTK output construction in utils/DBSCAN.py")
+    p.add_argument("--points", type=int, default=1_000_000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--skip-legacy", action="store_true",
+                   help="Only time the vectorized path (the legacy loop is slow on large inputs)")
+    p.set_defaults(func=bench_output)
+
+    p = sub.add_parser("tracking", help="Cluster matching between two frames")
+    p.add_argument("--clusters", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    p.set_defaults(func=bench_tracking)
+
+    p = sub.add_parser("encoding", help="Output size and write/read speed per compression mode")
+    p.add_argument("--input", help="Clustered .vtu to use instead of a synthetic frame")
+    p.add_argument("--points", type=int, default=1_000_000)
+    p.add_argument("--levels", type=int, nargs="+", default=[1, 5, 9])
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_encoding)
+
+    p = sub.add_parser("pointcloud", help="Fused range + clip pass vs. the Point Cloud filter chain, per timestep")
+    p.add_argument("--input", help="Folder of run_n.vtu frames (default: synthetic frames)")
+    p.add_argument("--stride", type=int, default=1, help="Use every n-th frame of --input")
+    p.add_argument("--points", type=int, default=1_000_000)
+    p.add_argument("--steps", type=int, default=5, help="Synthetic frames")
+    p.add_argument("--range", type=float, nargs=2, default=[100, 300], metavar=("LOWER", "UPPER"))
+    p.add_argument("--origin", type=float, nargs=3, default=[0, 0, 0])
+    p.add_argument("--normal", type=float, nargs=3, default=[1, 0, 0])
+    p.add_argument("--no-invert", action="store_true", help="Keep the side the normal points to")
+    p.set_defaults(func=bench_pointcloud)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Per-run table of clusters, one row per (frame, tracked label).
+
+DBSCAN.py writes the rows of every frame to <output>/.clusters/run_n.npz as it
+goes and consolidates them into <output>/clusters.npz at the end of a run.
+ClusterTable loads that file and answers time-series questions about the
+clusters (finger counts, track lengths, sizes) without touching the VTU files.
+
+    from cluster_table import ClusterTable
+    table = ClusterTable.load("data/run01_DBSCAN")
+    frames, counts = table.count_per_frame()
+    rows = table.track(12)
+"""
+import os
+
+import numpy as np
+
+TABLE_NAME = "clusters.npz"
+FRAME_ROWS_DIR = ".clusters"
+
+# Per-frame columns as written by DBSCAN.py; "frame" is added on consolidation.
+COLUMNS = (
+    "label", "count",
+    "centroid_x", "centroid_y", "centroid_z",
+    "mean_concentration", "max_concentration",
+    "mean_velocity_x", "mean_velocity_y", "mean_velocity_z",
+)
+
+
+def frame_rows_path(output_folder, name):
+    return os.path.join(output_folder, FRAME_ROWS_DIR, os.path.splitext(name)[0] + ".npz")
+
+
+def write_frame_rows(output_folder, name, rows):
+    """Store the cluster rows of one frame (a dict of equal-length column arrays)."""
+    path = frame_rows_path(output_folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".part.npz"
+    np.savez(tmp, **{c: rows[c] for c in COLUMNS})
+    os.replace(tmp, path)
+
+
+def remove_frame_rows(output_folder, name):
+    path = frame_rows_path(output_folder, name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def consolidate(output_folder, names):
+    """
+    Concatenate the rows of the given frames (in frame order) into one table.
+    The frame column is the position of the frame in names. Returns the path.
+    """
+    columns = {c: [] for c in ("frame",) + COLUMNS}
+    for index, name in enumerate(names):
+        path = frame_rows_path(output_folder, name)
+        if not os.path.exists(path):
+            continue
+        with np.load(path) as rows:
+            for c in COLUMNS:
+                columns[c].append(rows[c])
+            columns["frame"].append(np.full(len(rows["label"]), index, dtype=np.int32))
+
+    table = {c: (np.concatenate(v) if v else np.empty(0)) for c, v in columns.items()}
+    table["frame_names"] = np.array(names, dtype=np.str_)
+    path = os.path.join(output_folder, TABLE_NAME)
+    tmp = path + ".part.npz"
+    np.savez(tmp, **table)
+    os.replace(tmp, path)
+    return path
+
+
+class ClusterTable:
+    """
+    In-memory cluster table. Rows are kept sorted by (label, frame), so the
+    history of a tracked cluster is one contiguous slice.
+    """
+
+    def __init__(self, columns, frame_names):
+        order = np.lexsort((columns["frame"], columns["label"]))
+        self.columns = {c: np.asarray(v)[order] for c, v in columns.items()}
+        self.frame_names = list(frame_names)
+        self.labels, self._starts, self._lengths = np.unique(
+            self.columns["label"], return_index=True, return_counts=True)
+
+    @classmethod
+    def load(cls, path):
+        """Load a table from clusters.npz or from the DBSCAN output folder holding it."""
+        if os.path.isdir(path):
+            path = os.path.join(path, TABLE_NAME)
+        with np.load(path) as data:
+            columns = {c: data[c] for c in ("frame",) + COLUMNS}
+            frame_names = data["frame_names"].tolist()
+        return cls(columns, frame_names)
+
+    def __len__(self):
+        return len(self.columns["label"])
+
+    def _select(self, mask_or_slice):
+        return {c: v[mask_or_slice] for c, v in self.columns.items()}
+
+    def track(self, label):
+        """All rows of one tracked cluster, ordered by frame."""
+        i = np.searchsorted(self.labels, label)
+        if i == len(self.labels) or self.labels[i] != label:
+            return self._select(slice(0, 0))
+        start = self._starts[i]
+        return self._select(slice(start, start + self._lengths[i]))
+
+    def frame(self, frame):
+        """All clusters of one frame (index or frame name)."""
+        if isinstance(frame, str):
+            frame = self.frame_names.index(frame)
+        return self._select(self.columns["frame"] == frame)
+
+    def count_per_frame(self):
+        """(frames, number of clusters in each frame) for every frame of the run."""
+        frames = np.arange(len(self.frame_names))
+        return frames, np.bincount(self.columns["frame"].astype(np.int64), minlength=len(frames))
+
+    def track_lengths(self):
+        """(labels, number of frames each tracked cluster appears in)."""
+        return self.labels, self._lengths
+
+    def track_spans(self):
+        """(labels, first frame, last frame) of every tracked cluster."""
+        frames = self.columns["frame"]
+        return self.labels, frames[self._starts], frames[self._starts + self._lengths - 1]
+
+    def sizes(self, frame=None):
+        """Point counts of the clusters, optionally restricted to one frame."""
+        rows = self.columns if frame is None else self.frame(frame)
+        return rows["count"]
@@ -3,48 +3,169 @@ import os
 import glob
 import sys
 import argparse
+import shutil
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 ###### Vibe coded ########
+
+# Codecs OpenCV can usually write without extra setup, by name -> fourcc.
+CODECS = {"mp4v": "mp4v", "avc1": "avc1", "h264": "avc1", "xvid": "XVID", "mjpg": "MJPG"}
+
+
+def iter_directory(folder, pattern="run.*.png", workers=4, read_ahead=16):
+    """
+    Decode the images of a folder in order on a thread pool (cv2.imread releases
+    the GIL), keeping at most read_ahead frames decoded ahead of the encoder.
+    """
+    file_list = sorted(glob.glob(os.path.join(folder, pattern)))
+    if not file_list:
+        print(f"No files found in the folder '{folder}' matching the pattern {pattern}")
+        return
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pending = deque()
+        files = iter(file_list)
+        for filename in files:
+            pending.append((filename, pool.submit(cv2.imread, filename)))
+            if len(pending) >= read_ahead:
+                break
+        while pending:
+            filename, future = pending.popleft()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append((next_file, pool.submit(cv2.imread, next_file)))
+            frame = future.result()
+            if frame is None:
+                print(f"Warning: Skipping file {filename} (could not read)")
+                continue
+            yield frame
+
+
+def iter_pipe(stream, width, height):
+    """Raw BGR24 frames of width x height read back to back from a binary stream (e.g. stdin)."""
+    frame_bytes = width * height * 3
+    while True:
+        data = stream.read(frame_bytes)
+        if len(data) < frame_bytes:
+            return
+        yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+
+
+class FFmpegWriter:
+    """
+    cv2.VideoWriter look-alike that pipes raw frames to ffmpeg, for its
+    multithreaded encoders (libx264, libx265, ...). quality is the CRF.
+    """
+
+    def __init__(self, output_filename, codec, fps, size, quality=None):
+        cmd = ["ffmpeg", "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+               "-c:v", codec, "-pix_fmt", "yuv420p"]
+        if quality is not None:
+            cmd += ["-crf", str(quality)]
+        self.process = subprocess.Popen(cmd + [output_filename], stdin=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode the video")
+
+
+def encode_frames(frames, output_filename, fps=30, codec="mp4v", quality=None, backend="opencv"):
+    """
+    Encode an iterable of BGR uint8 frames (decoded files, render buffers, a
+    pipe...) as they arrive. Nothing is written to disk but the video itself.
+    Returns throughput stats.
+    """
+    start = time.perf_counter()
+    wait = encode = 0.0
+    count = 0
+    writer = None
+    frames = iter(frames)
+    while True:
+        t0 = time.perf_counter()
+        frame = next(frames, None)
+        t1 = time.perf_counter()
+        wait += t1 - t0
+        if frame is None:
+            break
+        if writer is None:
+            height, width = frame.shape[:2]
+            if backend == "ffmpeg":
+                writer = FFmpegWriter(output_filename, codec, fps, (width, height), quality)
+            else:
+                fourcc = cv2.VideoWriter_fourcc(*CODECS.get(codec.lower(), codec))
+                writer = cv2.VideoWriter(output_filename, fourcc, fps, (width, height))
+                if quality is not None:
+                    writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+            if not writer.isOpened():
+                raise RuntimeError(f"Could not open a '{codec}' video writer for {output_filename}")
+        writer.write(frame)
+        encode += time.perf_counter() - t1
+        count += 1
+
+    if writer is not None:
+        t0 = time.perf_counter()
+        # ffmpeg may still be working through its queue here
+        writer.release()
+        encode += time.perf_counter() - t0
+    seconds = time.perf_counter() - start
+    return {"frames": count, "seconds": seconds, "fps": count / seconds if seconds else 0.0,
+            "input_seconds": wait, "encode_seconds": encode}
+
+
 def main():
     # Set up command-line argument parsing
-    parser = argparse.ArgumentParser(description="Convert PNG images to an MP4 video.")
+    parser = argparse.ArgumentParser(description="Convert PNG images (or raw frames on a pipe) to a video.")
     parser.add_argument("folder", type=str,
-                        help="Path to the folder containing PNG files named like run.0000.png, run.0001.png, etc.")
+                        help="Path to the folder containing PNG files named like run.0000.png, run.0001.png, etc. "
+                             "Use '-' to read raw BGR24 frames from stdin (needs --size)")
     parser.add_argument("--fps", type=int, default=30,
                         help="Frames per second for the output video (default: 30)")
+    parser.add_argument("--output", help="Output video (default: <folder>/output.mp4)")
+    parser.add_argument("--pattern", default="run.*.png", help="Glob of the frames in the folder")
+    parser.add_argument("--codec", default="mp4v", help=f"One of {sorted(CODECS)} or any fourcc (default: mp4v)")
+    parser.add_argument("--quality", type=float,
+                        help="Encoder quality 0-100 if the codec supports it (opencv), or the CRF (ffmpeg)")
+    parser.add_argument("--backend", choices=["opencv", "ffmpeg"], default="opencv",
+                        help="ffmpeg pipes frames to an ffmpeg binary; --codec is then an ffmpeg encoder "
+                             "such as libx264")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("W", "H"), help="Frame size of raw stdin input")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode threads")
+    parser.add_argument("--read-ahead", type=int, default=16, help="Frames decoded ahead of the encoder")
     args = parser.parse_args()
 
-    folder = args.folder
-    # Define the pattern to find files. Adjust the extension if your files are different.
-    pattern = os.path.join(folder, "run.*.png")
-    file_list = sorted(glob.glob(pattern))
-    if not file_list:
-        print(f"No files found in the folder '{folder}' matching the pattern run.*.png")
-        sys.exit(1)
-
-    # Read the first image to get the frame dimensions
-    first_frame = cv2.imread(file_list[0])
-    if first_frame is None:
-        print(f"Could not read the image file: {file_list[0]}")
-        sys.exit(1)
-    height, width, layers = first_frame.shape
+    if args.backend == "ffmpeg" and shutil.which("ffmpeg") is None:
+        parser.error("--backend ffmpeg needs an ffmpeg binary on the PATH")
+    if args.backend == "ffmpeg" and args.codec == "mp4v":
+        args.codec = "libx264"
 
-    # Set up the VideoWriter
-    # The 'mp4v' codec is used here.
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    output_filename = os.path.join(folder, "output.mp4")
-    video_writer = cv2.VideoWriter(output_filename, fourcc, args.fps, (width, height))
+    if args.folder == "-":
+        if not args.size:
+            parser.error("--size W H is required when reading frames from stdin")
+        frames = iter_pipe(sys.stdin.buffer, *args.size)
+        output_filename = args.output or "output.mp4"
+    else:
+        frames = iter_directory(args.folder, args.pattern, args.workers, args.read_ahead)
+        output_filename = args.output or os.path.join(args.folder, "output.mp4")
 
-    for filename in file_list:
-        frame = cv2.imread(filename)
-        if frame is None:
-            print(f"Warning: Skipping file {filename} (could not read)")
-            continue
-        video_writer.write(frame)
-
-    # Release the VideoWriter
-    video_writer.release()
+    stats = encode_frames(frames, output_filename, args.fps, args.codec, args.quality, args.backend)
+    if not stats["frames"]:
+        print("No frames were encoded.")
+        sys.exit(1)
     print(f"Video successfully saved as {output_filename}")
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f} s ({stats['fps']:.1f} frames/s): "
+          f"{stats['input_seconds']:.2f} s waiting for input, {stats['encode_seconds']:.2f} s encoding")
 
 
 if __name__ == "__main__":
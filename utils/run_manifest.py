@@ -0,0 +1,145 @@
+"""
+Manifest of a DBSCAN preprocessing run, stored as manifest.json in the output
+folder. It records the clustering parameters, a fingerprint of every input
+frame and the tracking state before and after each frame, so a rerun can skip
+frames that are already up to date and only redo what is downstream of a change.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2  # 2: frames also own a row file in .clusters/
+
+# Changing any of these invalidates the clustering of every frame.
+CLUSTER_PARAMS = ("concentration_cutoff", "concentration_weight", "eps", "min_samples",
+                  "voxel_size", "max_points")
+# Changing any of these only invalidates the tracking (labels are re-tracked).
+TRACK_PARAMS = ("match_distance",)
+
+
+def file_fingerprint(path, previous=None):
+    """
+    Size, mtime and sha256 of a file. If the size and mtime match a previous
+    fingerprint, its hash is reused instead of reading the file again.
+    For a frame of a columnar cache (see vtu_cache.py) this is the fingerprint
+    of the VTU it was converted from.
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)["source"]
+    st = os.stat(path)
+    fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        fingerprint["sha256"] = previous["sha256"]
+        return fingerprint
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def frame_name(infile):
+    """Output file name of an input frame (a run_n.vtu file or a cache frame folder)."""
+    return os.path.splitext(os.path.basename(os.path.normpath(infile)))[0] + ".vtu"
+
+
+def output_stat(path):
+    """Size and mtime of an output file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def state_digest(state, params):
+    """
+    Stable digest of a ClusterTracker state dict and the tracking parameters
+    it is run with, so a frame tracked with another --match-distance never
+    looks up to date.
+    """
+    tracking = {k: params.get(k) for k in TRACK_PARAMS}
+    return hashlib.sha1(json.dumps([state, tracking], sort_keys=True).encode()).hexdigest()
+
+
+class RunManifest:
+
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.params = {}
+        self.frames = {}
+
+    @classmethod
+    def load(cls, output_folder):
+        manifest = cls(output_folder)
+        try:
+            with open(manifest.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return manifest
+        except json.JSONDecodeError:
+            print(f"Warning: ignoring unreadable manifest {manifest.path}")
+            return manifest
+        if data.get("version") == MANIFEST_VERSION:
+            manifest.params = data.get("params", {})
+            manifest.frames = data.get("frames", {})
+        return manifest
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a truncated manifest.
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "params": self.params, "frames": self.frames}, f)
+        os.replace(tmp, self.path)
+
+    def plan(self, input_files, output_folder, params, initial_state):
+        """
+        Decide what to do with every input frame. Returns one job per frame:
+
+          ("skip", infile, outfile, fingerprint)     up to date, nothing to do
+          ("reload", infile, outfile, fingerprint)   clustering is still valid but the
+                                                     tracking upstream changed; reuse the
+                                                     DBSCAN labels from the output file
+          ("cluster", infile, outfile, fingerprint)  new or changed input, recluster
+
+        Fingerprint is None for frames that were never processed; it is computed
+        by the worker that clusters them.
+        """
+        if any(self.params.get(k) != params[k] for k in CLUSTER_PARAMS):
+            self.frames = {}
+        tracking_same = all(self.params.get(k) == params[k] for k in TRACK_PARAMS)
+        self.params = dict(params)
+
+        names = {frame_name(f) for f in input_files}
+        self.frames = {name: entry for name, entry in self.frames.items() if name in names}
+
+        jobs = []
+        chain_intact = tracking_same
+        prev_digest = state_digest(initial_state, params)
+        for infile in input_files:
+            name = frame_name(infile)
+            outfile = os.path.join(output_folder, name)
+            entry = self.frames.get(name)
+
+            fingerprint = None
+            input_same = False
+            if entry is not None:
+                fingerprint = file_fingerprint(infile, entry["input"])
+                input_same = (fingerprint["sha256"] == entry["input"]["sha256"]
+                              and output_stat(outfile) == entry["output"])
+
+            if input_same and chain_intact and entry["tracker_in"] == prev_digest:
+                jobs.append(("skip", infile, outfile, fingerprint))
+                prev_digest = state_digest(entry["tracker_out"], params)
+            else:
+                # Everything after the first change has to be at least re-tracked.
+                chain_intact = False
+                jobs.append(("reload" if input_same else "cluster", infile, outfile, fingerprint))
+        return jobs
+
+    def record(self, name, entry):
+        self.frames[name] = entry
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Columnar cache of VTU frames.
+
+Each run_n.vtu is converted once into a folder of raw .npy files, one per
+column (points and every point array), plus a meta.json describing them:
+
+    <cache>/index.json
+    <cache>/run_000/meta.json
+    <cache>/run_000/points.npy
+    <cache>/run_000/concentration.npy
+    <cache>/run_000/velocity.npy
+
+load_frame() memory-maps the columns it is asked for, so repeated runs skip
+XML parsing and decompression entirely and only touch the columns they use.
+
+    python utils/vtu_cache.py data/run01 data/run01_cache
+"""
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from run_manifest import file_fingerprint
+
+INDEX_NAME = "index.json"
+META_NAME = "meta.json"
+CACHE_VERSION = 1
+
+
+def is_cache(folder):
+    return os.path.isfile(os.path.join(folder, INDEX_NAME))
+
+
+def frame_dirs(cache_folder):
+    """Frame directories of a cache, in frame order."""
+    with open(os.path.join(cache_folder, INDEX_NAME)) as f:
+        index = json.load(f)
+    return [os.path.join(cache_folder, name) for name in index["frames"]]
+
+
+def read_meta(frame_dir):
+    with open(os.path.join(frame_dir, META_NAME)) as f:
+        return json.load(f)
+
+
+def load_frame(frame_dir, columns=None):
+    """
+    Memory-map the requested columns of a cached frame (all columns if None).
+    Columns the frame does not have are left out of the returned dict.
+    """
+    meta = read_meta(frame_dir)
+    names = meta["columns"] if columns is None else [c for c in columns if c in meta["columns"]]
+    return {name: np.load(os.path.join(frame_dir, name + ".npy"), mmap_mode="r") for name in names}
+
+
+def convert_frame(infile, frame_dir, previous_source=None):
+    """
+    Write every column of one VTU file to frame_dir. Returns the frame's meta
+    dict. Skips the conversion if the source is unchanged since the last one.
+    """
+    source = file_fingerprint(infile, previous_source)
+    if previous_source is not None and source["sha256"] == previous_source["sha256"]:
+        return read_meta(frame_dir)
+
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(infile)
+    reader.Update()
+    data = reader.GetOutput()
+
+    columns = {"points": numpy_support.vtk_to_numpy(data.GetPoints().GetData())}
+    point_data = data.GetPointData()
+    for i in range(point_data.GetNumberOfArrays()):
+        arr = point_data.GetArray(i)
+        if arr is not None and arr.GetName():
+            columns[arr.GetName()] = numpy_support.vtk_to_numpy(arr)
+
+    os.makedirs(frame_dir, exist_ok=True)
+    meta = {"source": source, "num_points": data.GetNumberOfPoints(), "columns": {}}
+    for name, arr in columns.items():
+        np.save(os.path.join(frame_dir, name + ".npy"), np.ascontiguousarray(arr))
+        meta["columns"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape)}
+    # meta.json is written last; a frame without it is treated as not converted.
+    with open(os.path.join(frame_dir, META_NAME), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def convert_run(input_folder, cache_folder, workers=1):
+    input_files = sorted(glob.glob(os.path.join(input_folder, "*.vtu")))
+    if not input_files:
+        print("No VTU files found in input folder.")
+        return []
+    os.makedirs(cache_folder, exist_ok=True)
+
+    names = [os.path.splitext(os.path.basename(f))[0] for f in input_files]
+    frame_paths = [os.path.join(cache_folder, name) for name in names]
+    previous = []
+    for frame_dir in frame_paths:
+        try:
+            previous.append(read_meta(frame_dir)["source"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            previous.append(None)
+
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        for infile, meta in zip(input_files, pool.map(convert_frame, input_files, frame_paths, previous)):
+            print(f"  {os.path.basename(infile)}: {meta['num_points']} points, columns {list(meta['columns'])}")
+
+    with open(os.path.join(cache_folder, INDEX_NAME), "w") as f:
+        json.dump({"version": CACHE_VERSION, "frames": names}, f)
+    return frame_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a folder of VTU frames to a memory-mappable columnar cache.")
+    parser.add_argument("input_folder", help="Folder of run_n.vtu files")
+    parser.add_argument("cache_folder", help="Folder for the cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"Caching '{args.input_folder}' into '{args.cache_folder}'")
+    convert_run(args.input_folder, args.cache_folder, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Pack a run (a folder of run_n.vtu files) into one temporal VTKHDF file.
+
+All timesteps are appended to the same chunked datasets (points, cells,
+point arrays) and the /VTKHDF/Steps group records where each step starts,
+so VTK's and ParaView's VTKHDF readers switch timesteps by seeking in one
+open file instead of opening and parsing a new XML file.
+
+    python utils/vtu_to_vtkhdf.py data/run01 data/run01.vtkhdf
+    python utils/vtu_to_vtkhdf.py data/run01_DBSCAN data/run01_DBSCAN.vtkhdf --compression gzip
+
+The viewer picks up data/<run>.vtkhdf in place of data/<run>/ on its own.
+
+Step times are the file positions (0, 1, 2, ...), which is what the state
+files see from the .vtu series (TimeArray None); --time-array reads them
+from a field data array instead. The source file names are kept in
+/SourceFiles (outside the VTKHDF group) so the viewer can check that a state
+file refers to the same series.
+"""
+import argparse
+import glob
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+VTKHDF_VERSION = (2, 0)
+SOURCE_FILES = "SourceFiles"
+
+
+def cell_types(grid):
+    # GetCellTypes() replaced GetCellTypesArray() in VTK 9.6, older builds only have the latter.
+    try:
+        return grid.GetCellTypes()
+    except TypeError:
+        return grid.GetCellTypesArray()
+
+
+def read_frame(path, time_array=None):
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(path)
+    reader.Update()
+    data = reader.GetOutput()
+    cells = data.GetCells()
+    frame = {
+        "points": numpy_support.vtk_to_numpy(data.GetPoints().GetData()),
+        "types": numpy_support.vtk_to_numpy(cell_types(data)).astype(np.uint8),
+        "offsets": numpy_support.vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64),
+        "connectivity": numpy_support.vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64),
+        "point_data": {},
+        "time": None,
+    }
+    point_data = data.GetPointData()
+    for i in range(point_data.GetNumberOfArrays()):
+        arr = point_data.GetArray(i)
+        if arr is not None and arr.GetName():
+            frame["point_data"][arr.GetName()] = numpy_support.vtk_to_numpy(arr)
+    if time_array:
+        arr = data.GetFieldData().GetArray(time_array)
+        if arr is not None and arr.GetNumberOfTuples():
+            frame["time"] = float(arr.GetTuple1(0))
+    return frame
+
+
+def iter_frames(files, time_array=None, workers=2, read_ahead=4):
+    """Frames in order, parsed on a thread pool a few files ahead of the writer."""
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pending = deque()
+        paths = iter(files)
+        for path in paths:
+            pending.append(pool.submit(read_frame, path, time_array))
+            if len(pending) >= read_ahead:
+                break
+        while pending:
+            future = pending.popleft()
+            path = next(paths, None)
+            if path is not None:
+                pending.append(pool.submit(read_frame, path, time_array))
+            yield future.result()
+
+
+class Appender:
+    """Resizable, chunked 1-D/2-D datasets written by appending rows."""
+
+    def __init__(self, group, chunk_rows, compression, level):
+        self.group = group
+        self.options = {"compression": compression, "compression_opts": level} if compression else {}
+        self.chunk_rows = chunk_rows
+
+    def append(self, name, values):
+        values = np.ascontiguousarray(values)
+        if name not in self.group:
+            self.group.create_dataset(name, shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                                      dtype=values.dtype, chunks=(self.chunk_rows,) + values.shape[1:],
+                                      **self.options)
+        dataset = self.group[name]
+        start = dataset.shape[0]
+        dataset.resize(start + len(values), axis=0)
+        if len(values):
+            dataset[start:] = values
+
+
+def convert_run(input_folder, output_file, time_array=None, chunk_rows=65536, compression=None, level=4,
+                workers=2):
+    files = sorted(glob.glob(os.path.join(input_folder, "*.vtu")))
+    if not files:
+        print("No VTU files found in input folder.")
+        return None
+
+    # Written next to the target and renamed at the end, so a reader never sees half a file.
+    tmp_file = output_file + ".tmp"
+    with h5py.File(tmp_file, "w") as h5:
+        root = h5.create_group("VTKHDF")
+        root.attrs["Version"] = np.array(VTKHDF_VERSION, dtype=np.int64)
+        root.attrs.create("Type", np.bytes_("UnstructuredGrid"),
+                          dtype=h5py.string_dtype("ascii", len("UnstructuredGrid")))
+        steps = root.create_group("Steps")
+        data = Appender(root, chunk_rows, compression, level)
+        point_data = Appender(root.create_group("PointData"), chunk_rows, compression, level)
+        root.create_group("CellData")
+        root.create_group("FieldData")
+        meta = Appender(root, 1024, None, None)   # small per-step arrays
+
+        point_offset = cell_offset = connectivity_offset = 0
+        times, point_offsets, cell_offsets, connectivity_offsets = [], [], [], []
+        arrays = None
+        for index, (path, frame) in enumerate(zip(files, iter_frames(files, time_array, workers))):
+            n_points = len(frame["points"])
+            n_cells = len(frame["types"])
+            n_connectivity = len(frame["connectivity"])
+            if arrays is None:
+                arrays = sorted(frame["point_data"])
+            elif sorted(frame["point_data"]) != arrays:
+                raise ValueError(f"{os.path.basename(path)} has point arrays {sorted(frame['point_data'])}, "
+                                 f"the first frame has {arrays}")
+
+            meta.append("NumberOfPoints", [n_points])
+            meta.append("NumberOfCells", [n_cells])
+            meta.append("NumberOfConnectivityIds", [n_connectivity])
+            data.append("Points", frame["points"])
+            data.append("Types", frame["types"])
+            # One more offset than cells per step; they restart at 0 for every step.
+            data.append("Offsets", frame["offsets"] if len(frame["offsets"]) else np.zeros(1, np.int64))
+            data.append("Connectivity", frame["connectivity"])
+            for name in arrays:
+                point_data.append(name, frame["point_data"][name])
+
+            times.append(frame["time"] if frame["time"] is not None else float(index))
+            point_offsets.append(point_offset)
+            cell_offsets.append(cell_offset)
+            connectivity_offsets.append(connectivity_offset)
+            point_offset += n_points
+            cell_offset += n_cells
+            connectivity_offset += n_connectivity
+            print(f"  {os.path.basename(path)}: {n_points} points, {n_cells} cells, t = {times[-1]:g}")
+
+        n_steps = len(times)
+        steps.attrs["NSteps"] = n_steps
+        steps.create_dataset("Values", data=np.array(times, dtype=np.float64))
+        steps.create_dataset("PartOffsets", data=np.arange(n_steps, dtype=np.int64))
+        steps.create_dataset("NumberOfParts", data=np.ones(n_steps, dtype=np.int64))
+        steps.create_dataset("PointOffsets", data=np.array(point_offsets, dtype=np.int64))
+        steps.create_dataset("CellOffsets", data=np.array(cell_offsets, dtype=np.int64).reshape(-1, 1))
+        steps.create_dataset("ConnectivityIdOffsets",
+                             data=np.array(connectivity_offsets, dtype=np.int64).reshape(-1, 1))
+        offsets = steps.create_group("PointDataOffsets")
+        for name in arrays:
+            offsets.create_dataset(name, data=np.array(point_offsets, dtype=np.int64))
+        steps.create_group("CellDataOffsets")
+        steps.create_group("FieldDataOffsets")
+
+        h5.create_dataset(SOURCE_FILES, data=np.array([os.path.basename(f) for f in files], dtype=h5py.string_dtype()))
+    os.replace(tmp_file, output_file)
+    return output_file
+
+
+def source_files(path):
+    """Names of the .vtu files a converted run was made from (None if unknown)."""
+    with h5py.File(path, "r") as h5:
+        if SOURCE_FILES not in h5:
+            return None
+        return [name.decode() if isinstance(name, bytes) else name for name in h5[SOURCE_FILES][()]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a folder of run_n.vtu files into one temporal VTKHDF file.")
+    parser.add_argument("input_folder", help="Folder of run_n.vtu files")
+    parser.add_argument("output_file", nargs="?", help="Output file (default: <input_folder>.vtkhdf)")
+    parser.add_argument("--time-array", help="Field data array holding each file's time (default: file position)")
+    parser.add_argument("--compression", choices=["gzip"], help="HDF5 compression of the big datasets (default: none)")
+    parser.add_argument("--level", type=int, default=4, help="gzip level")
+    parser.add_argument("--chunk-rows", type=int, default=65536, help="Rows per HDF5 chunk")
+    parser.add_argument("--workers", type=int, default=2, help="Threads parsing .vtu files ahead of the writer")
+    args = parser.parse_args()
+
+    output_file = args.output_file or os.path.normpath(args.input_folder) + ".vtkhdf"
+    print(f"Packing '{args.input_folder}' into '{output_file}'")
+    if convert_run(args.input_folder, output_file, args.time_array, args.chunk_rows, args.compression,
+                   args.level, args.workers):
+        print(f"Done: {os.path.getsize(output_file) / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()